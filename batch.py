@@ -0,0 +1,32 @@
+import argparse
+import logging
+
+from iiif_archive import batch
+from iiif_archive.config import Config, load_config
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    default = Config()
+
+    parser = argparse.ArgumentParser(description="Download many Manifests, storing each in its own zip file")
+    parser.add_argument("manifests", help="File with a manifest URL and optionally the name of its zip file on each line")
+    parser.add_argument("--output-dir", type=str, default="downloads", help="Directory for the zip files. Default: downloads")
+    parser.add_argument("--conf", type=str, default="conf/config.ini", help="Config file. Default: conf/config.ini")
+    parser.add_argument("--jobs", type=int, help=f"Manifests to archive at once. Default: {default.batch_jobs}")
+    parser.add_argument("--stream", action="store_true", help="Write downloads straight into the zip files rather than the scratch directory.")
+    parser.add_argument("--report", type=str, help="Where to write the JSON report. Default: report.json in the output directory")
+
+    args = parser.parse_args()
+
+    params = {}
+    if args.jobs:
+        params["batch_jobs"] = args.jobs
+
+    config = load_config(args.conf, params)
+
+    results = batch.runBatch(batch.readJobs(args.manifests), args.output_dir, config.scratch_dir, config.batch_jobs, args.stream)
+    report = args.report or f"{args.output_dir}/report.json"
+    summary = batch.writeReport(results, report)
+
+    print(f"{summary['ok']} archived, {summary['skipped']} already done, {summary['failed']} failed. Report: {report}")
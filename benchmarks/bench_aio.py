@@ -0,0 +1,50 @@
+"""Compare the threads and asyncio download engines against a local IIIF server with injected latency.
+
+Each engine runs in its own process so the peak memory is its own.
+
+Usage: python -m benchmarks.bench_aio [--images 20] [--latency 0.05] [--concurrency 64]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mockserver import MockIIIFServer
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+
+
+def runEngine(engine, url, scratch, concurrency):
+    load_config(None, {"engine": engine, "delay": 0, "retry_delay": 0, "workers": concurrency, "per_host": concurrency,
+                       "pool_size": concurrency, "async_requests": concurrency, "scratch_dir": scratch})
+    start = time.perf_counter()
+    download(url, f"{scratch}/{engine}.zip", scratch)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    print(json.dumps({"seconds": elapsed, "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the download engines")
+    parser.add_argument("--images", type=int, default=20, help="Images in the manifest, each 21 tiles")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the server waits before each response")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests each engine may have in flight to the server")
+    parser.add_argument("--run", nargs=3, metavar=("ENGINE", "URL", "SCRATCH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        runEngine(*args.run, args.concurrency)
+        sys.exit()
+
+    with MockIIIFServer(canvases=args.images, latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.images} images, {args.latency * 1000:.0f}ms latency, {args.concurrency} requests at once")
+        results = {}
+        for engine in ("threads", "asyncio"):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_aio", "--concurrency", str(args.concurrency),
+                                     "--run", engine, f"{server.url}/manifest.json", tmp], check=True, capture_output=True, text=True).stdout
+            results[engine] = json.loads(output.splitlines()[-1])
+            print(f"{engine:<8} {results[engine]['seconds']:8.2f}s {results[engine]['maxrss'] / 1e6:8.1f} MB peak")
+        print(f"Speed up: {results['threads']['seconds'] / results['asyncio']['seconds']:.1f}x")
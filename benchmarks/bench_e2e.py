@@ -0,0 +1,164 @@
+"""Archive synthetic manifests from a local IIIF server with deflate and then inflate them, end to end.
+
+For each manifest size the server in benchmarks/mockserver.py is started with the chosen version, level,
+latency, bandwidth and faults, and deflate and inflate each run in their own process so their peak
+memory and disk I/O are their own. Results are written as JSON so runs can be compared between versions:
+
+    python -m benchmarks.bench_e2e --canvases 1,10,100 --output before.json
+    python -m benchmarks.bench_e2e --canvases 1,10,100 --output after.json --compare before.json
+
+With --compare the exit status is 1 if any step is more than --threshold slower than the baseline.
+
+Usage: python -m benchmarks.bench_e2e [--canvases 1,10,100] [--version 3] [--level 2] [--latency 0.05] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+
+from benchmarks.mockserver import addServerArguments, serverFromArguments
+from iiif_archive.config import load_config
+from iiif_archive.decompressor import inflate
+from iiif_archive.downloader import download
+from iiif_archive.session import create_session
+
+
+def diskIO():
+    """Bytes this process has read from and written to disk, None where /proc/self/io isn't available."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["read_bytes"]), int(counters["write_bytes"])
+    except OSError:
+        return None, None
+
+
+def measure(fn):
+    start = time.perf_counter()
+    files = fn()
+    seconds = time.perf_counter() - start
+    readBytes, writeBytes = diskIO()
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"seconds": seconds, "files": files, "files_per_second": files / seconds if seconds else 0,
+            "maxrss": maxrss, "read_bytes": readBytes, "write_bytes": writeBytes}
+
+
+def runDeflate(job):
+    config = load_config(None, job["config"])
+
+    def deflate():
+        with create_session(config) as session:
+            download(job["url"], job["zip"], job["scratch"], session=session)
+        return session.metrics.snapshot()["files"]
+
+    result = measure(deflate)
+    result["zip_bytes"] = os.path.getsize(job["zip"])
+    return result
+
+
+def runInflate(job):
+    def extract():
+        inflate(job["zip"], job["output"], "http://localhost:8000")
+        with zipfile.ZipFile(job["zip"]) as zf:
+            return len(zf.infolist())
+
+    return measure(extract)
+
+
+def runStep(step, job):
+    """Run one step of the benchmark in a new process and return what it measured."""
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_e2e", "--run", step, json.dumps(job)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    config = {"engine": args.engine, "delay": args.delay, "retry_delay": args.retry_after, "workers": args.workers, "per_host": args.workers,
+              "pool_size": args.workers, "level0_workers": args.workers, "level0_per_host": args.workers}
+    runs = []
+    for canvases in args.canvases:
+        with serverFromArguments(args, canvases) as server, tempfile.TemporaryDirectory() as tmp:
+            job = {"url": f"{server.url}/manifest.json", "zip": os.path.join(tmp, "manifest.zip"), "scratch": os.path.join(tmp, "scratch"),
+                   "output": os.path.join(tmp, "inflated"), "config": config}
+            deflated = runStep("deflate", job)
+            deflated["server"] = {str(status): count for status, count in sorted(server.stats.items())}
+            inflated = runStep("inflate", job)
+
+        for step, result in (("deflate", deflated), ("inflate", inflated)):
+            runs.append({"canvases": canvases, "step": step, **result})
+            print(f"{canvases:>6} canvases {step:<8} {result['seconds']:8.2f}s {result['files_per_second']:9.0f} files/s {result['maxrss'] / 1e6:7.1f} MB peak")
+    return runs
+
+
+def compare(runs, baseline, threshold):
+    """Print how runs differ from baseline and return whether any step got more than threshold slower."""
+    before = {(run["canvases"], run["step"]): run for run in baseline["runs"]}
+    regressed = False
+    for run in runs:
+        old = before.get((run["canvases"], run["step"]))
+        if old is None:
+            continue
+        change = run["seconds"] / old["seconds"] - 1
+        memory = run["maxrss"] / old["maxrss"] - 1
+        slower = change > threshold
+        regressed = regressed or slower
+        print(f"{run['canvases']:>6} canvases {run['step']:<8} time {change:+7.1%} memory {memory:+7.1%}{'  REGRESSION' if slower else ''}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--canvases", type=lambda value: [int(count) for count in value.split(",")], default=[1, 10, 100],
+                        help="Comma separated manifest sizes to benchmark, up to 10000 canvases")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads", help="Download engine deflate uses")
+    parser.add_argument("--workers", type=int, default=16, help="Download workers, and requests at once to the server")
+    parser.add_argument("--delay", type=float, default=0, help="The delay config, seconds between requests to the server")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="Results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Share slower than the baseline that counts as a regression. Default: 0.2")
+    parser.add_argument("--run", nargs=2, metavar=("STEP", "JOB"), help=argparse.SUPPRESS)
+    addServerArguments(parser)
+    args = parser.parse_args()
+
+    if args.run:
+        step, job = args.run
+        print(json.dumps((runDeflate if step == "deflate" else runInflate)(json.loads(job))))
+        sys.exit()
+
+    options = {name: value for name, value in vars(args).items() if name not in ("output", "compare", "threshold", "run")}
+    results = {
+        "benchmark": "e2e",
+        "commit": commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": options,
+        "runs": benchmark(args)
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["options"] != options:
+            print("The baseline was run with different options so the comparison may not be fair")
+        sys.exit(1 if compare(results["runs"], baseline, args.threshold) else 0)
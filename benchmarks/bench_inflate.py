@@ -0,0 +1,78 @@
+"""Compare inflate() against extracting everything on one thread and then rewriting the JSON.
+
+Usage: python -m benchmarks.bench_inflate [--tiles 100000] [--tile-size 4000] [--images 200]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from iiif_archive.decompressor import inflate
+from iiif_archive.processors import infoJson_factory, manifest_factory
+
+
+def legacyInflate(zip_file, local_dir, base_url):
+    name = os.path.basename(zip_file).replace(".zip", "")
+    baseDir = os.path.join(local_dir, name)
+    base_url = base_url + "/" + name
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        zip_ref.extractall(baseDir)
+
+    with open(os.path.join(baseDir, "manifest.json"), "r") as f:
+        manifest = manifest_factory(json.load(f))
+    manifest.id = f"{base_url}/manifest.json"
+    for container in manifest.containers():
+        container.url = f"{base_url}/{container.url}"
+    manifest.save(os.path.join(baseDir, "manifest.json"))
+
+    for subdir in Path(baseDir).iterdir():
+        if subdir.is_dir():
+            with open(os.path.join(subdir, "info.json"), "r") as f:
+                infoJson = infoJson_factory(json.load(f))
+            infoJson.id = f"{base_url}/{subdir.name}"
+            infoJson.save(os.path.join(subdir, "info.json"))
+
+
+def buildArchive(zip_filename, tiles, tileSize, images):
+    """Tiles are random bytes and stored, as JPEG tiles are in a real archive."""
+    canvases = []
+    with zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(images):
+            info = {"@context": "http://iiif.io/api/image/3/context.json", "id": f"https://example.org/iiif/image{i}", "type": "ImageService3", "profile": "level0", "width": 4032, "height": 3024}
+            zf.writestr(f"image{i}/info.json", json.dumps(info, indent=4))
+            canvases.append({"id": f"https://example.org/canvas/{i}", "type": "Canvas", "items": [{"type": "AnnotationPage", "items": [{"type": "Annotation", "body": {"id": f"https://example.org/iiif/image{i}/full/max/0/default.jpg", "type": "Image", "service": [{"id": f"image{i}", "type": "ImageService3"}]}}]}]})
+
+        for i in range(tiles):
+            zf.writestr(zipfile.ZipInfo(f"image{i % images}/{i},0,512,512/512,512/0/default.jpg"), os.urandom(tileSize), zipfile.ZIP_STORED)
+
+        manifest = {"@context": "http://iiif.io/api/presentation/3/context.json", "id": "https://example.org/manifest.json", "type": "Manifest", "items": canvases}
+        zf.writestr("manifest.json", json.dumps(manifest, indent=4))
+
+
+def timeIt(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.2f}s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark inflating a large archive")
+    parser.add_argument("--tiles", type=int, default=100000, help="Number of tile entries")
+    parser.add_argument("--tile-size", type=int, default=4000, help="Bytes per tile")
+    parser.add_argument("--images", type=int, default=200, help="Number of images (info.json entries)")
+    parser.add_argument("--workers", type=int, default=None, help="Threads used by inflate(). Default: one per CPU")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zipFile = os.path.join(tmp, "archive.zip")
+        buildArchive(zipFile, args.tiles, args.tile_size, args.images)
+        print(f"{args.tiles + args.images + 1} entries, {os.path.getsize(zipFile) / 1024 / 1024:.1f} MB")
+
+        legacy = timeIt("legacy", lambda: legacyInflate(zipFile, os.path.join(tmp, "legacy"), "https://example.org"))
+        current = timeIt("inflate()", lambda: inflate(zipFile, os.path.join(tmp, "current"), "https://example.org", args.workers))
+        print(f"Speed up: {legacy / current:.1f}x")
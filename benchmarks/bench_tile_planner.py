@@ -0,0 +1,55 @@
+"""Time and memory of planning the tile requests for a very large image.
+
+Usage: python -m benchmarks.bench_tile_planner [--size 100000] [--tile 256]
+"""
+import argparse
+import math
+import time
+import tracemalloc
+
+from iiif_archive.processors import infoJson_factory
+
+
+def legacyTileUrls(infoJson):
+    """The list based planner tileUrls() used before it was made lazy."""
+    tiles = infoJson.data["tiles"][0]
+    tileWidth = tiles["width"]
+    tileHeight = tiles.get("height", tileWidth)
+    urls = []
+    for scaleFactor in tiles["scaleFactors"]:
+        urls += infoJson.scaleTiles(scaleFactor, tileWidth, tileHeight)
+
+    return urls
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed:8.2f}s {peak / 1024 / 1024:10.1f} MB peak {result:>12,} requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tile request planner")
+    parser.add_argument("--size", type=int, default=100000, help="Width and height of the image")
+    parser.add_argument("--tile", type=int, default=256, help="Tile width and height")
+    args = parser.parse_args()
+
+    levels = math.ceil(math.log2(args.size / args.tile)) + 1
+    infoJson = infoJson_factory({
+        "@context": "http://iiif.io/api/image/3/context.json",
+        "id": "https://example.org/iiif/gigapixel",
+        "type": "ImageService3",
+        "profile": "level1",
+        "width": args.size,
+        "height": args.size,
+        "tiles": [{"width": args.tile, "height": args.tile, "scaleFactors": [2 ** i for i in range(levels)]}]
+    })
+
+    print(f"{args.size}x{args.size} image, {args.tile}px tiles, {levels} scale factors")
+    measure("legacy list", lambda: len(legacyTileUrls(infoJson)))
+    measure("tileCount()", infoJson.tileCount)
+    measure("iterate iterTileUrls()", lambda: sum(1 for _ in infoJson.iterTileUrls()))
@@ -0,0 +1,61 @@
+"""CPU time per GB of saving large downloads with saveResponse() against 8 KB iter_content chunks.
+
+Files are downloaded from the local server in benchmarks/mockserver.py. The CPU time is that of the
+downloading thread alone, so the server running in the same process isn't counted.
+
+Usage: python -m benchmarks.bench_write [--size 256] [--files 4]
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import requests
+
+from benchmarks.mockserver import MockIIIFServer
+from iiif_archive.downloader import saveResponse
+
+
+def legacySave(response, filename):
+    checksum = hashlib.sha256()
+    size = 0
+    with open(filename, "wb") as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:  # filter out keep-alive chunks
+                f.write(chunk)
+                checksum.update(chunk)
+                size += len(chunk)
+    return size, checksum.hexdigest()
+
+
+def run(label, save, url, files, directory):
+    with requests.Session() as session:
+        cpu = time.thread_time()
+        wall = time.perf_counter()
+        total = 0
+        for i in range(files):
+            filename = os.path.join(directory, f"{label}-{i}.mp4")
+            with session.get(url, stream=True) as response:
+                total += save(response, filename)[0]
+            os.remove(filename)
+        cpu = time.thread_time() - cpu
+        wall = time.perf_counter() - wall
+
+    gb = total / 1e9
+    print(f"{label:<16} {cpu / gb:6.2f} CPU s/GB {gb / wall:6.2f} GB/s")
+    return cpu / gb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark writing large downloads")
+    parser.add_argument("--size", type=int, default=256, help="MB in each file")
+    parser.add_argument("--files", type=int, default=4, help="Files downloaded with each method")
+    args = parser.parse_args()
+
+    with MockIIIFServer(latency=0) as server, tempfile.TemporaryDirectory() as tmp:
+        url = f"{server.url}/files/{args.size * 1024 * 1024}"
+        print(f"{args.files} files of {args.size} MB")
+        legacy = run("iter_content", legacySave, url, args.files, tmp)
+        current = run("saveResponse()", saveResponse, url, args.files, tmp)
+        print(f"CPU saving: {1 - current / legacy:.0%}")
@@ -0,0 +1,62 @@
+"""Compare building an archive with zip() against the old deflate-everything approach.
+
+Usage: python -m benchmarks.bench_zip [--tiles 5000] [--tile-size 40000] [--json 200]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+from iiif_archive.archive import zipDirectory
+
+
+def legacyZip(source_dir, zip_filename):
+    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, dirs, files in os.walk(source_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(file_path, os.path.relpath(file_path, start=source_dir))
+
+
+def buildTree(source_dir, tiles, tileSize, jsonFiles):
+    """Tiles are random bytes as that compresses about as badly as JPEG does."""
+    for i in range(jsonFiles):
+        imageDir = os.path.join(source_dir, f"image{i}")
+        os.makedirs(imageDir)
+        info = {"id": f"https://example.org/iiif/image{i}", "width": 4032, "height": 3024, "tiles": [{"width": 512, "scaleFactors": [1, 2, 4, 8]}], "sizes": [{"width": w, "height": w} for w in range(100, 2000, 50)]}
+        with open(os.path.join(imageDir, "info.json"), "w") as f:
+            json.dump(info, f, indent=4)
+
+    for i in range(tiles):
+        tileDir = os.path.join(source_dir, f"image{i % max(jsonFiles, 1)}", f"{i},0,512,512", "512,512", "0")
+        os.makedirs(tileDir, exist_ok=True)
+        with open(os.path.join(tileDir, "default.jpg"), "wb") as f:
+            f.write(os.urandom(tileSize))
+
+
+def timeIt(label, fn, source_dir, zip_filename):
+    start = time.perf_counter()
+    fn(source_dir, zip_filename)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.2f}s {os.path.getsize(zip_filename) / 1024 / 1024:10.2f} MB")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark archive build time and size")
+    parser.add_argument("--tiles", type=int, default=5000, help="Number of tile files")
+    parser.add_argument("--tile-size", type=int, default=40000, help="Bytes per tile")
+    parser.add_argument("--json", type=int, default=200, help="Number of info.json files")
+    parser.add_argument("--level", type=int, default=6, help="Compression level for zip()")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source")
+        buildTree(source, args.tiles, args.tile_size, args.json)
+
+        print(f"{'':<10} {'time':>9} {'size':>13}")
+        legacy = timeIt("legacy", legacyZip, source, os.path.join(tmp, "legacy.zip"))
+        current = timeIt("zip()", lambda s, z: zipDirectory(s, z, args.level), source, os.path.join(tmp, "current.zip"))
+        print(f"Speed up: {legacy / current:.1f}x")
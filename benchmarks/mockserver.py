@@ -0,0 +1,230 @@
+"""A local stand-in for a IIIF server, so downloads can be benchmarked without touching a real one.
+
+It serves a version 2 or 3 manifest of canvases, each with its own level 0 or level 2 image service,
+their info.json files and tiles of random bytes, and files of any size at /files/<bytes>. Before each
+response it waits latency seconds, as a distant server would, and it sends no faster than bandwidth
+bytes a second. A share of tile requests (error_rate) fail with a 500 and another share (busy_rate)
+get a 503 with a Retry-After.
+
+Usage: python -m benchmarks.mockserver [--canvases 20] [--version 3] [--level 2] [--latency 0.05] [--port 8000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IMAGE = re.compile(r"^/iiif/(image\d+)/(.+)$")
+# /files/<bytes> is a file of that many bytes, for large downloads like audio and video
+FILE = re.compile(r"^/files/(\d+)$")
+TILE_SIZE = 512
+# Bytes written between the pauses that limit the bandwidth
+WRITE_SIZE = 64 * 1024
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, as real image servers do
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        match = IMAGE.match(self.path)
+        file = FILE.match(self.path)
+        if file:
+            self.sendFile(int(file.group(1)))
+        elif self.path == "/manifest.json":
+            self.send(json.dumps(server.manifest()).encode("utf-8"), "application/json")
+        elif match and match.group(2) == "info.json":
+            self.send(json.dumps(server.infoJson(match.group(1))).encode("utf-8"), "application/json")
+        elif match:
+            fault = server.fault()
+            if fault is None:
+                self.send(server.tile, "image/jpeg")
+            else:
+                self.sendStatus(fault)
+        else:
+            self.sendStatus(404)
+
+    def send(self, body: bytes, contentType: str):
+        self.server.count(200)
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not self.server.bandwidth:
+            self.wfile.write(body)
+            return
+
+        for start in range(0, len(body), WRITE_SIZE):
+            chunk = body[start:start + WRITE_SIZE]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / self.server.bandwidth)
+
+    def sendFile(self, size: int):
+        """Send size bytes, repeating a block of random bytes so a file of any size costs no memory."""
+        self.server.count(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        block = self.server.block
+        for start in range(0, size, len(block)):
+            self.wfile.write(block[:size - start])
+            if self.server.bandwidth:
+                time.sleep(min(len(block), size - start) / self.server.bandwidth)
+
+    def sendStatus(self, status: int):
+        self.server.count(status)
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", str(self.server.retryAfter))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockIIIFServer(ThreadingHTTPServer):
+    """Serves a manifest of canvases, each a width x height IIIF image cut into 512 pixel tiles of tileSize bytes.
+
+    stats counts the responses by status. The faults are random but repeat from one run to the next with the same seed.
+    """
+
+    daemon_threads = True
+    # Lots of clients connect at once when benchmarking high concurrency
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, canvases: int = 20, latency: float = 0.05, tileSize: int = 4000, width: int = 2048, height: int = 2048,
+                 version: int = 3, level: int = 2, bandwidth: float = 0, errorRate: float = 0, busyRate: float = 0, retryAfter: int = 1, seed: int = 0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.canvases = canvases
+        self.latency = latency
+        self.tile = os.urandom(tileSize)
+        self.block = os.urandom(WRITE_SIZE)
+        self.width = width
+        self.height = height
+        self.version = version
+        self.level = level
+        self.bandwidth = bandwidth
+        self.errorRate = errorRate
+        self.busyRate = busyRate
+        self.retryAfter = retryAfter
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, status: int):
+        with self._lock:
+            self.stats[status] += 1
+
+    def fault(self):
+        """The status to fail a tile request with, or None to serve it."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.errorRate:
+            return 500
+        elif roll < self.errorRate + self.busyRate:
+            return 503
+        return None
+
+    def scaleFactors(self):
+        factors = [1]
+        while max(self.width, self.height) / factors[-1] > TILE_SIZE:
+            factors.append(factors[-1] * 2)
+        return factors
+
+    def manifest(self):
+        if self.version == 2:
+            return self.manifest2()
+
+        canvases = []
+        for i in range(self.canvases):
+            service = f"{self.url}/iiif/image{i}"
+            canvases.append({"id": f"{self.url}/canvas/{i}", "type": "Canvas", "width": self.width, "height": self.height, "items": [{
+                "id": f"{self.url}/canvas/{i}/page", "type": "AnnotationPage", "items": [{
+                    "id": f"{self.url}/canvas/{i}/annotation", "type": "Annotation", "motivation": "painting", "target": f"{self.url}/canvas/{i}",
+                    "body": {"id": f"{service}/full/max/0/default.jpg", "type": "Image", "format": "image/jpeg",
+                             "service": [{"id": service, "type": "ImageService3", "profile": f"level{self.level}"}]}
+                }]
+            }]})
+        return {"@context": "http://iiif.io/api/presentation/3/context.json", "id": f"{self.url}/manifest.json", "type": "Manifest",
+                "label": {"en": ["Benchmark"]}, "items": canvases}
+
+    def manifest2(self):
+        canvases = []
+        for i in range(self.canvases):
+            service = f"{self.url}/iiif/image{i}"
+            canvases.append({"@id": f"{self.url}/canvas/{i}", "@type": "sc:Canvas", "label": str(i), "width": self.width, "height": self.height, "images": [{
+                "@type": "oa:Annotation", "motivation": "sc:painting", "on": f"{self.url}/canvas/{i}",
+                "resource": {"@id": f"{service}/full/full/0/default.jpg", "@type": "dctypes:Image", "format": "image/jpeg",
+                             "service": {"@context": "http://iiif.io/api/image/2/context.json", "@id": service,
+                                         "profile": f"http://iiif.io/api/image/2/level{self.level}.json"}}
+            }]})
+        return {"@context": "http://iiif.io/api/presentation/2/context.json", "@id": f"{self.url}/manifest.json", "@type": "sc:Manifest",
+                "label": "Benchmark", "sequences": [{"@type": "sc:Sequence", "canvases": canvases}]}
+
+    def infoJson(self, name: str):
+        tiles = [{"width": TILE_SIZE, "scaleFactors": self.scaleFactors()}]
+        # A level 0 server can only give the sizes it lists
+        sizes = [{"width": self.width // factor, "height": self.height // factor} for factor in self.scaleFactors()[-2:]]
+        service = f"{self.url}/iiif/{name}"
+        if self.version == 2:
+            return {"@context": "http://iiif.io/api/image/2/context.json", "@id": service, "protocol": "http://iiif.io/api/image",
+                    "profile": [f"http://iiif.io/api/image/2/level{self.level}.json"], "width": self.width, "height": self.height, "tiles": tiles, "sizes": sizes}
+        return {"@context": "http://iiif.io/api/image/3/context.json", "id": service, "type": "ImageService3", "protocol": "http://iiif.io/api/image",
+                "profile": f"level{self.level}", "width": self.width, "height": self.height, "tiles": tiles, "sizes": sizes}
+
+    def start(self) -> "MockIIIFServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-iiif-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+
+def addServerArguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--version", type=int, choices=[2, 3], default=3, help="IIIF version of the manifest and info.json files")
+    parser.add_argument("--level", type=int, choices=[0, 2], default=2, help="Image API compliance level of the image services")
+    parser.add_argument("--width", type=int, default=2048, help="Width of each image in pixels")
+    parser.add_argument("--height", type=int, default=2048, help="Height of each image in pixels")
+    parser.add_argument("--tile-size", type=int, default=4000, help="Bytes in each tile")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds to wait before each response")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Most bytes a second sent in each response, 0 for no limit")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of tile requests that fail with a 500")
+    parser.add_argument("--busy-rate", type=float, default=0, help="Share of tile requests that get a 503 with a Retry-After")
+    parser.add_argument("--retry-after", type=int, default=1, help="Seconds sent in the Retry-After of a 503")
+
+
+def serverFromArguments(args, canvases: int, port: int = 0) -> MockIIIFServer:
+    return MockIIIFServer(port, canvases, args.latency, args.tile_size, args.width, args.height, args.version, args.level,
+                          args.bandwidth, args.error_rate, args.busy_rate, args.retry_after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--canvases", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8000)
+    addServerArguments(parser)
+    args = parser.parse_args()
+
+    server = serverFromArguments(args, args.canvases, args.port)
+    print(f"Serving {server.url}/manifest.json")
+    server.serve_forever()
@@ -1,8 +1,10 @@
 import argparse
 import logging
 
-from iiif_archive import downloader
+from iiif_archive import downloader, planner
 from iiif_archive.config import Config, load_config
+from iiif_archive.session import create_session
+from iiif_archive.tracing import tracing
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -10,25 +12,46 @@ if __name__ == "__main__":
     default = Config()
 
     parser = argparse.ArgumentParser(description="Download a Manifest and store the results in a zip file")
-    parser.add_argument("manifest", help="https URL to the manifest")
+    parser.add_argument("manifest", help="https URL to the manifest or collection")
     parser.add_argument("--zip-file-name", type=str, default="downloads/manifest.zip", help="Name of the zip file (default: manifest.zip)")
     parser.add_argument("--conf", type=str, default="conf/config.ini", help="Config file. Default: conf/config.ini")
-    parser.add_argument("--delay", type=str, help=f"Delay between image requests in seconds. Use 0 for no delay. Default: {default.delay} second.")
-    parser.add_argument("--retry-delay", type=str, help=f"Delay between image requests after getting a 503 from the first attempt (in seconds). Use 0 for no delay. Default: {default.retry_delay} second.")
+    parser.add_argument("--delay", type=float, help=f"Delay between image requests in seconds. Use 0 for no delay. Default: {default.delay} second.")
+    parser.add_argument("--retry-delay", type=float, help=f"Delay between image requests after getting a 503 from the first attempt (in seconds). Use 0 for no delay. Default: {default.retry_delay} second.")
+    parser.add_argument("--local-pyramid", action="store_true", help="Download each IIIF image once at full size and cut the tiles locally (needs Pillow).")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], help=f"Download with worker threads or with asyncio coroutines (needs aiohttp). Default: {default.engine}.")
+    parser.add_argument("--stream", action="store_true", help="Write downloads straight into the zip file rather than the scratch directory.")
+    parser.add_argument("--update-from", type=str, help="An earlier zip of this manifest. Unchanged files are copied from it rather than downloaded again.")
+    parser.add_argument("--plan", type=str, help="Fetch the manifest and its info.json files, estimate the requests, size and time the download will take and save them to this file without downloading anything.")
+    parser.add_argument("--from-plan", type=str, help="A plan saved by --plan. Its manifest and info.json files are used rather than fetching them again.")
+    parser.add_argument("--trace", type=str, help="Write a trace of where the time goes to this file, for chrome://tracing or Perfetto.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record the peak memory of each stage of the trace (slower).")
 
     args = parser.parse_args()
 
     params = {}
-    if args.delay:
+    if args.delay is not None:
         params["delay"] = args.delay
 
-    if args.retry_delay:
+    if args.retry_delay is not None:
         params["retry_delay"] = args.retry_delay
 
+    if args.local_pyramid:
+        params["local_pyramid"] = True
+
+    if args.engine:
+        params["engine"] = args.engine
+
     print(params)
 
     config = load_config(args.conf, params)
 
-    filename = downloader.download(args.manifest, args.zip_file_name, config.scratch_dir)
+    if args.plan:
+        with create_session(config) as session:
+            plan = planner.plan(args.manifest, args.plan, session)
+        print(plan.summary())
+    else:
+        plan = planner.Plan.load(args.from_plan) if args.from_plan else None
+        with tracing(args.trace, args.trace_memory):
+            filename = downloader.download(args.manifest, args.zip_file_name, config.scratch_dir, stream=args.stream, updateFrom=args.update_from, plan=plan)
 
-    print(f"Created {filename}")
+        print(f"Created {filename}")
@@ -0,0 +1,58 @@
+import argparse
+import logging
+
+from iiif_archive import workqueue
+from iiif_archive.config import load_config
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Archive a Manifest with workers on several machines sharing a queue directory")
+    parser.add_argument("--conf", type=str, default="conf/config.ini", help="Config file. Default: conf/config.ini")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Split a manifest into units of work")
+    enqueue.add_argument("manifest", help="https URL to the manifest")
+    enqueue.add_argument("queue_dir", help="Directory on a filesystem every worker can reach")
+    enqueue.add_argument("--tiles-per-unit", type=int, default=workqueue.TILES_PER_UNIT, help=f"Tiles of an image in each unit of work. Default: {workqueue.TILES_PER_UNIT}")
+
+    work = commands.add_parser("work", help="Download units of work until the queue is done")
+    work.add_argument("queue_dir", help="The queue directory")
+    work.add_argument("--worker", type=str, help="Name of this worker. Default: host name and process id")
+    work.add_argument("--lease", type=float, default=workqueue.LEASE_SECONDS, help=f"Seconds a unit's lease lasts without being renewed, which this worker does every third of it, before another worker may take it. Default: {workqueue.LEASE_SECONDS}")
+    work.add_argument("--no-wait", action="store_true", help="Stop once there are no pending units rather than waiting for the other workers to finish.")
+
+    merge = commands.add_parser("merge", help="Zip the queue directory once every unit is done")
+    merge.add_argument("queue_dir", help="The queue directory")
+    merge.add_argument("--zip-file-name", type=str, default="manifest.zip", help="Name of the zip file (default: manifest.zip)")
+
+    status = commands.add_parser("status", help="Count the units in each state")
+    status.add_argument("queue_dir", help="The queue directory")
+
+    retry = commands.add_parser("retry", help="Put the failed units back in the queue for the workers to try again")
+    retry.add_argument("queue_dir", help="The queue directory")
+
+    skip = commands.add_parser("skip", help="Give up on the failed units so the queue can be merged without them")
+    skip.add_argument("queue_dir", help="The queue directory")
+
+    args = parser.parse_args()
+
+    load_config(args.conf)
+
+    if args.command == "enqueue":
+        count = workqueue.enqueue(args.manifest, args.queue_dir, args.tiles_per_unit)
+        print(f"Queued {count} units of work in {args.queue_dir}")
+    elif args.command == "work":
+        workqueue.work(args.queue_dir, args.worker, args.lease, not args.no_wait)
+    elif args.command == "merge":
+        workqueue.merge(args.queue_dir, args.zip_file_name)
+        print(f"Archive saved to {args.zip_file_name}")
+    elif args.command == "retry":
+        print(f"Put {workqueue.retry(args.queue_dir)} failed units back in the queue")
+    elif args.command == "skip":
+        print(f"Skipped {workqueue.skip(args.queue_dir)} failed units")
+    else:
+        counts = workqueue.status(args.queue_dir)
+        print(", ".join(f"{count} {state}" for state, count in counts.items()))
+        for unit in workqueue.failures(args.queue_dir):
+            print(f"Failed: {unit.kind} {unit.url} {unit.start}-{unit.stop}")
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+from iiif_archive.config import Config, get_config
+
+from .archive import partialName
+from .downloader import dumpJson, isStatic, jsonDigest, localName, writeJson
+from .fixity import Checksums
+from .journal import Journal
+from .metrics import Metrics
+from .processors import infoJson_factory
+from .ratecontrol import BACKOFF_STATUS, parseRetryAfter
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HostLimiter:
+    """Limits the requests to one host: at most concurrency at once, started at least delay seconds apart.
+
+    backoff() stops new requests starting for a while, e.g. after a 503 with a Retry-After.
+    """
+
+    def __init__(self, concurrency: int, delay: float):
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._lock = asyncio.Lock()
+        self._nextStart = 0.0
+        self._blockedUntil = 0.0
+
+    def backoff(self, seconds: float):
+        self._blockedUntil = max(self._blockedUntil, asyncio.get_running_loop().time() + seconds)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._semaphore:
+            async with self._lock:
+                loop = asyncio.get_running_loop()
+                wait = max(self._nextStart, self._blockedUntil) - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._nextStart = loop.time() + self.delay
+            yield
+
+
+class AsyncDownloader:
+    """Downloads the containers of a manifest into a directory with asyncio and aiohttp rather than a thread per request.
+
+    Every tile is a coroutine so thousands of requests can be waiting on slow servers at once without a
+    thread each. Each host gets per_host requests at once (level0_per_host with no delay for level 0
+    images), started delay seconds apart, and no more than async_requests tiles are in flight in total
+    so memory stays flat however big the images are. Files are written on the default executor so the
+    event loop never waits on the disk. Needs aiohttp, which is installed with the asyncio extra.
+    """
+
+    def __init__(self, config: Config, journal: Optional[Journal] = None, store=None, metrics: Optional[Metrics] = None, plan=None, retries: int = 3):
+        self.config = config
+        self.journal = journal
+        self.store = store
+        self.metrics = metrics or Metrics()
+        self.plan = plan
+        self.retries = retries
+        self._hosts = {}
+        # Made in downloadContainers, as before Python 3.10 they belong to the loop they are made in
+        self._slots = None
+        self._session = None
+
+    def host(self, url: str, static: bool = False) -> HostLimiter:
+        """The limiter for url's host. Level 0 images have their own, so other services on the host keep the delay."""
+        key = (urlparse(url).netloc, static)
+        if key not in self._hosts:
+            if static:
+                self._hosts[key] = HostLimiter(self.config.level0_per_host, 0)
+            else:
+                self._hosts[key] = HostLimiter(self.config.per_host, float(self.config.delay))
+        return self._hosts[key]
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def request(self, url: str, filename: Optional[str] = None, static: bool = False):
+        """GET url, retrying when the server is overloaded.
+
+        Returns the JSON, or if filename is given the body is saved there and (size, sha256, etag, last modified, md5) returned.
+        """
+        host = self.host(url, static)
+        for attempt in range(1, self.retries + 1):
+            async with host.slot():
+                with self.metrics.request(url) as request:
+                    async with self._session.get(url) as response:
+                        request.status = response.status
+                        if response.status in BACKOFF_STATUS and attempt < self.retries:
+                            logger.info(f"Attempt {attempt} failed with {response.status}.")
+                            self.metrics.retry(url, response.status)
+                            host.backoff(parseRetryAfter(response.headers.get("Retry-After")) or float(self.config.retry_delay))
+                            continue
+
+                        response.raise_for_status()
+                        if filename is None:
+                            return await response.json(content_type=None)
+                        size, sha256, md5 = await self.saveResponse(response, filename)
+                        self.metrics.received(url, size)
+                        return size, sha256, response.headers.get("ETag"), response.headers.get("Last-Modified"), md5
+
+    async def saveResponse(self, response, filename: str):
+        checksums = Checksums(self.config.checksum_md5)
+        size = 0
+        partial = partialName(filename)
+        f = await self.run(open, partial, "wb")
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await self.run(f.write, chunk)
+                checksums.update(chunk)
+                size += len(chunk)
+        except BaseException:
+            f.close()
+            os.remove(partial)
+            raise
+        await self.run(f.close)
+        await self.run(os.replace, partial, filename)
+        return size, checksums.sha256, checksums.md5
+
+    async def saveJson(self, url: str, filename: str):
+        if os.path.exists(filename):
+            logger.info(f"Found {filename} already downloaded so returning that.")
+            with open(filename, "r") as f:
+                return json.load(f)
+
+        data = await self.request(url)
+        await self.run(writeJson, data, filename)
+        return data
+
+    async def downloadAsset(self, filename: str, url: str, static: bool = False):
+        """Download url to filename unless the journal says it is done or it is in the blob store."""
+        if self.journal is not None and self.journal.isComplete(url):
+            logger.info(f"Found {url} already present in {filename}.")
+            return
+
+        found = await self.run(self.store.fetch, url, filename) if self.store is not None else None
+        if found is not None:
+            logger.info(f"Found {url} in the blob store.")
+        else:
+            found = await self.request(url, filename, static)
+            if self.store is not None:
+                await self.run(self.store.add, url, filename, *found[:2])
+        if self.journal is not None:
+            self.journal.record(url, filename, *found)
+
+    async def downloadTile(self, filename: str, url: str, static: bool = False):
+        try:
+            await self.downloadAsset(filename, url, static)
+        except aiohttp.ClientResponseError as e:
+            logger.warning(f"Failed to get {url} due to {e.status}, skipping.")
+            self.metrics.failure(url, e.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Already counted as an error by the request's metrics
+            logger.warning(f"Failed to get {url} due to {e!r}, skipping.")
+        finally:
+            self._slots.release()
+
+    async def loadInfoJson(self, imageDir: str, url: str):
+        os.makedirs(imageDir, exist_ok=True)
+        data = self.plan.infoJson(url) if self.plan is not None else None
+        if data is not None:
+            await self.run(writeJson, data, os.path.join(imageDir, "info.json"))
+            return infoJson_factory(data)
+        return infoJson_factory(await self.saveJson(f"{url}/info.json", os.path.join(imageDir, "info.json")))
+
+    async def downloadIIIF(self, imageDir: str, url: str):
+        infoJson = await self.loadInfoJson(imageDir, url)
+        if self.journal is not None:
+            self.journal.record(f"{url}/info.json", os.path.join(imageDir, "info.json"), len(dumpJson(infoJson.data)), jsonDigest(infoJson.data))
+
+        level0 = isStatic(infoJson)
+        if level0:
+            logger.info(f"{infoJson.id} is a level 0 image so downloading without a delay.")
+
+        tasks = []
+        for tileUrl in infoJson.iterTileUrls(declaredOnly=level0):
+            filename = tileUrl.replace(infoJson.id, imageDir)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            # Waits here once async_requests tiles are in flight, so the tiles of a huge image aren't all made at once
+            await self._slots.acquire()
+            tasks.append(asyncio.ensure_future(self.downloadTile(filename, tileUrl, level0)))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Failed tiles are skipped so this is e.g. a full disk, don't leave the other tiles running
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def downloadContainers(self, manifest, downloadDir: str):
+        """Download every container of manifest into downloadDir, pointing each at its local copy."""
+        timeout = aiohttp.ClientTimeout(sock_connect=self.config.connect_timeout, sock_read=self.config.read_timeout)
+        # Connections are limited by the host limiters
+        connector = aiohttp.TCPConnector(limit=0)
+        self._slots = asyncio.Semaphore(max(1, self.config.async_requests))
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as self._session:
+            work = []
+            names = {}
+            submitted = set()
+            for container in manifest.containers():
+                name = localName(container, names)
+                if name not in submitted:
+                    logger.info(f"Downloading {container.url}")
+                    if container.isDownloadable():
+                        work.append(self.downloadAsset(os.path.join(downloadDir, name), container.url))
+                    else:
+                        work.append(self.downloadIIIF(os.path.join(downloadDir, name), container.url))
+                    submitted.add(name)
+                container.url = name
+
+            await asyncio.gather(*work)
+
+
+def downloadContainers(manifest, downloadDir: str, journal: Optional[Journal] = None, store=None, metrics: Optional[Metrics] = None, plan=None):
+    """The asyncio engine's downloader.downloadContainers, selected with engine=asyncio."""
+    if aiohttp is None:
+        raise ImportError("The asyncio engine needs aiohttp, install it with: pip install iiif-archive[asyncio]")
+
+    downloader = AsyncDownloader(get_config(), journal, store, metrics, plan)
+    asyncio.run(downloader.downloadContainers(manifest, downloadDir))
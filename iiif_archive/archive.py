@@ -0,0 +1,330 @@
+import errno
+import io
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .fixity import Checksums, hashStream
+
+# Downloads smaller than this are buffered in memory before they are added to the zip,
+# larger ones spill to a temporary file.
+SPOOL_SIZE = 16 * 1024 * 1024
+COPY_BUFFER = 1024 * 1024
+# Files at least this big are deflated in chunks as they are written rather than read whole on the pool
+STREAM_DEFLATE_SIZE = 16 * 1024 * 1024
+# Most bytes of the smaller files the pool deflates ahead of the one being written
+DEFLATE_AHEAD = 64 * 1024 * 1024
+# Files are downloaded under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".part"
+
+# Media formats that are already compressed so deflating them costs CPU for no gain
+STORED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".jp2", ".jpx", ".jxl", ".heic", ".heif", ".avif", ".tif", ".tiff",
+    ".mp4", ".m4a", ".m4b", ".m4v", ".mov", ".mkv", ".avi", ".mpg", ".mpeg", ".webm", ".ogg", ".ogv", ".oga", ".opus",
+    ".mp3", ".aac", ".flac", ".wma", ".wmv", ".zip", ".gz", ".bz2", ".xz", ".7z", ".pdf", ".epub"
+}
+
+
+def compressionFor(arcname: str) -> int:
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    else:
+        return zipfile.ZIP_DEFLATED
+
+
+def deflate(data: bytes, level: int = 6):
+    """Compress data as a zip DEFLATED entry. Returns the CRC and compressed bytes.
+
+    zlib releases the GIL while it works so this can run on several threads at once.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return zlib.crc32(data), compressor.compress(data) + compressor.flush()
+
+
+def deflateFile(path: str, level: int = 6):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    return (len(data),) + deflate(data, level)
+
+
+@contextmanager
+def rawEntry(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo):
+    """Append an entry whose compressed bytes are already known, yielding the file to write them to.
+
+    zinfo must have compress_type, CRC, file_size and compress_size set to match what is written.
+    This follows ZipFile.mkdir which is the only stdlib writer that doesn't go through a compressor.
+    """
+    with zipf._lock:
+        if zipf._seekable:
+            zipf.fp.seek(zipf.start_dir)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        zipf.fp.write(zinfo.FileHeader(zip64))
+        yield zipf.fp
+
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+
+def writeRaw(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, data: bytes):
+    with rawEntry(zipf, zinfo) as fp:
+        fp.write(data)
+
+
+def localHeaderLength(header: bytes, info: zipfile.ZipInfo) -> int:
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    nameLength, extraLength = struct.unpack("<HH", header[26:30])
+    return zipfile.sizeFileHeader + nameLength + extraLength
+
+
+def dataOffset(fileobj, info: zipfile.ZipInfo) -> int:
+    """Where the compressed bytes of info start, which is after its local header rather than the central directory's copy."""
+    fileobj.seek(info.header_offset)
+    return info.header_offset + localHeaderLength(fileobj.read(zipfile.sizeFileHeader), info)
+
+
+def preadDataOffset(fd: int, info: zipfile.ZipInfo) -> int:
+    """Find dataOffset through a file descriptor shared between threads, reading without moving its position."""
+    return info.header_offset + localHeaderLength(os.pread(fd, zipfile.sizeFileHeader, info.header_offset), info)
+
+
+def writeAll(dst: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dst, view):]
+
+
+def copyRange(src: int, dst: int, offset: int, count: int):
+    """Copy count bytes from offset in src to dst, in the kernel where it can be so the data never passes through Python."""
+    end = offset + count
+    try:
+        while offset < end:
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src, dst, end - offset, offset)
+            else:
+                copied = os.sendfile(dst, src, offset, end - offset)
+            if copied == 0:
+                raise zipfile.BadZipFile("Archive is truncated")
+            offset += copied
+    except OSError as e:
+        # Filesystems and kernels that can't copy between these files
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+            raise
+        while offset < end:
+            chunk = os.pread(src, min(COPY_BUFFER, end - offset), offset)
+            if not chunk:
+                raise zipfile.BadZipFile("Archive is truncated")
+            writeAll(dst, chunk)
+            offset += len(chunk)
+
+
+def copyEntry(fileobj, info: zipfile.ZipInfo, zipf: zipfile.ZipFile, arcname: str):
+    """Copy entry info of the zip open as fileobj into zipf as arcname without decompressing or recompressing it.
+
+    When zipf is a file on disk the bytes are copied by the kernel, which on filesystems with
+    reflinks shares them with the source rather than using more space. fileobj is only read at
+    offsets, never moving its position, so a ZipFile reading the same file in other threads isn't disturbed.
+    """
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.external_attr = info.external_attr
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.file_size = info.file_size
+    zinfo.compress_size = info.compress_size
+
+    src = fileobj.fileno()
+    offset = preadDataOffset(src, info)
+    with rawEntry(zipf, zinfo) as fp:
+        if zipf._seekable:
+            fp.flush()
+            position = fp.tell()
+            os.lseek(fp.fileno(), position, os.SEEK_SET)
+            copyRange(src, fp.fileno(), offset, info.compress_size)
+            fp.seek(position + info.compress_size)
+        else:
+            end = offset + info.compress_size
+            while offset < end:
+                chunk = os.pread(src, min(COPY_BUFFER, end - offset), offset)
+                if not chunk:
+                    raise zipfile.BadZipFile(f"{info.filename} is truncated")
+                fp.write(chunk)
+                offset += len(chunk)
+
+
+def writeDeflated(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, size: int, crc: int, data: bytes):
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.file_size = size
+    zinfo.CRC = crc
+    zinfo.compress_size = len(data)
+    writeRaw(zipf, zinfo, data)
+
+
+def partialName(filename: str) -> str:
+    """A temporary name to write filename under, unique so two workers downloading the same file never share one."""
+    return f"{filename}.{uuid.uuid4().hex[:12]}{PARTIAL_SUFFIX}"
+
+
+def listFiles(source_dir):
+    """(path, name in the zip) of every file under source_dir that is zipped, in sorted path order."""
+    files = []
+    for root, dirs, names in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith(PARTIAL_SUFFIX):
+                # Left behind by an interrupted download
+                continue
+            file_path = os.path.join(root, name)
+            files.append((file_path, os.path.relpath(file_path, start=source_dir)))
+    return files
+
+
+def deflateAhead(pool, files, compressLevel=6):
+    """Yield (path, name in the zip, deflated) for each of files in order.
+
+    Files under STREAM_DEFLATE_SIZE that are deflated are compressed on pool, DEFLATE_AHEAD bytes at most
+    ahead of the one yielded, and deflated is deflateFile's result. It is None for the rest, which are
+    written as they are read.
+    """
+    pending = deque()
+    queued = 0
+    for path, arcname in files:
+        size = os.path.getsize(path)
+        if compressionFor(arcname) == zipfile.ZIP_DEFLATED and size < STREAM_DEFLATE_SIZE:
+            pending.append((path, arcname, pool.submit(deflateFile, path, compressLevel), size))
+            queued += size
+        else:
+            pending.append((path, arcname, None, 0))
+
+        while pending and (queued > DEFLATE_AHEAD or pending[0][2] is None):
+            path, arcname, future, size = pending.popleft()
+            queued -= size
+            yield path, arcname, future.result() if future else None
+
+    for path, arcname, future, _ in pending:
+        yield path, arcname, future.result() if future else None
+
+
+def zipDirectory(source_dir, zip_filename, compressLevel=6, workers=None):
+    """Zip source_dir, storing media files and deflating everything else.
+
+    Smaller files are deflated on a pool of threads, large ones in chunks as they are written so they
+    are never all in memory. Entries are written in sorted path order so the archive doesn't depend on
+    the order files were downloaded.
+    """
+    files = listFiles(source_dir)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool, zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arcname, deflated in deflateAhead(pool, files, compressLevel):
+            if deflated is not None:
+                writeDeflated(zipf, zipfile.ZipInfo.from_file(file_path, arcname), *deflated)
+            else:
+                zipf.write(file_path, arcname, compress_type=compressionFor(arcname), compresslevel=compressLevel)
+
+
+class ZipStream:
+    """Writes downloaded files straight into a zip file instead of a scratch directory.
+
+    Files are still addressed by the path they would have had in the scratch directory (root),
+    the path relative to root is used as the name in the zip. Only one entry can be written to
+    a zip at a time so each download is buffered and then copied in under a lock.
+    checksums has the (SHA-256, MD5) of each entry added with writestr, and of those added with
+    write if md5 is set, as the checksums of downloads are taken while they stream in.
+    """
+
+    def __init__(self, zip_filename, root, compressLevel=6, md5=False):
+        self.root = root
+        self.compressLevel = compressLevel
+        self.md5 = md5
+        self.checksums = {}
+        self._zipf = zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_DEFLATED)
+        self._lock = threading.Lock()
+
+    def arcname(self, filename: str) -> str:
+        return os.path.relpath(filename, self.root).replace(os.sep, "/")
+
+    def __contains__(self, filename: str) -> bool:
+        with self._lock:
+            return self.arcname(filename) in self._zipf.NameToInfo
+
+    def _zipInfo(self, filename, size):
+        info = zipfile.ZipInfo(self.arcname(filename), time.localtime(time.time())[:6])
+        info.external_attr = 0o644 << 16
+        info.compress_type = compressionFor(info.filename)
+        info.file_size = size
+        return info
+
+    def names(self):
+        with self._lock:
+            return self._zipf.namelist()
+
+    def write(self, filename, fileobj):
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+        info = self._zipInfo(filename, size)
+        if info.compress_type == zipfile.ZIP_DEFLATED and size < STREAM_DEFLATE_SIZE:
+            self.writestr(filename, fileobj.read())
+        elif info.compress_type == zipfile.ZIP_DEFLATED:
+            # Deflated in chunks as it is written so a large file is never in memory whole
+            checksums = Checksums(self.md5)
+            info._compresslevel = self.compressLevel
+            with self._lock:
+                with self._zipf.open(info, "w") as dest:
+                    while chunk := fileobj.read(COPY_BUFFER):
+                        checksums.update(chunk)
+                        dest.write(chunk)
+            self.checksums[info.filename] = (checksums.sha256, checksums.md5)
+        else:
+            if self.md5:
+                # The journal only has the SHA-256 of files that weren't downloaded, like cut tiles
+                self.checksums[info.filename] = hashStream(fileobj, True)
+                fileobj.seek(0)
+            with self._lock:
+                with self._zipf.open(info, "w") as dest:
+                    shutil.copyfileobj(fileobj, dest, COPY_BUFFER)
+
+    def writestr(self, filename, data):
+        info = self._zipInfo(filename, len(data))
+        self.checksums[info.filename] = hashStream(io.BytesIO(data), self.md5)
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            # Compress before taking the lock so entries from different workers compress in parallel
+            crc, compressed = deflate(data, self.compressLevel)
+            with self._lock:
+                writeDeflated(self._zipf, info, len(data), crc, compressed)
+        else:
+            with self._lock:
+                self._zipf.writestr(info, data)
+
+    def copy(self, filename, fileobj, info: zipfile.ZipInfo):
+        """Add entry info of the zip open as fileobj as filename, copying its compressed bytes as they are."""
+        with self._lock:
+            copyEntry(fileobj, info, self._zipf, self.arcname(filename))
+
+    @contextmanager
+    def open(self, filename):
+        """Return a file to download into, which is added to the zip if the block completes."""
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            yield f
+            self.write(filename, f)
+
+    def close(self):
+        self._zipf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
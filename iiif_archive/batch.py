@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from iiif_archive.config import get_config
+
+from .blobstore import BlobStore
+from .downloader import download
+from .pyramid import PyramidBuilder
+from .scheduler import create_scheduler
+from .session import create_session
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    url: str
+    name: str
+
+
+@dataclass
+class JobResult:
+    url: str
+    name: str
+    zip_file: str
+    status: str
+    duration: float = 0
+    bytes: int = 0
+    error: Optional[str] = None
+
+
+def defaultName(url: str) -> str:
+    """A zip name for a manifest listed without one, made from its URL."""
+    parsed = urlparse(url)
+    path = re.sub(r"\.json$", "", parsed.path)
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", f"{parsed.netloc}{path}").strip("-")
+
+
+def readJobs(path: str) -> List[BatchJob]:
+    """Read a file with a manifest URL, optionally followed by the name for its zip, on each line.
+
+    Blank lines and lines starting with # are ignored.
+    """
+    jobs = []
+    names = set()
+    with open(path, "r") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            fields = line.split()
+            job = BatchJob(fields[0], fields[1] if len(fields) > 1 else defaultName(fields[0]))
+            if job.name in names:
+                raise ValueError(f"Line {number} of {path}: {job.name} is used by more than one manifest")
+            names.add(job.name)
+            jobs.append(job)
+
+    return jobs
+
+
+def runJob(job: BatchJob, outputDir: str, scratch: str, stream: bool = False, **shared) -> JobResult:
+    zipFile = os.path.join(outputDir, f"{job.name}.zip")
+    if os.path.exists(zipFile):
+        # Done by an earlier run of the batch
+        return JobResult(job.url, job.name, zipFile, "skipped", bytes=os.path.getsize(zipFile))
+
+    start = time.monotonic()
+    try:
+        download(job.url, zipFile, scratch, stream=stream, **shared)
+    except Exception as e:
+        logger.error(f"Failed to archive {job.url}: {e}")
+        return JobResult(job.url, job.name, zipFile, "failed", time.monotonic() - start, error=f"{type(e).__name__}: {e}")
+
+    logger.info(f"Archived {job.url} to {zipFile}")
+    return JobResult(job.url, job.name, zipFile, "ok", time.monotonic() - start, os.path.getsize(zipFile))
+
+
+def runBatch(jobs: List[BatchJob], outputDir: str, scratch: str, concurrency: int = 4, stream: bool = False, **shared) -> List[JobResult]:
+    """Archive every job, concurrency manifests at a time.
+
+    The jobs run on threads in this process so that they share one session, and with it the
+    connection pools and each host's rate limits, as well as the download workers, the pyramid
+    builder and the blob store. Any of these can be passed in shared, the rest are made for the batch.
+    A failed manifest is reported and the rest carry on.
+    """
+    config = get_config()
+    os.makedirs(outputDir, exist_ok=True)
+    with ExitStack() as stack:
+        if shared.get("session") is None:
+            shared["session"] = stack.enter_context(create_session(config))
+        if shared.get("scheduler") is None:
+            shared["scheduler"] = stack.enter_context(create_scheduler(config))
+        if shared.get("pyramid") is None and config.local_pyramid:
+            shared["pyramid"] = stack.enter_context(PyramidBuilder(config.pyramid_workers))
+        if shared.get("store") is None and config.blob_dir:
+            shared["store"] = stack.enter_context(BlobStore(config.blob_dir, config.blob_max_size * 1024 * 1024))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="iiif-archive-job") as pool:
+            return list(pool.map(lambda job: runJob(job, outputDir, scratch, stream, **shared), jobs))
+
+
+def writeReport(results: List[JobResult], path: str):
+    summary = {status: sum(1 for result in results if result.status == status) for status in ("ok", "skipped", "failed")}
+    summary["bytes"] = sum(result.bytes for result in results)
+    summary["duration"] = sum(result.duration for result in results)
+
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "manifests": [asdict(result) for result in results]}, f, indent=4)
+
+    return summary
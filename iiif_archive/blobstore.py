@@ -0,0 +1,146 @@
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def linkOrCopy(source: str, destination: str):
+    """Hardlink source to destination, copying if they are on different filesystems. Replaces destination."""
+    partial = destination + ".link"
+    if os.path.exists(partial):
+        os.remove(partial)
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, destination)
+
+
+class BlobStore:
+    """A content addressed store of downloaded files shared by every archive job.
+
+    Files are kept once per SHA-256 under objects/ and looked up by the URL they were downloaded from.
+    Archives get hardlinks to the stored files so a tile shared by several manifests, or fetched again
+    by a re-run, is only downloaded and stored once. When the store grows past maxSize bytes the least
+    recently used files are removed; files already linked into an archive's scratch directory are kept.
+    Several processes can share a store, its total size is kept in the index and updated in the same
+    transaction as the blobs. Only jobs in one process wait for each other's downloads of a URL though,
+    jobs in different processes may both download it.
+    """
+
+    def __init__(self, root: str, maxSize: int = 0):
+        self.root = root
+        self.maxSize = maxSize
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Stores made before the size was kept start from the size of their blobs
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT 'size', COALESCE(SUM(size), 0) FROM blobs")
+        self._lock = threading.Lock()
+        # Events for the URLs being downloaded by a job in this process right now, set when they finish
+        self._downloading = {}
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], sha256[2:])
+
+    def get(self, url: str) -> Optional[Tuple[str, int]]:
+        """Return (sha256, size) of the blob stored for url and mark it as recently used."""
+        with self._lock:
+            row = self._conn.execute("SELECT blobs.sha256, blobs.size FROM urls JOIN blobs ON urls.sha256 = blobs.sha256 WHERE urls.url = ?", (url,)).fetchone()
+            if row is None or not os.path.exists(self.path(row[0])):
+                return None
+            self._conn.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), row[0]))
+            return row
+
+    def fetch(self, url: str, filename: str) -> Optional[Tuple[int, str]]:
+        """Link the blob stored for url to filename. Returns (size, sha256) or None if url isn't stored."""
+        found = self.get(url)
+        if found is None:
+            return None
+        sha256, size = found
+        try:
+            linkOrCopy(self.path(sha256), filename)
+        except FileNotFoundError:
+            # Evicted, perhaps by another process, since get found it
+            return None
+        return size, sha256
+
+    def add(self, url: str, filename: str, size: int, sha256: str):
+        blob = self.path(sha256)
+        with self._lock:
+            # IMMEDIATE takes the write lock first so two processes can't both count the same blob
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = self._conn.execute("SELECT size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+                if stored is None or not os.path.exists(blob):
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    linkOrCopy(filename, blob)
+                    self._conn.execute("INSERT OR REPLACE INTO blobs (sha256, size, last_used) VALUES (?, ?, ?)", (sha256, size, time.time()))
+                    self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'size'", (size - (stored[0] if stored else 0),))
+                self._conn.execute("INSERT OR REPLACE INTO urls (url, sha256) VALUES (?, ?)", (url, sha256))
+                self._evict()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextmanager
+    def downloading(self, url: str):
+        """Held while url is downloaded. A job that wants url at the same time waits until it is done so it can take it from the store."""
+        with self._lock:
+            event = self._downloading.get(url)
+            if event is None:
+                self._downloading[url] = threading.Event()
+
+        if event is not None:
+            event.wait()
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._downloading.pop(url).set()
+
+    def _evict(self):
+        # Called in add's transaction, so the size includes what other processes have added
+        while self.maxSize and self._storedSize() > self.maxSize:
+            row = self._conn.execute("SELECT sha256, size FROM blobs ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            sha256, size = row
+            logger.debug(f"Evicting {sha256} from the blob store")
+            if os.path.exists(self.path(sha256)):
+                os.remove(self.path(sha256))
+            self._conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+            self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'size'", (size,))
+
+    def _storedSize(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'size'").fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._storedSize()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
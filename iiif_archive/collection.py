@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, List
+
+from iiif_archive.config import get_config
+
+from .batch import BatchJob, defaultName, runBatch
+from .blobstore import BlobStore
+from .downloader import fetchJson
+from .models.collection import Collection
+from .processors import collection_factory
+from .session import create_session
+
+logger = logging.getLogger(__name__)
+
+# Written next to the zip files, the collection's tree with the zip each manifest was archived to
+INDEX = "index.json"
+
+
+def walkCollection(url: str, session, data=None, workers: int = 4) -> Dict[str, Collection]:
+    """Fetch the Collection at url and every Collection under it, keyed by URL.
+
+    The Collections at each depth are fetched concurrently. Each is fetched once, even if it
+    is listed more than once or one of its members lists it again. data is the Collection at
+    url if it has already been fetched.
+    """
+    collections = {}
+    seen = {url}
+    level = [url]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="iiif-archive-collection") as pool:
+        while level:
+            fetched = pool.map(lambda member: (member, data if member == url and data is not None else fetchJson(member, session)), level)
+            level = []
+            for member, memberData in fetched:
+                collections[member] = collection_factory(memberData)
+                for child in collections[member].collections():
+                    if child not in seen:
+                        seen.add(child)
+                        level.append(child)
+
+    logger.info(f"Found {len(collections)} collections under {url}")
+    return collections
+
+
+def collectionJobs(collections: Dict[str, Collection]) -> List[BatchJob]:
+    """A job for each Manifest in the collections. A manifest listed in more than one is archived once."""
+    jobs = []
+    names = set()
+    for url in dict.fromkeys(manifest for collection in collections.values() for manifest in collection.manifests()):
+        name = defaultName(url)
+        if name in names:
+            name = f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+        names.add(name)
+        jobs.append(BatchJob(url, name))
+
+    return jobs
+
+
+def collectionIndex(url: str, collections: Dict[str, Collection], results: Dict, ancestors=()) -> Dict:
+    """The tree of the Collection at url with the zip file and status of each Manifest."""
+    collection = collections[url]
+    items = []
+    for member in collection.members():
+        if member["type"] == "Manifest":
+            result = results[member["id"]]
+            items.append({**member, "zip": os.path.basename(result.zip_file), "status": result.status})
+        elif member["id"] in ancestors or member["id"] == url:
+            # Lists a collection it is part of, so don't go round again
+            items.append(member)
+        else:
+            items.append(collectionIndex(member["id"], collections, results, ancestors + (url,)))
+
+    return {"id": url, "type": "Collection", "label": collection.label, "items": items}
+
+
+def downloadCollection(url, data, outputDir, scratch, stream=False, **shared):
+    """Archive every Manifest in the IIIF Collection at url, and the Collections under it, to its own zip in outputDir.
+
+    The manifests are archived as a batch so they share connections and rate limits. Files used by
+    more than one manifest are downloaded once through the blob store, a temporary one in scratch
+    if blob_dir isn't set. index.json in outputDir has the collection's tree with each manifest's zip file.
+    """
+    config = get_config()
+    with ExitStack() as stack:
+        if shared.get("session") is None:
+            shared["session"] = stack.enter_context(create_session(config))
+        if shared.get("store") is None:
+            if config.blob_dir:
+                shared["store"] = stack.enter_context(BlobStore(config.blob_dir, config.blob_max_size * 1024 * 1024))
+            else:
+                os.makedirs(scratch, exist_ok=True)
+                shared["store"] = stack.enter_context(BlobStore(stack.enter_context(tempfile.TemporaryDirectory(dir=scratch))))
+
+        collections = walkCollection(url, shared["session"], data, config.workers)
+        jobs = collectionJobs(collections)
+        logger.info(f"Archiving {len(jobs)} manifests from {url}")
+        results = runBatch(jobs, outputDir, scratch, config.batch_jobs, stream, **shared)
+
+    index = collectionIndex(url, collections, {result.url: result for result in results})
+    with open(os.path.join(outputDir, INDEX), "w") as f:
+        json.dump(index, f, indent=4)
+
+    failed = [result for result in results if result.status == "failed"]
+    if failed:
+        logger.error(f"{len(failed)} of {len(results)} manifests in {url} failed, see {os.path.join(outputDir, INDEX)}")
+
+    return outputDir
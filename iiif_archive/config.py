@@ -19,9 +19,31 @@ def _parse_bool(s: str) -> bool:
 @dataclass(frozen=True)
 class Config:
     scratch_dir: str = "downloads"
+    blob_dir: str = ""
+    blob_max_size: int = 0
     delay: int = 1
     retry_delay: int = 1
     no_delay_level0: bool = True
+    workers: int = 4
+    batch_jobs: int = 4
+    per_host: int = 2
+    level0_workers: int = 16
+    level0_per_host: int = 16
+    local_pyramid: bool = False
+    pyramid_workers: int = 0
+    pool_size: int = 10
+    connect_timeout: float = 10
+    read_timeout: float = 60
+    range_threshold: int = 64
+    range_part_size: int = 16
+    range_connections: int = 4
+    engine: str = "threads"
+    async_requests: int = 100
+    compress_level: int = 6
+    compress_workers: int = 0
+    checksum_md5: bool = False
+    metrics_file: str = ""
+    metrics_interval: int = 10
 
 
 class Singleton:
@@ -37,21 +59,87 @@ def load_config(path: Optional[str] = None, overrides: Optional[Dict[str, Any]]
     cfg = _load(path)
 
     scratch_dir = cfg.get("locations", "scratch_dir", fallback=defaults.scratch_dir)
+    blob_dir = cfg.get("locations", "blob_dir", fallback=defaults.blob_dir)
+    blob_max_size = cfg.getint("locations", "blob_max_size", fallback=defaults.blob_max_size)
     delay = cfg.getint("Download", "delay", fallback=defaults.delay)
     retry_delay = cfg.getint("Download", "retry_delay", fallback=defaults.retry_delay)
     no_delay_level0 = _parse_bool(cfg.get("Download", "no_delay_level0", fallback=str(defaults.no_delay_level0)))
+    workers = cfg.getint("Download", "workers", fallback=defaults.workers)
+    batch_jobs = cfg.getint("Download", "batch_jobs", fallback=defaults.batch_jobs)
+    per_host = cfg.getint("Download", "per_host", fallback=defaults.per_host)
+    level0_workers = cfg.getint("Download", "level0_workers", fallback=defaults.level0_workers)
+    level0_per_host = cfg.getint("Download", "level0_per_host", fallback=defaults.level0_per_host)
+    local_pyramid = _parse_bool(cfg.get("Download", "local_pyramid", fallback=str(defaults.local_pyramid)))
+    pyramid_workers = cfg.getint("Download", "pyramid_workers", fallback=defaults.pyramid_workers)
+    pool_size = cfg.getint("Download", "pool_size", fallback=defaults.pool_size)
+    connect_timeout = cfg.getfloat("Download", "connect_timeout", fallback=defaults.connect_timeout)
+    read_timeout = cfg.getfloat("Download", "read_timeout", fallback=defaults.read_timeout)
+    range_threshold = cfg.getint("Download", "range_threshold", fallback=defaults.range_threshold)
+    range_part_size = cfg.getint("Download", "range_part_size", fallback=defaults.range_part_size)
+    range_connections = cfg.getint("Download", "range_connections", fallback=defaults.range_connections)
+    engine = cfg.get("Download", "engine", fallback=defaults.engine)
+    async_requests = cfg.getint("Download", "async_requests", fallback=defaults.async_requests)
+    compress_level = cfg.getint("Zip", "compress_level", fallback=defaults.compress_level)
+    compress_workers = cfg.getint("Zip", "compress_workers", fallback=defaults.compress_workers)
+    checksum_md5 = _parse_bool(cfg.get("Zip", "checksum_md5", fallback=str(defaults.checksum_md5)))
+    metrics_file = cfg.get("Metrics", "metrics_file", fallback=defaults.metrics_file)
+    metrics_interval = cfg.getint("Metrics", "metrics_interval", fallback=defaults.metrics_interval)
 
     if overrides:
         scratch_dir = overrides.get("scratch_dir", scratch_dir)
+        blob_dir = overrides.get("blob_dir", blob_dir)
+        blob_max_size = overrides.get("blob_max_size", blob_max_size)
         delay = overrides.get("delay", delay)
         retry_delay = overrides.get("retry_delay", retry_delay)
         no_delay_level0 = overrides.get("no_delay_level0", no_delay_level0)
+        workers = overrides.get("workers", workers)
+        batch_jobs = overrides.get("batch_jobs", batch_jobs)
+        per_host = overrides.get("per_host", per_host)
+        level0_workers = overrides.get("level0_workers", level0_workers)
+        level0_per_host = overrides.get("level0_per_host", level0_per_host)
+        local_pyramid = overrides.get("local_pyramid", local_pyramid)
+        pyramid_workers = overrides.get("pyramid_workers", pyramid_workers)
+        pool_size = overrides.get("pool_size", pool_size)
+        connect_timeout = overrides.get("connect_timeout", connect_timeout)
+        read_timeout = overrides.get("read_timeout", read_timeout)
+        range_threshold = overrides.get("range_threshold", range_threshold)
+        range_part_size = overrides.get("range_part_size", range_part_size)
+        range_connections = overrides.get("range_connections", range_connections)
+        engine = overrides.get("engine", engine)
+        async_requests = overrides.get("async_requests", async_requests)
+        compress_level = overrides.get("compress_level", compress_level)
+        compress_workers = overrides.get("compress_workers", compress_workers)
+        checksum_md5 = overrides.get("checksum_md5", checksum_md5)
+        metrics_file = overrides.get("metrics_file", metrics_file)
+        metrics_interval = overrides.get("metrics_interval", metrics_interval)
 
     Singleton._instance = Config(
         scratch_dir=scratch_dir,
+        blob_dir=blob_dir,
+        blob_max_size=blob_max_size,
         delay=delay,
         retry_delay=retry_delay,
-        no_delay_level0=no_delay_level0
+        no_delay_level0=no_delay_level0,
+        workers=workers,
+        batch_jobs=batch_jobs,
+        per_host=per_host,
+        level0_workers=level0_workers,
+        level0_per_host=level0_per_host,
+        local_pyramid=local_pyramid,
+        pyramid_workers=pyramid_workers,
+        pool_size=pool_size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        range_threshold=range_threshold,
+        range_part_size=range_part_size,
+        range_connections=range_connections,
+        engine=engine,
+        async_requests=async_requests,
+        compress_level=compress_level,
+        compress_workers=compress_workers,
+        checksum_md5=checksum_md5,
+        metrics_file=metrics_file,
+        metrics_interval=metrics_interval
     )
 
     return Singleton._instance
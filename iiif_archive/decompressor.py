@@ -1,9 +1,20 @@
 import json
 import os
 import zipfile
-from pathlib import Path
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
+from iiif_archive.archive import (COPY_BUFFER, PARTIAL_SUFFIX, copyEntry,
+                                  copyRange, deflate, preadDataOffset,
+                                  writeAll, writeDeflated)
+from iiif_archive.fixity import BAG_MANIFESTS, rewriteBagManifest
+from iiif_archive.models.infoJson import InfoJson
+from iiif_archive.models.manifest import Manifest
 from iiif_archive.processors import infoJson_factory, manifest_factory
+from iiif_archive.tracing import span, stage
+
+# Entries extracted by each task, so an archive of 100k tiles isn't 100k futures
+BATCH_SIZE = 256
 
 
 def unzip_file(zip_path, extract_to):
@@ -11,31 +22,194 @@ def unzip_file(zip_path, extract_to):
         zip_ref.extractall(extract_to)
 
 
-def inflate(zip_file, local_dir, base_url):
-    unzip_file(zip_file, os.path.join(local_dir, zip_file.replace(".zip", "")))
-    baseDir = os.path.join(local_dir, zip_file.replace(".zip", ""))
+def archiveName(url, manifestId) -> str:
+    """The name in the archive of a container's url.
+
+    Archives hold the names relative to the manifest, unless they have been rebased when the urls
+    start with the directory of manifestId, which is stripped off.
+    """
+    base = manifestId.rsplit("/", 1)[0] + "/"
+    return url[len(base):] if url.startswith(base) else url
+
+
+def rebaseManifest(data, base_url) -> Manifest:
+    """Point the manifest and its containers at the copies of the files served from base_url."""
+    manifest = manifest_factory(data)
+    oldId = manifest.id
+    manifest.id = f"{base_url}/manifest.json"
+
+    for container in manifest.containers():
+        container.url = f"{base_url}/{archiveName(container.url, oldId)}"
+
+    return manifest
+
+
+def rebaseInfoJson(data, base_url, imageDir) -> InfoJson:
+    infoJson = infoJson_factory(data)
+    infoJson.id = f"{base_url}/{imageDir}"
+    return infoJson
+
+
+def isRebased(name) -> bool:
+    """Whether the zip entry name is one of the JSON files whose ids depend on where the archive is served."""
+    parts = name.split("/")
+    return name == "manifest.json" or (len(parts) == 2 and parts[1] == "info.json")
+
+
+def rebaseEntry(name, data: bytes, base_url) -> bytes:
+    """The JSON entry name of an archive rewritten for base_url. Entries that don't need it are returned as they are."""
+    if name == "manifest.json":
+        rebased = rebaseManifest(json.loads(data), base_url)
+    elif isRebased(name):
+        rebased = rebaseInfoJson(json.loads(data), base_url, name.split("/")[0])
+    else:
+        return data
+
+    return json.dumps(rebased.data, indent=4).encode("utf-8")
+
+
+def targetPath(baseDir, name) -> str:
+    """Where entry name is extracted to. Like extractall, absolute paths and .. can't escape baseDir."""
+    parts = [part for part in name.split("/") if part not in ("", ".", "..")]
+    return os.path.join(baseDir, *parts)
+
 
-    base_url = base_url + "/" + zip_file.replace(".zip", "")
+def inflateRange(src: int, dst: int, offset: int, info: zipfile.ZipInfo):
+    decompressor = zlib.decompressobj(-15)
+    crc = 0
+    end = offset + info.compress_size
+    while offset < end:
+        chunk = os.pread(src, min(COPY_BUFFER, end - offset), offset)
+        if not chunk:
+            raise zipfile.BadZipFile(f"{info.filename} is truncated")
+        offset += len(chunk)
+        data = decompressor.decompress(chunk)
+        crc = zlib.crc32(data, crc)
+        writeAll(dst, data)
 
-    with open(os.path.join(baseDir, "manifest.json"), "r") as f:
-        manifest = manifest_factory(json.load(f))
+    data = decompressor.flush()
+    crc = zlib.crc32(data, crc)
+    writeAll(dst, data)
+    if crc != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
 
-        manifest.id = f"{base_url}/manifest.json"
 
-        for container in manifest.containers():
-            container.url = f"{base_url}/{container.url}"
+def checkStored(src: int, offset: int, info: zipfile.ZipInfo):
+    """Check the CRC-32 of a stored entry, which copyRange copies without reading it.
 
-        manifest.save(os.path.join(baseDir, "manifest.json"))
+    The bytes are read back from the zip, which was just read for the copy so is usually in the page cache.
+    """
+    crc = 0
+    end = offset + info.compress_size
+    while offset < end:
+        chunk = os.pread(src, min(COPY_BUFFER, end - offset), offset)
+        if not chunk:
+            raise zipfile.BadZipFile(f"{info.filename} is truncated")
+        offset += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+    if crc != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
 
-    baseDirPath = Path(baseDir)
 
-    for subdir in baseDirPath.iterdir():
-        if subdir.is_dir():
-            with open(os.path.join(baseDir, subdir, "info.json"), "r") as f:
-                infoJson = infoJson_factory(json.load(f))
+def readEntry(src: int, offset: int, info: zipfile.ZipInfo) -> bytes:
+    data = os.pread(src, info.compress_size, offset)
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    if zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
+    return data
 
-                infoJson.id = f"{base_url}/{os.path.basename(subdir)}"
 
-                infoJson.save(os.path.join(baseDir, subdir, "info.json"))
+def extractEntry(src: int, info: zipfile.ZipInfo, baseDir, base_url):
+    """Extract one entry from the zip open as src, rewriting the ids of the manifest and info.json files on the way.
+
+    The directory it goes in must already exist.
+    """
+    if info.is_dir():
+        return
+    if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        raise NotImplementedError(f"Can't extract {info.filename} as it uses compression type {info.compress_type}")
+
+    path = targetPath(baseDir, info.filename)
+    offset = preadDataOffset(src, info)
+    if isRebased(info.filename):
+        with open(path, "wb") as f:
+            f.write(rebaseEntry(info.filename, readEntry(src, offset, info), base_url))
+        return
+
+    dst = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if info.compress_type == zipfile.ZIP_STORED:
+            copyRange(src, dst, offset, info.compress_size)
+            checkStored(src, offset, info)
+        else:
+            inflateRange(src, dst, offset, info)
+    finally:
+        os.close(dst)
+
+
+def extractEntries(src: int, infos, baseDir, base_url):
+    with span("extract batch", "extract", entries=len(infos), first=infos[0].filename):
+        for info in infos:
+            extractEntry(src, info, baseDir, base_url)
+
+
+def inflate(zip_file, local_dir, base_url, workers=None):
+    """Extract zip_file into local_dir with its ids pointing at base_url.
+
+    Entries are extracted on a pool of threads which all read the zip through one file descriptor
+    without moving its position. Tiles and media are copied by the kernel and the JSON ids are
+    rewritten as the JSON is extracted so nothing is written twice.
+    """
+    # A relative path keeps its directories under local_dir and base_url, an absolute one would escape local_dir so only its name is used
+    name = (os.path.basename(zip_file) if os.path.isabs(zip_file) else zip_file).replace(".zip", "")
+    baseDir = os.path.join(local_dir, name)
+
+    base_url = base_url + "/" + name
+
+    with stage("read index", zip_file=zip_file):
+        with zipfile.ZipFile(zip_file) as zf:
+            infos = zf.infolist()
+
+    with stage("make directories"):
+        # Made up front, once each, rather than by every entry in them
+        directories = {targetPath(baseDir, info.filename) if info.is_dir() else os.path.dirname(targetPath(baseDir, info.filename)) for info in infos}
+        for directory in sorted(directories):
+            os.makedirs(directory, exist_ok=True)
+
+    src = os.open(zip_file, os.O_RDONLY)
+    try:
+        with stage("extract", entries=len(infos)), ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            tasks = [pool.submit(extractEntries, src, infos[i:i + BATCH_SIZE], baseDir, base_url) for i in range(0, len(infos), BATCH_SIZE)]
+            for task in tasks:
+                task.result()
+    finally:
+        os.close(src)
 
     return baseDir
+
+
+def rebase(zip_file, out_file, base_url, compressLevel=6):
+    """Write a copy of zip_file to out_file with its ids pointing at base_url, the URL its files will be served from.
+
+    Only the manifest and info.json entries are decompressed and re-encoded, and the BagIt manifests
+    updated with their new checksums, every other entry is copied as its raw compressed bytes.
+    out_file may be zip_file.
+    """
+    base_url = base_url.rstrip("/")
+    partial = out_file + PARTIAL_SUFFIX
+    bags = {name: algorithm for algorithm, name in BAG_MANIFESTS.items()}
+    with open(zip_file, "rb") as f, zipfile.ZipFile(f) as source, zipfile.ZipFile(partial, "w") as zipf:
+        # Rewritten first as the bag manifests can come before the entries they list
+        rebased = {info.filename: rebaseEntry(info.filename, source.read(info), base_url) for info in source.infolist() if isRebased(info.filename)}
+        for info in source.infolist():
+            if info.filename in rebased or info.filename in bags:
+                data = rebased.get(info.filename) or rewriteBagManifest(source.read(info), bags[info.filename], rebased)
+                zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+                zinfo.external_attr = info.external_attr
+                writeDeflated(zipf, zinfo, len(data), *deflate(data, compressLevel))
+            else:
+                copyEntry(f, info, zipf, info.filename)
+
+    os.replace(partial, out_file)
+    return out_file
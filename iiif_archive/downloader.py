@@ -1,104 +1,518 @@
+import copy
+import hashlib
+import io
+import itertools
 import json
 import logging
 import os
-import time
-import zipfile
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager, nullcontext
 
 import requests
 
 from iiif_archive.config import get_config
 
-from .processors import infoJson_factory, manifest_factory
+from .archive import (PARTIAL_SUFFIX, ZipStream, listFiles, partialName,
+                      zipDirectory)
+from .blobstore import BlobStore
+from .fixity import Checksums, bagManifests, hashStream, writeBagManifests
+from .journal import Journal
+from .processors import infoJson_factory, isCollection, manifest_factory
+from .pyramid import PyramidBuilder
+from .ranges import RangeError, downloadRanges, isRangeable
+from .ratecontrol import BACKOFF_STATUS
+from .scheduler import create_scheduler
+from .session import create_session
+from .tracing import span, stage
+from .transfer import PREALLOCATE_MIN, bodySize, iterBody, preallocate
+from .update import SOURCES, PreviousArchive
 
 logger = logging.getLogger(__name__)
 
 
 def zip(source_dir, zip_filename):
-    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, start=source_dir)
-                zipf.write(file_path, arcname)
+    config = get_config()
+    with stage("zip"):
+        zipDirectory(source_dir, zip_filename, config.compress_level, config.compress_workers or None)
+
+
+def fetchJson(url, session):
+    with span("fetch json", "request", url=url), session.rate.slot(url) as slot, session.metrics.request(url) as request:
+        response = session.get(url)
+        slot.observe(response)
+        request.observe(response)
+
+        # Raise an error for bad responses
+        response.raise_for_status()
+
+    # Parse JSON
+    return response.json()
 
 
-def saveJson(url, filename):
-    # File already exists so return it
+def dumpJson(data) -> bytes:
+    return json.dumps(data, indent=4).encode("utf-8")
+
+
+def jsonDigest(data) -> str:
+    """SHA-256 of data that doesn't depend on key order or formatting, so two fetches of the same JSON match."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def saveJson(url, filename, session):
     if os.path.exists(filename):
+        # File already exists so return it
         logger.info(f"Found {filename} already downloaded so returning that.")
         with open(filename, "r") as f:
             data = json.load(f)
             return data
     else:
-        # Download manifest
-        response = requests.get(url)
+        data = fetchJson(url, session)
+        writeJson(data, filename)
 
-        # Raise an error for bad responses
-        response.raise_for_status()
+        return data
 
-        # Parse JSON
-        data = response.json()
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4)
 
-        return data
+def writeJson(data, filename):
+    # Written under a temporary name so an interrupted run never leaves a truncated file behind
+    partial = partialName(filename)
+    with open(partial, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(partial, filename)
+
+
+def isDownloaded(filename, url, archive=None, journal=None):
+    if archive is not None:
+        return filename in archive
+    elif journal is not None:
+        return journal.isComplete(url)
+    else:
+        return os.path.exists(filename)
+
+
+def saveResponse(response, filename, archive=None):
+    """Write the body of response to filename, or into archive, returning its size, SHA-256 and MD5.
+
+    On disk the body is written to a temporary file which is only renamed to filename once complete.
+    Space for large files is reserved up front from their Content-Length. The checksums are taken
+    as the body streams past, the MD5 is None unless checksum_md5 is set.
+
+    Raises:
+        requests.exceptions.ChunkedEncodingError: If the body is shorter or longer than its Content-Length.
+    """
+    checksums = Checksums(get_config().checksum_md5)
+    size = 0
+    partial = partialName(filename)
+    expected = bodySize(response)
+    try:
+        with open(partial, "wb") if archive is None else archive.open(filename) as f:
+            if archive is None and expected is not None and expected >= PREALLOCATE_MIN:
+                preallocate(f.fileno(), expected)
+            for chunk in iterBody(response):
+                f.write(chunk)
+                checksums.update(chunk)
+                size += len(chunk)
+            if expected is not None and size != expected:
+                # Not every urllib3 checks the body against its Content-Length
+                raise requests.exceptions.ChunkedEncodingError(f"Only got {size} of {expected} bytes for {filename}")
+    except BaseException:
+        if archive is None and os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    if archive is None:
+        os.replace(partial, filename)
+
+    return size, checksums.sha256, checksums.md5
+
+
+def reuseBlob(filename, url, store, archive=None, journal=None):
+    """Take url from the blob store rather than the network. Returns False if it isn't stored."""
+    if archive is None:
+        found = store.fetch(url, filename)
+    else:
+        found = store.get(url)
+        if found is not None:
+            sha256, size = found
+            with open(store.path(sha256), "rb") as f:
+                archive.write(filename, f)
+            found = (size, sha256)
 
+    if found is None:
+        return False
 
-def downloadAsset(filename, url, retries=3):
+    logger.info(f"Found {url} in the blob store.")
+    if journal is not None:
+        journal.record(url, filename, *found)
+    return True
+
+
+def requestAsset(filename, url, session, archive=None, headers=None, ranges=True):
+    """Make one request for url and save the body. Returns (size, sha256, etag, last modified, md5), or None if the server said 304 Not Modified.
+
+    A file on disk of at least range_threshold MB from a server that accepts Range requests is fetched in parts
+    over several connections instead, unless ranges is False.
+    """
     config = get_config()
-    if os.path.exists(filename):
+    # The rate controller spaces requests to each host and backs off when the server pushes back
+    with session.rate.slot(url) as slot, session.metrics.request(url) as request:
+        with session.get(url, stream=True, headers=headers) as response:
+            slot.observe(response)
+            request.observe(response)
+            response.raise_for_status()  # Raises error for bad status
+            if response.status_code == 304:
+                return None
+
+            if not (ranges and archive is None and isRangeable(response, config.range_threshold * 1024 * 1024)):
+                with span("save", "write", filename=filename):
+                    size, sha256, md5 = saveResponse(response, filename, archive)
+                session.metrics.received(url, size)
+                return size, sha256, response.headers.get("ETag"), response.headers.get("Last-Modified"), md5
+
+    # Closing the response above drops its body, each part is then requested in a slot of its own
+    try:
+        return downloadRanges(filename, url, session, int(response.headers["Content-Length"]), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except RangeError as e:
+        logger.warning(f"{e}, downloading it in one go instead.")
+        return requestAsset(filename, url, session, archive, headers, ranges=False)
+
+
+def fetchAsset(filename, url, session, retries=3, archive=None, headers=None):
+    """requestAsset, retrying when the server is overloaded."""
+    for attempt in range(1, retries + 1):
+        try:
+            return requestAsset(filename, url, session, archive, headers)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code in BACKOFF_STATUS:
+                logger.info(f"Attempt {attempt} failed with {e.response.status_code}.")
+                if attempt < retries:
+                    session.metrics.retry(url, e.response.status_code)
+                    # The next slot for this host waits for Retry-After or retry_delay
+                    continue
+            raise e  # Re-raise if not a retryable status or retries exhausted
+
+
+def downloadAsset(filename, url, session, retries=3, archive=None, journal=None, store=None, previous=None):
+    """Download url to filename, or into archive (a ZipStream) under the name filename would have.
+
+    If a journal is given it decides whether url has already been downloaded and is updated once it has.
+    If a store (a BlobStore) is given it is checked before the network and files downloaded to disk are added to it.
+    Jobs sharing the store download a URL one at a time so the others take it from the store.
+    If previous (a PreviousArchive) has url it is copied from there, after a conditional GET if the server sent validators.
+    """
+    # Only files downloaded to disk are added to the store, so only they are worth waiting for
+    with span("asset", "asset", url=url), store.downloading(url) if store is not None and archive is None else nullcontext():
+        obtainAsset(filename, url, session, retries, archive, journal, store, previous)
+
+    return filename
+
+
+def obtainAsset(filename, url, session, retries=3, archive=None, journal=None, store=None, previous=None):
+    headers = previous.validators(url) if previous is not None else {}
+    if isDownloaded(filename, url, archive, journal):
         logger.info(f"Found {url} already present in {filename}.")
+    elif store is not None and reuseBlob(filename, url, store, archive, journal):
+        pass
+    elif previous is not None and not headers and previous.reuse(url, filename, archive, journal):
+        # Nothing to ask the server with so trust that the same URL is the same file
+        logger.info(f"Copied {url} from {previous.path}.")
     else:
-        for attempt in range(1, retries + 1):
-            try:
-                with requests.get(url, stream=True) as response:
-                    response.raise_for_status()  # Raises error for bad status
-                    with open(filename, "wb") as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:  # filter out keep-alive chunks
-                                f.write(chunk)
-
-                time.sleep(config.delay)
-
-                return filename
-            except requests.exceptions.HTTPError as e:
-                if response.status_code == 502:
-                    logger.info(f"Attempt {attempt} failed with 502 Bad Gateway.")
-                    if attempt < retries:
-                        time.sleep(config.retry_delay)
-                        continue
-                raise e  # Re-raise if not 502 or retries exhausted
+        fetched = fetchAsset(filename, url, session, retries, archive, headers or None)
+        if fetched is None:
+            logger.info(f"{url} is not modified so copied it from {previous.path}.")
+            previous.reuse(url, filename, archive, journal)
+        else:
+            if store is not None and archive is None:
+                store.add(url, filename, *fetched[:2])
+            if journal is not None:
+                journal.record(url, filename, *fetched)
+
+
+def downloadTile(filename, url, session, archive=None, journal=None, store=None):
+    try:
+        downloadAsset(filename, url, session, archive=archive, journal=journal, store=store)
+    except requests.exceptions.HTTPError as e:
+        logger.warning(f"Failed to get {url} due to {e.response.status_code}, skipping.")
+        session.metrics.failure(url, e.response.status_code)
+
+
+def buildPyramid(imageDir, infoJson, session, pyramid, archive=None, journal=None):
+    """Download the whole image once and cut the tiles from it locally rather than asking the server for each one.
+
+    info.json is rewritten to describe the generated files as a level 0 service.
+    """
+    # When streaming the tiles are cut in a temporary directory and then moved into the zip
+    workDir = imageDir if archive is None else tempfile.mkdtemp()
+    try:
+        # Tiles a resumed run already has aren't cut again, and if it has them all the image isn't downloaded
+        urls = list(infoJson.iterTileUrls())
+        done = {url for url in urls if isDownloaded(url.replace(infoJson.id, imageDir), url, archive, journal)}
+        source = os.path.join(workDir, "source" + PARTIAL_SUFFIX)
+        if len(done) < len(urls):
+            downloadAsset(source, infoJson.maxImageUrl(), session)
+
+        files = pyramid.build(source, workDir, infoJson, skip=done)
+        if os.path.exists(source):
+            os.remove(source)
+
+        for url, filename, size, sha256 in files:
+            name = filename.replace(workDir, imageDir)
+            if archive is not None:
+                with open(filename, "rb") as f:
+                    archive.write(name, f)
+            if journal is not None:
+                journal.record(url, name, size, sha256)
+
+        if archive is None:
+            infoJson.save(os.path.join(imageDir, "info.json"))
+        else:
+            archive.writestr(os.path.join(imageDir, "info.json"), dumpJson(infoJson.data))
+    finally:
+        if archive is not None:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+
+def loadInfoJson(url, imageDir, session, archive=None, plan=None):
+    """The info.json of the IIIF image at url, from plan (a Plan) if it has it, otherwise fetched and, without an archive, saved in imageDir."""
+    data = plan.infoJson(url) if plan is not None else None
+    if data is not None:
+        # A copy as making a pyramid rewrites it
+        data = copy.deepcopy(data)
+        if archive is None:
+            os.makedirs(imageDir, exist_ok=True)
+            writeJson(data, os.path.join(imageDir, "info.json"))
+        return infoJson_factory(data)
+    elif archive is None:
+        os.makedirs(imageDir, exist_ok=True)
+        return infoJson_factory(saveJson(f"{url}/info.json", os.path.join(imageDir, "info.json"), session))
+    else:
+        # Not added to the zip until we know whether it will be rewritten
+        return infoJson_factory(fetchJson(f"{url}/info.json", session))
+
+
+def downloadIIIF(imageDir, url, session, tasks=None, archive=None, journal=None, pyramid=None, store=None, previous=None, plan=None):
+    """Download the info.json and every tile of a IIIF Image service into imageDir.
+
+    If tasks (a TaskGroup) is given the tiles are queued on it rather than fetched here,
+    so they run alongside the tiles of every other canvas. If pyramid (a PyramidBuilder) is given
+    and the server allows it the full image is downloaded once and the tiles are made locally.
+    If previous (a PreviousArchive) has the image with the same info.json its files are copied from there instead.
+    If plan (a Plan) has the info.json it is used rather than fetching it again.
+    """
+    with span("info.json", "image", url=url):
+        infoJson = loadInfoJson(url, imageDir, session, archive, plan)
+
+    digest = jsonDigest(infoJson.data)
+    if journal is not None:
+        # The info.json as the server sent it, so a later update can tell whether the image has changed
+        journal.record(f"{url}/info.json", os.path.join(imageDir, "info.json"), len(dumpJson(infoJson.data)), digest)
+
+    if previous is not None and previous.reuseImage(url, imageDir, digest, archive, journal):
+        return
+
+    if pyramid is not None and infoJson.allowsFullSize():
+        with span("pyramid", "image", url=url):
+            buildPyramid(imageDir, infoJson, session, pyramid, archive, journal)
+        return
+
+    if archive is not None:
+        archive.writestr(os.path.join(imageDir, "info.json"), dumpJson(infoJson.data))
+
+    downloadTiles(imageDir, infoJson, session, tasks, archive, journal, store)
 
-    return filename
 
+def isStatic(infoJson) -> bool:
+    """Whether the image's tiles are downloaded as static files, which also limits them to the declared sizes."""
+    return get_config().no_delay_level0 and infoJson.isLevel0()
 
-def downloadIIIF(imageDir, url):
-    os.makedirs(imageDir, exist_ok=True)
-    # Download info.json
-    infoJson = infoJson_factory(saveJson(f"{url}/info.json", os.path.join(imageDir, "info.json")))
 
-    urls = infoJson.tileUrls()
-    for url in urls:
+def downloadTiles(imageDir, infoJson, session, tasks=None, archive=None, journal=None, store=None, start=0, stop=None):
+    """Download the tiles of infoJson into imageDir, or only tiles start to stop in the order iterTileUrls gives them."""
+    config = get_config()
+    level0 = isStatic(infoJson)
+    if level0:
+        # Static files, usually on a CDN, so there is no need to be as gentle
+        logger.info(f"{infoJson.id} is a level 0 image so downloading without a delay.")
+        session.rate.addStatic(infoJson.id, 0, config.level0_per_host)
+
+    for url in itertools.islice(infoJson.iterTileUrls(declaredOnly=level0), start, stop):
         filename = url.replace(infoJson.id, imageDir)
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if archive is None:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-        try:
-            downloadAsset(filename, url)
-        except requests.exceptions.HTTPError as e:
-            print(f"Failed to get {url} due to {e.response.status_code}, skipping.")
+        if tasks is None:
+            downloadTile(filename, url, session, archive, journal, store)
+        elif level0:
+            tasks.submitStatic(downloadTile, filename, url, session, archive, journal, store)
+        else:
+            tasks.submit(downloadTile, filename, url, session, archive, journal, store)
+
+
+def localName(container, names):
+    """The name container is saved under. Different URLs with the same basename get a suffix made from their URL."""
+    name = container.filename
+    if names.setdefault(name, container.url) != container.url:
+        stem, extension = os.path.splitext(name)
+        name = f"{stem}-{hashlib.sha1(container.url.encode('utf-8')).hexdigest()[:8]}{extension}"
+        names[name] = container.url
+
+    return name
+
+
+@contextmanager
+def jobWorkers(scheduler=None, pyramid=None):
+    """The Scheduler and PyramidBuilder for a job. Ones that aren't shared with other jobs are made for it and shut down after."""
+    config = get_config()
+    with ExitStack() as stack:
+        if scheduler is None:
+            scheduler = stack.enter_context(create_scheduler(config))
+        if pyramid is None and config.local_pyramid:
+            pyramid = stack.enter_context(PyramidBuilder(config.pyramid_workers))
+        yield scheduler, pyramid
+
+
+def downloadContainers(manifest, downloadDir, session, archive=None, journal=None, store=None, previous=None, scheduler=None, pyramid=None, plan=None):
+    """Download every container in the manifest and point the manifest at the local copies.
+
+    scheduler and pyramid can be shared with other jobs running at the same time, otherwise they are made for this one.
+    """
+    with jobWorkers(scheduler, pyramid) as (scheduler, pyramid):
+        session.metrics.gauge("queue_depth", lambda: scheduler.queued)
+        session.metrics.gauge("tasks_running", lambda: scheduler.running)
+        tasks = scheduler.group()
+        names = {}
+        submitted = set()
+        with stage("download containers", manifest=manifest.id):
+            for container in manifest.containers():
+                name = localName(container, names)
+                if name in submitted:
+                    # Another canvas uses the same image, so share the copy it downloads
+                    container.url = name
+                    continue
+
+                logger.info(f"Downloading {container.url}")
+                if container.isDownloadable():
+                    tasks.submit(downloadAsset, os.path.join(downloadDir, name), container.url, session, archive=archive, journal=journal, store=store, previous=previous)
+                else:
+                    # Content is a IIIF Image
+                    tasks.submit(downloadIIIF, os.path.join(downloadDir, name), container.url, session, tasks, archive, journal, pyramid, store, previous, plan)
+
+                submitted.add(name)
+                container.url = name
+
+            tasks.wait()
+
+
+def sources(journal, root):
+    """What goes in the archive's sources.json: each URL downloaded with the entry it became and how to check it later."""
+    return {
+        url: {
+            "name": os.path.relpath(filename, root).replace(os.sep, "/"),
+            "size": size,
+            "sha256": sha256,
+            "etag": etag,
+            "lastModified": lastModified,
+            **({"md5": md5} if md5 else {})
+        }
+        for url, filename, size, sha256, etag, lastModified, md5 in journal.rows()
+    }
+
+
+def knownChecksums(sourcesData):
+    """Map each entry in sources to the (sha256, md5) taken as it was downloaded."""
+    return {source["name"]: (source["sha256"], source.get("md5")) for source in sourcesData.values()}
+
+
+def streamDownload(data, zipFileName, downloadDir, session, previous=None, **shared):
+    config = get_config()
+    # Written under a temporary name so an interrupted run, or an update of the same file, never leaves a broken zip
+    with ZipStream(zipFileName + PARTIAL_SUFFIX, downloadDir, config.compress_level, config.checksum_md5) as archive, Journal(":memory:") as journal:
+        manifest = manifest_factory(data)
+        downloadContainers(manifest, downloadDir, session, archive, journal, previous=previous, **shared)
+
+        with stage("save manifest"):
+            sourcesData = sources(journal, downloadDir)
+            archive.writestr(os.path.join(downloadDir, SOURCES), dumpJson(sourcesData))
+
+            known = knownChecksums(sourcesData)
+            checksums = {name: archive.checksums.get(name) or known[name] for name in archive.names()}
+            manifestData = dumpJson(manifest.data)
+            checksums["manifest.json"] = hashStream(io.BytesIO(manifestData), config.checksum_md5)
+            for name, bag in bagManifests(checksums, config.checksum_md5).items():
+                archive.writestr(os.path.join(downloadDir, name), bag)
+            # Added after every container has been downloaded as it is only complete then
+            archive.writestr(os.path.join(downloadDir, "manifest.json"), manifestData)
 
+    os.replace(zipFileName + PARTIAL_SUFFIX, zipFileName)
 
-def download(url, zipFileName, scratch, deleteScratch=True):
+
+def checkEngine(config, streaming, pyramid):
+    if config.engine not in ("threads", "asyncio"):
+        raise ValueError(f"Unknown download engine {config.engine}, expected threads or asyncio")
+    if config.engine == "asyncio" and (streaming or pyramid is not None or config.local_pyramid):
+        raise ValueError("The asyncio engine only downloads to the scratch directory, it can't stream, update or use local_pyramid")
+
+
+def directoryDownload(data, zipFileName, downloadDir, journalPath, session, store=None, scheduler=None, pyramid=None, plan=None):
+    """Download the manifest data into downloadDir and then zip it, with the engine set in the config."""
+    os.makedirs(downloadDir, exist_ok=True)
+    manifest = manifest_factory(data)
+    with Journal(journalPath) as journal:
+        if get_config().engine == "asyncio":
+            # Imported here as it needs aiohttp, which is optional
+            from .aio import downloadContainers as downloadAsync
+
+            with stage("download containers", engine="asyncio"):
+                downloadAsync(manifest, downloadDir, journal, store, session.metrics, plan)
+        else:
+            downloadContainers(manifest, downloadDir, session, journal=journal, store=store, scheduler=scheduler, pyramid=pyramid, plan=plan)
+
+        with stage("save manifest"):
+            sourcesData = sources(journal, downloadDir)
+            with open(os.path.join(downloadDir, SOURCES), "wb") as f:
+                f.write(dumpJson(sourcesData))
+
+            manifest.save(os.path.join(downloadDir, "manifest.json"))
+            writeBagManifests(downloadDir, listFiles(downloadDir), knownChecksums(sourcesData), get_config().checksum_md5)
+
+    zip(downloadDir, zipFileName)
+
+
+def fetchManifest(url, session, plan=None, filename=None):
+    """The manifest at url, from the plan if there is one, otherwise fetched and saved to filename if it is given."""
+    if plan is not None:
+        return copy.deepcopy(plan.manifest)
+    elif filename is not None:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        return saveJson(url, filename, session)
+    else:
+        return fetchJson(url, session)
+
+
+def download(url, zipFileName, scratch, deleteScratch=True, stream=False, updateFrom=None, session=None, scheduler=None, pyramid=None, store=None, plan=None):
     """Downloads and processes a IIIF manifest from the given URL and stores the result in a zip file.
 
+    If url is a IIIF Collection every manifest in it, and in the collections under it, is archived to its own
+    zip file in a directory named after zipFileName, with an index.json of the collection.
+
     Args:
-        url (str): The URL of the IIIF manifest to download.
+        url (str): The URL of the IIIF manifest or collection to download.
         zipFileName (str): The name of the output zip file (e.g., "output.zip").
         scratch (str, optional): Directory to store temporary files. Defaults to "downloads".
         deleteScratch (bool, optional): Whether to delete the scratch directory after completion. Defaults to True.
+        stream (bool, optional): Write each download straight into the zip rather than the scratch directory. Defaults to False.
+        updateFrom (str, optional): An earlier zip of this manifest. Entries that haven't changed are copied from it
+            rather than downloaded, and the new zip is streamed. May be the same file as zipFileName. Defaults to None.
+        session (ArchiveSession, optional): Session shared with other jobs, so they share connections and rate limits.
+            Defaults to a new session for this job.
+        scheduler (Scheduler, optional): Download workers shared with other jobs. Defaults to a new Scheduler.
+        pyramid (PyramidBuilder, optional): Tile cutting processes shared with other jobs. Defaults to a new one if local_pyramid is set.
+        store (BlobStore, optional): Blob store shared with other jobs. Defaults to opening blob_dir if it is set.
+        plan (Plan, optional): A plan made for url by planner.makePlan. Its manifest and info.json files are used
+            rather than fetching them again. Defaults to None.
 
     Returns:
-        None
+        str: The zip file, or the directory of zip files for a collection.
 
     Raises:
         requests.HTTPError: If the download fails.
@@ -114,26 +528,44 @@ def download(url, zipFileName, scratch, deleteScratch=True):
     # Config.get("locations", "scratch_dir")
     downloadDir = os.path.join(scratch, dirname)
 
-    os.makedirs(downloadDir, exist_ok=True)
-
-    logger.info(f"Downloading {url}")
-    manifest_json = saveJson(url, os.path.join(downloadDir, "manifest.json"))
-    manifest = manifest_factory(manifest_json)
-
-    for container in manifest.containers():
-        logger.info(f"Downloading {container.url}")
-        if container.isDownloadable():
-            downloadAsset(os.path.join(downloadDir, container.filename), container.url)
-
-            container.url = container.filename
+    config = get_config()
+    with ExitStack() as stack:
+        if session is None:
+            session = stack.enter_context(create_session(config))
+        if store is None and config.blob_dir:
+            # Shared with every other job using the same blob_dir so overlapping archives only download files once
+            store = stack.enter_context(BlobStore(config.blob_dir, config.blob_max_size * 1024 * 1024))
+        shared = {"store": store, "scheduler": scheduler, "pyramid": pyramid}
+        jobShared = {**shared, "plan": plan}
+
+        logger.info(f"Downloading {url}")
+        if plan is not None and plan.url != url:
+            raise ValueError(f"The plan is for {plan.url} not {url}")
+        checkEngine(config, stream or updateFrom is not None, pyramid)
+
+        # Kept beside the journal rather than in downloadDir, whose manifest.json has the container URLs
+        # rewritten to local names, so a resumed run looks up the URLs the journal recorded
+        original = None if stream or updateFrom is not None else os.path.join(scratch, f"{dirname}.manifest.json")
+        with stage("fetch manifest", url=url):
+            data = fetchManifest(url, session, plan, original)
+
+        if isCollection(data):
+            # Imported here as archiving a collection runs a batch of downloads
+            from .collection import downloadCollection
+
+            shutil.rmtree(downloadDir, ignore_errors=True)
+            if original is not None and os.path.exists(original):
+                os.remove(original)
+            return downloadCollection(url, data, zipFileName[:-len(".zip")], scratch, stream, session=session, **shared)
+
+        if updateFrom is not None:
+            # Unchanged entries are copied raw, which can only be done straight into the new zip
+            with PreviousArchive(updateFrom) as previous:
+                streamDownload(data, zipFileName, downloadDir, session, previous, **jobShared)
+        elif stream:
+            streamDownload(data, zipFileName, downloadDir, session, **jobShared)
         else:
-            # Content is a IIIF Image
-            downloadIIIF(os.path.join(downloadDir, container.filename), container.url)
-
-            container.url = container.filename
-
-    manifest.save(os.path.join(downloadDir, "manifest.json"))
-
-    zip(downloadDir, zipFileName)
+            # The journal is kept outside downloadDir so it isn't added to the zip
+            directoryDownload(data, zipFileName, downloadDir, os.path.join(scratch, f"{dirname}.journal"), session, **jobShared)
 
     return zipFileName
@@ -0,0 +1,100 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+# BagIt payload manifests, one line of "<checksum>  <path>" for each file in the archive
+BAG_MANIFESTS = {"sha256": "manifest-sha256.txt", "md5": "manifest-md5.txt"}
+READ_SIZE = 1024 * 1024
+
+
+class Checksums:
+    """The SHA-256, and the MD5 if asked for, of bytes fed to it as they stream past."""
+
+    def __init__(self, md5: bool = False):
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5(usedforsecurity=False) if md5 else None
+
+    def update(self, data):
+        self._sha256.update(data)
+        if self._md5 is not None:
+            self._md5.update(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def md5(self) -> Optional[str]:
+        return self._md5.hexdigest() if self._md5 is not None else None
+
+
+def hashStream(f, md5: bool = False) -> Tuple[str, Optional[str]]:
+    """(SHA-256, MD5) of what is left to read in f, the MD5 is None unless asked for."""
+    checksums = Checksums(md5)
+    while chunk := f.read(READ_SIZE):
+        checksums.update(chunk)
+    return checksums.sha256, checksums.md5
+
+
+def hashFile(path: str, md5: bool = False) -> Tuple[str, Optional[str]]:
+    with open(path, "rb") as f:
+        return hashStream(f, md5)
+
+
+def needsHashing(name: str, known: Optional[Tuple[str, Optional[str]]], md5: bool) -> bool:
+    # The journal has a digest of each info.json's data rather than of the file, so JSON is always hashed as written
+    return known is None or name.endswith(".json") or (md5 and known[1] is None)
+
+
+def formatBagManifest(checksums: Dict[str, str]) -> bytes:
+    """A BagIt manifest of checksums, a map of each path in the archive to its checksum."""
+    return "".join(f"{checksum}  {name}\n" for name, checksum in sorted(checksums.items())).encode("utf-8")
+
+
+def bagManifests(checksums: Dict[str, Tuple[str, Optional[str]]], md5: bool = False) -> Dict[str, bytes]:
+    """The BagIt manifest files for checksums, a map of each path in the archive to its (SHA-256, MD5)."""
+    manifests = {BAG_MANIFESTS["sha256"]: formatBagManifest({name: sha256 for name, (sha256, _) in checksums.items()})}
+    if md5:
+        manifests[BAG_MANIFESTS["md5"]] = formatBagManifest({name: digest for name, (_, digest) in checksums.items()})
+    return manifests
+
+
+def parseBagManifest(data: bytes) -> Dict[str, str]:
+    """Map each path in a BagIt manifest to its checksum."""
+    checksums = {}
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            checksum, name = line.split(None, 1)
+            checksums[name.strip()] = checksum
+    return checksums
+
+
+def rewriteBagManifest(data: bytes, algorithm: str, entries: Dict[str, bytes]) -> bytes:
+    """The BagIt manifest data with the checksums of entries, a map of paths to their new contents, updated."""
+    checksums = parseBagManifest(data)
+    for name, content in entries.items():
+        if name in checksums:
+            checksums[name] = hashlib.new(algorithm, content, usedforsecurity=False).hexdigest()
+    return formatBagManifest(checksums)
+
+
+def directoryChecksums(files: List[Tuple[str, str]], known: Dict[str, Tuple[str, Optional[str]]], md5: bool = False) -> Dict[str, Tuple[str, Optional[str]]]:
+    """Checksums of files, a list of (path, name in the archive).
+
+    known maps names to the checksums taken while they were downloaded, only the files it doesn't
+    cover, which are mostly the small JSON files, are read again.
+    """
+    checksums = {}
+    for path, name in files:
+        name = name.replace(os.sep, "/")
+        if name not in BAG_MANIFESTS.values():
+            found = known.get(name)
+            checksums[name] = hashFile(path, md5) if needsHashing(name, found, md5) else found
+    return checksums
+
+
+def writeBagManifests(root: str, files: List[Tuple[str, str]], known: Dict[str, Tuple[str, Optional[str]]], md5: bool = False):
+    """Write the BagIt manifests of files, which are under root, into root so they are zipped with them."""
+    for name, data in bagManifests(directoryChecksums(files, known, md5), md5).items():
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(data)
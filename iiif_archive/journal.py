@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+
+class Journal:
+    """Records every URL an archive job has finished downloading, with its size and SHA-256.
+
+    Resuming a job is then a lookup in the journal rather than a stat of every file, and a file
+    only gets an entry once it has been completely written so a partial download is never reused.
+    The journal is a SQLite database kept next to the job's scratch directory. The ETag and
+    Last-Modified the server sent are kept too so a later update can ask whether a file has changed,
+    as is the MD5 if the archive is to have one.
+    A shared journal is used by processes on several machines so it keeps SQLite's default rollback
+    journal, as WAL only works on one machine. If root is given filenames are stored relative to it,
+    and returned joined to it, so machines that mount the directory in different places can share it.
+    """
+
+    def __init__(self, path: str, shared: bool = False, root: Optional[str] = None):
+        self.path = path
+        self.root = root
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if not shared:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS downloads (url TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL, etag TEXT, last_modified TEXT, md5 TEXT)")
+        # Journals written before the validators and MD5 were recorded
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(downloads)")]
+        for column in ("etag", "last_modified", "md5"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE downloads ADD COLUMN {column} TEXT")
+        self._lock = threading.Lock()
+
+    def _store(self, filename: str) -> str:
+        return os.path.relpath(filename, self.root).replace(os.sep, "/") if self.root is not None else filename
+
+    def _load(self, filename: str) -> str:
+        # Journals written before root was used have absolute paths, which join leaves as they are
+        return os.path.normpath(os.path.join(self.root, filename)) if self.root is not None else filename
+
+    def get(self, url: str) -> Optional[Tuple[str, int, str]]:
+        """Return (filename, size, sha256) if url has been downloaded."""
+        with self._lock:
+            row = self._conn.execute("SELECT filename, size, sha256 FROM downloads WHERE url = ?", (url,)).fetchone()
+        return (self._load(row[0]),) + row[1:] if row else None
+
+    def isComplete(self, url: str) -> bool:
+        return self.get(url) is not None
+
+    def record(self, url: str, filename: str, size: int, sha256: str, etag: Optional[str] = None, lastModified: Optional[str] = None, md5: Optional[str] = None):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO downloads (url, filename, size, sha256, etag, last_modified, md5) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (url, self._store(filename), size, sha256, etag, lastModified, md5))
+
+    def rows(self) -> List[Tuple[str, str, int, str, Optional[str], Optional[str], Optional[str]]]:
+        """Every (url, filename, size, sha256, etag, last_modified, md5) recorded, ordered by url."""
+        with self._lock:
+            rows = self._conn.execute("SELECT url, filename, size, sha256, etag, last_modified, md5 FROM downloads ORDER BY url").fetchall()
+        return [(url, self._load(filename), *rest) for url, filename, *rest in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the request duration histogram buckets, as Prometheus' le labels
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The upper bound of the bucket holding the q quantile, None if nothing has been observed."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+
+    def cumulative(self):
+        """(le, count) pairs as Prometheus expects them."""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else str(bound)), total
+
+
+class HostMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.responses = Counter()
+        self.errors = 0
+        self.retries = Counter()
+        self.failures = Counter()
+        self.files = 0
+        self.bytes = 0
+        self.latency = Histogram()
+
+    def toJson(self, elapsed: float) -> Dict:
+        return {
+            "requests": self.requests,
+            "responses": {str(status): count for status, count in sorted(self.responses.items())},
+            "errors": self.errors,
+            "retries": {str(status): count for status, count in sorted(self.retries.items())},
+            "failures": {str(status): count for status, count in sorted(self.failures.items())},
+            "files": self.files,
+            "bytes": self.bytes,
+            "files_per_second": self.files / elapsed if elapsed else 0,
+            "bytes_per_second": self.bytes / elapsed if elapsed else 0,
+            "latency": {
+                "count": self.latency.count,
+                "sum": self.latency.sum,
+                "mean": self.latency.sum / self.latency.count if self.latency.count else None,
+                "p50": self.latency.quantile(0.5),
+                "p95": self.latency.quantile(0.95),
+                "buckets": dict(self.latency.cumulative())
+            }
+        }
+
+
+class Request:
+    """One request being timed, see Metrics.request."""
+
+    def __init__(self):
+        self.status = None
+
+    def observe(self, response):
+        self.status = response.status_code
+
+
+class Metrics:
+    """Counters and request duration histograms for each host a session talks to.
+
+    Kept on the session so every job sharing it adds to the same figures. Everything is counted
+    under a lock so the download workers can all report at once. gauges are read when a snapshot
+    is taken, for figures such as the scheduler's queue depth that are owned elsewhere.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._hosts = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> HostMetrics:
+        # Called holding the lock
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = HostMetrics()
+        return self._hosts[host]
+
+    @contextmanager
+    def request(self, url: str):
+        """Time a request to url. Pass the response to observe() once there is one, a request that never gets one is an error."""
+        request = Request()
+        started = time.monotonic()
+        try:
+            yield request
+        finally:
+            duration = time.monotonic() - started
+            with self._lock:
+                host = self._host(url)
+                host.requests += 1
+                if request.status is None:
+                    host.errors += 1
+                else:
+                    host.responses[request.status] += 1
+                    host.latency.observe(duration)
+
+    def received(self, url: str, size: int):
+        """A file of size bytes was downloaded from url."""
+        with self._lock:
+            host = self._host(url)
+            host.files += 1
+            host.bytes += size
+
+    def retry(self, url: str, status: int):
+        with self._lock:
+            self._host(url).retries[status] += 1
+
+    def failure(self, url: str, status: int):
+        """Gave up on url after the server answered with status."""
+        with self._lock:
+            self._host(url).failures[status] += 1
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Report read() as name in every snapshot. Registering a name again replaces it."""
+        with self._lock:
+            self._gauges[name] = read
+
+    def snapshot(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            hosts = {host: metrics.toJson(elapsed) for host, metrics in sorted(self._hosts.items())}
+            gauges = {name: read() for name, read in self._gauges.items()}
+
+        files = sum(host["files"] for host in hosts.values())
+        size = sum(host["bytes"] for host in hosts.values())
+        return {
+            "elapsed": elapsed,
+            "requests": sum(host["requests"] for host in hosts.values()),
+            "files": files,
+            "bytes": size,
+            "files_per_second": files / elapsed if elapsed else 0,
+            "bytes_per_second": size / elapsed if elapsed else 0,
+            "gauges": gauges,
+            "hosts": hosts
+        }
+
+    def prometheus(self) -> str:
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE iiif_archive_elapsed_seconds gauge",
+            f"iiif_archive_elapsed_seconds {snapshot['elapsed']}"
+        ]
+        for name, value in snapshot["gauges"].items():
+            lines += [f"# TYPE iiif_archive_{name} gauge", f"iiif_archive_{name} {value}"]
+
+        counters = (
+            ("requests_total", "requests", None),
+            ("errors_total", "errors", None),
+            ("files_total", "files", None),
+            ("bytes_total", "bytes", None),
+            ("responses_total", "responses", "status"),
+            ("retries_total", "retries", "status"),
+            ("failures_total", "failures", "status")
+        )
+        for name, key, label in counters:
+            lines.append(f"# TYPE iiif_archive_{name} counter")
+            for host, metrics in snapshot["hosts"].items():
+                if label is None:
+                    lines.append(f'iiif_archive_{name}{{host="{host}"}} {metrics[key]}')
+                else:
+                    lines += [f'iiif_archive_{name}{{host="{host}",{label}="{value}"}} {count}' for value, count in metrics[key].items()]
+
+        lines.append("# TYPE iiif_archive_request_duration_seconds histogram")
+        for host, metrics in snapshot["hosts"].items():
+            latency = metrics["latency"]
+            lines += [f'iiif_archive_request_duration_seconds_bucket{{host="{host}",le="{le}"}} {count}' for le, count in latency["buckets"].items()]
+            lines.append(f'iiif_archive_request_duration_seconds_sum{{host="{host}"}} {latency["sum"]}')
+            lines.append(f'iiif_archive_request_duration_seconds_count{{host="{host}"}} {latency["count"]}')
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Write the metrics to path, as JSON if it ends .json and in the Prometheus text format otherwise."""
+        text = json.dumps(self.snapshot(), indent=4) if path.endswith(".json") else self.prometheus()
+        # Replaced in one go so whatever is reading it never sees half a file
+        with open(path + ".part", "w") as f:
+            f.write(text)
+        os.replace(path + ".part", path)
+
+    def summary(self) -> str:
+        """A line for each host, slowest first, so the bottleneck is at the top."""
+        snapshot = self.snapshot()
+        lines = [f"{snapshot['requests']} requests, {snapshot['files']} files, {snapshot['bytes'] / 1e6:.1f} MB in {snapshot['elapsed']:.0f}s ({snapshot['files_per_second']:.1f} files/s)"]
+        hosts = sorted(snapshot["hosts"].items(), key=lambda item: item[1]["latency"]["mean"] or 0, reverse=True)
+        for host, metrics in hosts:
+            mean = metrics["latency"]["mean"]
+            lines.append(
+                f"  {host}: {metrics['requests']} requests, {metrics['files_per_second']:.1f} files/s, "
+                f"{metrics['bytes'] / 1e6:.1f} MB, mean {mean or 0:.2f}s, p95 <= {metrics['latency']['p95'] or 0}s, "
+                f"{sum(metrics['retries'].values())} retries, {sum(metrics['failures'].values())} failed, {metrics['errors']} errors"
+            )
+        return "\n".join(lines)
+
+
+class MetricsReporter:
+    """Writes metrics to path every interval seconds on a background thread, and once more when closed."""
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="iiif-archive-metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.metrics.write(self.path)
+            except OSError as e:
+                logger.warning(f"Unable to write metrics to {self.path}: {e}")
+
+    def close(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.metrics.write(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,57 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+
+class Collection(ABC):
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    @property
+    @abstractmethod
+    def id(self) -> str:
+        pass
+
+    @property
+    def label(self):
+        return self.data.get("label")
+
+    @abstractmethod
+    def members(self) -> List[Dict[str, Any]]:
+        """The Collections and Manifests in this Collection, in order, as {"id", "type", "label"} with type Collection or Manifest."""
+        pass
+
+    def collections(self) -> List[str]:
+        return [member["id"] for member in self.members() if member["type"] == "Collection"]
+
+    def manifests(self) -> List[str]:
+        return [member["id"] for member in self.members() if member["type"] == "Manifest"]
+
+
+class Collection2(Collection):
+    TYPES = {"sc:Collection": "Collection", "sc:Manifest": "Manifest"}
+
+    @property
+    def id(self) -> str:
+        return self.data["@id"]
+
+    def members(self):
+        # members lists both in order, older collections use separate collections and manifests lists
+        members = self.data.get("members") or self.data.get("collections", []) + self.data.get("manifests", [])
+        return [
+            {"id": member["@id"], "type": self.TYPES[member["@type"]], "label": member.get("label")}
+            for member in members
+            if member.get("@type") in self.TYPES
+        ]
+
+
+class Collection3(Collection):
+    @property
+    def id(self) -> str:
+        return self.data["id"]
+
+    def members(self):
+        return [
+            {"id": item["id"], "type": item["type"], "label": item.get("label")}
+            for item in self.data.get("items", [])
+            if item.get("type") in ("Collection", "Manifest")
+        ]
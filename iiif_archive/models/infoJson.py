@@ -30,29 +30,122 @@ class InfoJson(ABC):
     def isLevel0(self) -> bool:
         pass
 
-    def tileUrls(self):
-        tiles = self.data["tiles"][0]
-        tileWidth = tiles["width"]
-        if "height" in tiles:
-            tileHeight = tiles["height"]
-        else:
-            tileHeight = tileWidth
+    @abstractmethod
+    def setLevel0(self, sizes):
+        """Describe this image as a level 0 service made up of its tiles and the given (width, height) sizes."""
+        pass
+
+    @abstractmethod
+    def maxImageUrl(self) -> str:
+        """URL of the whole image at full resolution."""
+        pass
+
+    def allowsFullSize(self) -> bool:
+        """Whether the server will return the whole image at full resolution in one request."""
+        if self.isLevel0():
+            return False
+        if self.data.get("maxWidth", self.width) < self.width or self.data.get("maxHeight", self.height) < self.height:
+            return False
+
+        return self.data.get("maxArea", self.width * self.height) >= self.width * self.height
+
+    def _setSizes(self, sizes):
+        self.data["sizes"] = [{"width": width, "height": height} for width, height in sizes]
+        for limit in ("maxWidth", "maxHeight", "maxArea"):
+            self.data.pop(limit, None)
+
+    def tileLevels(self):
+        """Each distinct (scaleFactor, tileWidth, tileHeight) declared across every entry in tiles."""
+        levels = []
+        for tiles in self.data.get("tiles", []):
+            tileWidth = tiles["width"]
+            if "height" in tiles:
+                tileHeight = tiles["height"]
+            else:
+                tileHeight = tileWidth
+
+            # structure is the same for both versions
+            for scaleFactor in tiles["scaleFactors"]:
+                if (scaleFactor, tileWidth, tileHeight) not in levels:
+                    levels.append((scaleFactor, tileWidth, tileHeight))
+
+        return levels
+
+    def declaredSizes(self):
+        return [(size["width"], size["height"]) for size in self.data.get("sizes", [])]
+
+    def tileRequests(self, declaredOnly=False):
+        """Lazily yield (region, sizeWidth, sizeHeight) for every distinct image request the tiles and sizes describe.
+
+        region is "full" or a (left, top, width, height) tuple. Requests are generated one at a time
+        so nothing is held in memory apart from the handful of full image sizes. A tile can only repeat
+        one from an earlier level if that level cuts the same region, which is checked arithmetically.
+        With declaredOnly a scale factor small enough to fit in one tile is only requested as a full
+        image if it is listed in sizes, as a level 0 server has no other sizes to give.
+        """
+        fullImages = set()
+        sizes = self.declaredSizes()
+        levels = self.tileLevels()
+        for index, level in enumerate(levels):
+            for region, sizeWidth, sizeHeight in self.iterScaleTiles(*level):
+                if region == "full":
+                    url = self.buildImage(sizeWidth=sizeWidth, sizeHeight=sizeHeight)
+                    if url in fullImages or (declaredOnly and sizes and (sizeWidth, sizeHeight) not in sizes):
+                        continue
+                    fullImages.add(url)
+                elif self._repeatsLevel(levels[:index], region, sizeWidth, sizeHeight):
+                    continue
+
+                yield region, sizeWidth, sizeHeight
+
+        for sizeWidth, sizeHeight in sizes:
+            url = self.buildImage(sizeWidth=sizeWidth, sizeHeight=sizeHeight)
+            if url not in fullImages:
+                fullImages.add(url)
+                yield "full", sizeWidth, sizeHeight
+
+    def _repeatsLevel(self, levels, region, sizeWidth, sizeHeight):
+        left, top, width, height = region
+        url = None
+        for scaleFactor, tileWidth, tileHeight in levels:
+            scaledTileWidth = scaleFactor * tileWidth
+            scaledTileHeight = scaleFactor * tileHeight
+            if math.ceil(self.width / scaleFactor) <= tileWidth or left % scaledTileWidth or top % scaledTileHeight:
+                continue
+            if width != min(scaledTileWidth, self.width - left) or height != min(scaledTileHeight, self.height - top):
+                continue
 
-        urls = []
-        # structure is the same for both versions
-        for scaleFactor in tiles["scaleFactors"]:
-            urls += self.scaleTiles(scaleFactor, tileWidth, tileHeight)
+            # Same region so compare the URLs as v2 doesn't include the height in the size
+            url = url or self.tileUrl(region, sizeWidth, sizeHeight)
+            if url == self.tileUrl(region, math.ceil(width / scaleFactor), math.ceil(height / scaleFactor)):
+                return True
 
-        return urls
+        return False
 
-    def scaleTiles(self, scaleFactor, tileWidth, tileHeight):
-        urls = []
+    def tileUrl(self, region, sizeWidth, sizeHeight):
+        if region != "full":
+            region = ",".join(str(value) for value in region)
+
+        return self.buildImage(region=region, sizeWidth=sizeWidth, sizeHeight=sizeHeight)
+
+    def iterTileUrls(self, declaredOnly=False):
+        for region, sizeWidth, sizeHeight in self.tileRequests(declaredOnly):
+            yield self.tileUrl(region, sizeWidth, sizeHeight)
+
+    def tileCount(self, declaredOnly=False) -> int:
+        """Number of URLs iterTileUrls() will yield, counted without building them."""
+        return sum(1 for _ in self.tileRequests(declaredOnly))
+
+    def tileUrls(self):
+        return list(self.iterTileUrls())
+
+    def iterScaleTiles(self, scaleFactor, tileWidth, tileHeight):
         scaledWidth = math.ceil(self.width / scaleFactor)
         scaledHeight = math.ceil(self.height / scaleFactor)
         # Work out if resulting image is smaller than the tileWidth
         if scaledWidth <= tileWidth:
             # ask for the full size
-            urls.append(self.buildImage(sizeWidth=scaledWidth, sizeHeight=scaledHeight))
+            yield "full", scaledWidth, scaledHeight
         else:
             scaledTileWidth = scaleFactor * tileWidth
             scaledTileHeight = scaleFactor * tileHeight
@@ -72,10 +165,10 @@ class InfoJson(ABC):
                     if top + height > self.height:
                         height = self.height - top
 
-                    region = f"{left},{top},{width},{height}"
-                    urls.append(self.buildImage(region=region, sizeWidth=math.ceil(width / scaleFactor), sizeHeight=math.ceil(height / scaleFactor)))
+                    yield (left, top, width, height), math.ceil(width / scaleFactor), math.ceil(height / scaleFactor)
 
-        return urls
+    def scaleTiles(self, scaleFactor, tileWidth, tileHeight):
+        return [self.tileUrl(*request) for request in self.iterScaleTiles(scaleFactor, tileWidth, tileHeight)]
 
     @abstractmethod
     def buildImage(self, region="full", sizeWidth=0, sizeHeight=0, rotation=0, quality="default", format="jpg"):
@@ -100,6 +193,13 @@ class InfoJson2(InfoJson):
     def buildImage(self, region="full", sizeWidth=0, sizeHeight=0, rotation=0, quality="default", format="jpg"):
         return f"{self.data['@id']}/{region}/{sizeWidth},/{rotation}/{quality}.{format}"
 
+    def maxImageUrl(self) -> str:
+        return f"{self.data['@id']}/full/full/0/default.jpg"
+
+    def setLevel0(self, sizes):
+        self.data["profile"] = "http://iiif.io/api/image/2/level0.json"
+        self._setSizes(sizes)
+
     def isLevel0(self) -> bool:
         profile = self.data["profile"]
         level0_uri = "http://iiif.io/api/image/2/level0.json"
@@ -118,10 +218,19 @@ class InfoJson3(InfoJson):
 
     @id.setter
     def id(self, value) -> str:
-        self.data['@id'] = value
+        self.data['id'] = value
 
     def buildImage(self, region="full", sizeWidth=0, sizeHeight=0, rotation=0, quality="default", format="jpg"):
         return f"{self.data['id']}/{region}/{sizeWidth},{sizeHeight}/{rotation}/{quality}.{format}"
 
+    def maxImageUrl(self) -> str:
+        return f"{self.data['id']}/full/max/0/default.jpg"
+
+    def setLevel0(self, sizes):
+        self.data["profile"] = "level0"
+        for extra in ("extraFormats", "extraQualities", "extraFeatures"):
+            self.data.pop(extra, None)
+        self._setSizes(sizes)
+
     def isLevel0(self) -> bool:
         return self.data['profile'] == "level0"
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from iiif_archive.config import get_config
+
+from .downloader import fetchJson, isStatic, localName
+from .processors import infoJson_factory, manifest_factory
+
+logger = logging.getLogger(__name__)
+
+# Tiles of each image and assets of the manifest whose size is asked for, the rest are assumed to be the same
+SAMPLE_TILES = 3
+SAMPLE_ASSETS = 20
+
+
+class Plan:
+    """What archiving a manifest will take, made before anything is downloaded.
+
+    Holds the manifest and every info.json so the run that follows doesn't need to fetch them again,
+    along with the number of requests, and the bytes and time they are estimated to take.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    @property
+    def url(self) -> str:
+        return self.data["url"]
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        return self.data["manifest"]
+
+    @property
+    def estimate(self) -> Dict[str, Any]:
+        return self.data["estimate"]
+
+    def infoJson(self, url: str) -> Optional[Dict[str, Any]]:
+        """The info.json of the IIIF image at url, None if it isn't in the plan."""
+        image = self.data["images"].get(url)
+        return image["infoJson"] if image else None
+
+    def save(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump(self.data, f, indent=4)
+
+    @classmethod
+    def load(cls, filename: str) -> "Plan":
+        with open(filename, "r") as f:
+            return cls(json.load(f))
+
+    def summary(self) -> str:
+        estimate = self.estimate
+        lines = [
+            f"{self.url}: {len(self.data['assets'])} assets and {len(self.data['images'])} IIIF images",
+            f"  {estimate['requests']} requests, about {estimate['bytes'] / 1e6:.1f} MB and {formatDuration(estimate['seconds'])}"
+        ]
+        for host, figures in sorted(self.data["hosts"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+            lines.append(f"  {host}: {figures['requests']} requests, {figures['latency']:.2f}s each, about {formatDuration(figures['seconds'])}")
+        return "\n".join(lines)
+
+
+def formatDuration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def probeSize(url: str, session) -> Tuple[Optional[int], float]:
+    """Ask for the size of url without downloading it. Returns (size, latency), size is None if the server won't say.
+
+    A HEAD is tried first and then a GET of the first byte, as some image servers don't answer HEAD requests.
+    """
+    started = time.monotonic()
+    with session.rate.slot(url) as slot, session.metrics.request(url) as request:
+        response = session.head(url, allow_redirects=True)
+        slot.observe(response)
+        request.observe(response)
+    latency = time.monotonic() - started
+    if response.status_code < 400 and response.headers.get("Content-Length"):
+        return int(response.headers["Content-Length"]), latency
+
+    with session.rate.slot(url) as slot, session.metrics.request(url) as request:
+        with session.get(url, stream=True, headers={"Range": "bytes=0-0"}) as response:
+            slot.observe(response)
+            request.observe(response)
+    match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    return (int(match.group(1)) if match else None), latency
+
+
+def sample(urls, count: int, samples: int):
+    """Pick samples of the count urls, spread evenly through them."""
+    picks = {i * count // samples for i in range(samples)} if count > samples else set(range(count))
+    return [url for i, url in enumerate(urls) if i in picks]
+
+
+def measure(urls, session) -> Tuple[Optional[float], float]:
+    """Mean size and latency of the urls, the size is None if none of them had one."""
+    results = [probeSize(url, session) for url in urls]
+    sizes = [size for size, _ in results if size is not None]
+    latencies = [latency for _, latency in results]
+    return (sum(sizes) / len(sizes) if sizes else None), (sum(latencies) / len(latencies) if latencies else 0)
+
+
+def planImage(url: str, name: str, session) -> Dict[str, Any]:
+    infoJson = infoJson_factory(fetchJson(f"{url}/info.json", session))
+    static = isStatic(infoJson)
+    tiles = infoJson.tileCount(declaredOnly=static)
+    size, latency = measure(sample(infoJson.iterTileUrls(declaredOnly=static), tiles, SAMPLE_TILES), session)
+    return {
+        "name": name,
+        "infoJson": infoJson.data,
+        "static": static,
+        "tiles": tiles,
+        "tileSize": size,
+        "latency": latency,
+        "bytes": round((size or 0) * tiles)
+    }
+
+
+def estimateHosts(requests: Dict[str, Dict]) -> Dict[str, Dict]:
+    """How long each host's requests will take given the rate the config allows.
+
+    A host gets no more than per_host requests at once, started no closer together than delay.
+    Level 0 image services get level0_per_host with no delay, as the download does.
+    """
+    config = get_config()
+    hosts = {}
+    for host, figures in requests.items():
+        latency = figures["latency"] / figures["samples"] if figures["samples"] else 0
+        concurrency = config.level0_per_host if figures["static"] else config.per_host
+        interval = max(0 if figures["static"] else float(config.delay), latency / max(1, concurrency))
+        hosts[host] = {"requests": figures["requests"], "latency": latency, "seconds": figures["requests"] * interval}
+    return hosts
+
+
+def makePlan(url: str, session) -> Plan:
+    """Fetch the manifest at url and its info.json files concurrently and estimate what archiving it will take.
+
+    No tiles or assets are downloaded, a few of each are asked for their size and the rest are assumed to match.
+    """
+    config = get_config()
+    data = fetchJson(url, session)
+    manifest = manifest_factory(data)
+
+    assets = []
+    images = []
+    names = {}
+    seen = set()
+    for container in manifest.containers():
+        name = localName(container, names)
+        if name not in seen:
+            seen.add(name)
+            (assets if container.isDownloadable() else images).append((container.url, name))
+
+    with ThreadPoolExecutor(max_workers=max(1, config.workers)) as pool:
+        planned = dict(zip((image for image, _ in images), pool.map(lambda image: planImage(*image, session), images)))
+        assetSize, assetLatency = measure(sample((asset for asset, _ in assets), len(assets), SAMPLE_ASSETS), session)
+
+    requests = defaultdict(lambda: {"requests": 0, "latency": 0, "samples": 0, "static": False})
+    requests[urlparse(url).netloc]["requests"] += 1
+    for image, figures in planned.items():
+        host = requests[urlparse(image).netloc]
+        host["requests"] += figures["tiles"] + 1
+        host["latency"] += figures["latency"]
+        host["samples"] += 1
+        host["static"] = host["static"] or figures["static"]
+    for asset, _ in assets:
+        host = requests[urlparse(asset).netloc]
+        host["requests"] += 1
+        host["latency"] += assetLatency
+        host["samples"] += 1
+
+    hosts = estimateHosts(requests)
+    totalRequests = sum(host["requests"] for host in hosts.values())
+    meanLatency = sum(host["latency"] * host["requests"] for host in hosts.values()) / totalRequests
+    return Plan({
+        "url": url,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "manifest": data,
+        "assets": [{"url": asset, "name": name, "size": assetSize} for asset, name in assets],
+        "images": planned,
+        "hosts": hosts,
+        "estimate": {
+            "requests": totalRequests,
+            "bytes": round(sum(image["bytes"] for image in planned.values()) + (assetSize or 0) * len(assets)),
+            # Hosts are downloaded from at the same time but every request shares the download workers
+            "seconds": max([host["seconds"] for host in hosts.values()] + [totalRequests * meanLatency / max(1, config.workers)])
+        }
+    })
+
+
+def plan(url: str, filename: str, session) -> Plan:
+    """Make the plan for the manifest at url and save it to filename."""
+    result = makePlan(url, session)
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    result.save(filename)
+    logger.info(f"Saved the plan for {url} to {filename}")
+    return result
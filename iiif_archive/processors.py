@@ -1,5 +1,6 @@
 from typing import Any, Dict
 
+from iiif_archive.models.collection import Collection, Collection2, Collection3
 from iiif_archive.models.container import Canvas2, Canvas3, Container
 from iiif_archive.models.infoJson import InfoJson, InfoJson2, InfoJson3
 from iiif_archive.models.manifest import Manifest, Manifest2, Manifest3
@@ -19,6 +20,24 @@ def manifest_factory(manifest: Dict[str, Any]) -> Manifest:
         raise ValueError(f"Unknown manifest version: {manifest['@context']}")
 
 
+def isCollection(data: Dict[str, Any]) -> bool:
+    return data.get("@type") == "sc:Collection" or data.get("type") == "Collection"
+
+
+def collection_factory(collection: Dict[str, Any]) -> Collection:
+    contexts = collection["@context"]
+    # Ensure contexts is an array for consistency
+    if isinstance(contexts, str):
+        contexts = [contexts]
+
+    if "http://iiif.io/api/presentation/2/context.json" in contexts:
+        return Collection2(collection)
+    elif "http://iiif.io/api/presentation/3/context.json" in contexts:
+        return Collection3(collection)
+    else:
+        raise ValueError(f"Unknown collection version: {collection['@context']}")
+
+
 def container_factory(container: Dict[str, Any]) -> Container:
     if "@type" in container:
         return Canvas2(container)
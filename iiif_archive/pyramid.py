@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from iiif_archive.models.infoJson import InfoJson
+
+from .archive import PARTIAL_SUFFIX
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Tiles cut by one worker task, the worker keeps the source mapped between tasks
+BATCH_SIZE = 64
+JPEG_QUALITY = 90
+# Rows of the decoded source written to its raw pixels at a time
+STRIP_HEIGHT = 256
+
+# Per worker process cache of (path, image) so each source is only mapped once per process
+_source = (None, None)
+
+
+def _decodeSource(path, pixels):
+    """Decode the image at path to raw RGB in pixels and return its (width, height). Runs in a worker process."""
+    # Full resolution scans are routinely bigger than Pillow's decompression bomb limit
+    Image.MAX_IMAGE_PIXELS = None
+    with Image.open(path) as image, open(pixels, "wb") as f:
+        image = image if image.mode == "RGB" else image.convert("RGB")
+        for top in range(0, image.height, STRIP_HEIGHT):
+            f.write(image.crop((0, top, image.width, min(top + STRIP_HEIGHT, image.height))).tobytes())
+        return image.size
+
+
+def _openSource(pixels, size):
+    global _source
+    if _source[0] != pixels:
+        # Mapped rather than read so every worker shares the one copy in the page cache
+        with open(pixels, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _source = (pixels, Image.frombuffer("RGB", size, buffer, "raw", "RGB", 0, 1))
+
+    return _source[1]
+
+
+def _cutTiles(pixels, size, batch):
+    """Cut and save each (region, sizeWidth, sizeHeight, filename) in batch. Runs in a worker process."""
+    image = _openSource(pixels, size)
+    results = []
+    for region, sizeWidth, sizeHeight, filename in batch:
+        if region == "full":
+            tile = image
+        else:
+            left, top, width, height = region
+            tile = image.crop((left, top, left + width, top + height))
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tile.resize((sizeWidth, sizeHeight), Image.LANCZOS).save(filename, "JPEG", quality=JPEG_QUALITY)
+
+        with open(filename, "rb") as f:
+            data = f.read()
+        results.append((filename, len(data), hashlib.sha256(data).hexdigest()))
+
+    return results
+
+
+class PyramidBuilder:
+    """Generates the tiles and sizes of a IIIF image locally from one full resolution download.
+
+    The tiles are cut on a pool of worker processes shared by every image in the job. Each source is
+    decoded once, by one worker, to raw pixels beside it that the workers map, so there is one decoded
+    copy of the image however many workers there are. Needs Pillow, which is installed with the pyramid extra.
+    """
+
+    def __init__(self, workers: int = 0):
+        if Image is None:
+            raise ImportError("Generating tiles locally needs Pillow, install it with: pip install iiif-archive[pyramid]")
+        # spawn rather than fork as the downloader has threads running
+        self._pool = ProcessPoolExecutor(max_workers=workers or None, mp_context=multiprocessing.get_context("spawn"))
+
+    def build(self, source: str, imageDir: str, infoJson: InfoJson, skip=frozenset()):
+        """Cut every tile infoJson describes from the image at source into imageDir, apart from the URLs in skip.
+
+        Returns (url, filename, size, sha256) for each file written and updates infoJson to describe
+        them as a level 0 service. source isn't read if every tile is skipped.
+        """
+        urls = {}
+        sizes = []
+        requests = []
+        for region, sizeWidth, sizeHeight in infoJson.tileRequests():
+            url = infoJson.tileUrl(region, sizeWidth, sizeHeight)
+            if region == "full":
+                sizes.append((sizeWidth, sizeHeight))
+            if url not in skip:
+                filename = url.replace(infoJson.id, imageDir)
+                urls[filename] = url
+                requests.append((region, sizeWidth, sizeHeight, filename))
+
+        files = []
+        if requests:
+            for filename, size, sha256 in self._cut(source, requests):
+                files.append((urls[filename], filename, size, sha256))
+
+        logger.info(f"Generated {len(files)} tiles for {infoJson.id}")
+        infoJson.setLevel0(sorted(sizes))
+        return files
+
+    def _cut(self, source, requests):
+        pixels = os.path.splitext(source)[0] + ".rgb" + PARTIAL_SUFFIX
+        try:
+            size = self._pool.submit(_decodeSource, source, pixels).result()
+            futures = [self._pool.submit(_cutTiles, pixels, size, requests[i:i + BATCH_SIZE]) for i in range(0, len(requests), BATCH_SIZE)]
+            return [result for future in futures for result in future.result()]
+        finally:
+            if os.path.exists(pixels):
+                os.remove(pixels)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Optional, Tuple
+
+import requests
+
+from iiif_archive.config import get_config
+
+from .archive import COPY_BUFFER, PARTIAL_SUFFIX, partialName
+from .fixity import Checksums
+from .ratecontrol import BACKOFF_STATUS
+from .tracing import span
+from .transfer import iterBody, preallocate
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - optional dependency
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Kept next to the partial file, ending in PARTIAL_SUFFIX so they are never zipped
+RANGES_SUFFIX = ".ranges" + PARTIAL_SUFFIX
+LOCK_SUFFIX = ".lock" + PARTIAL_SUFFIX
+
+# Lock files held by this process. flock keeps out other processes, and other threads
+# where it locks open files, but on some filesystems it is emulated with per process locks
+_held = set()
+_heldLock = threading.Lock()
+
+
+class RangeError(IOError):
+    """The server stopped answering Range requests for a file, or the file changed part way through."""
+
+
+def isRangeable(response, threshold: int) -> bool:
+    """Whether the body of response is big enough to fetch in parts and the server says it can send parts of it."""
+    if not threshold or response.headers.get("Accept-Ranges", "").lower() != "bytes" or response.headers.get("Content-Encoding"):
+        return False
+    try:
+        return int(response.headers.get("Content-Length", 0)) >= threshold
+    except ValueError:
+        return False
+
+
+class RangeState:
+    """Which parts of a file have been downloaded into its partial file, saved beside it so a failed run can resume.
+
+    Each worker downloads into a partial file of its own. Only the worker holding the lock file beside
+    the state, taken with acquire, may resume from the state or record its progress in it, so workers
+    downloading the same file at once never write into each other's partial file.
+    The state is only reused if the server still describes the file with the same size, ETag and Last-Modified.
+    """
+
+    def __init__(self, filename: str, url: str, size: int, partSize: int, etag: Optional[str] = None, lastModified: Optional[str] = None):
+        self.filename = filename
+        self.path = filename + RANGES_SUFFIX
+        self.lockPath = filename + LOCK_SUFFIX
+        self.partial = partialName(filename)
+        # Where downloads made before each worker had its own partial file left it
+        self._sharedPartial = filename + PARTIAL_SUFFIX
+        self.key = {"url": url, "size": size, "part_size": partSize, "etag": etag, "last_modified": lastModified}
+        self.done = set()
+        self.owner = False
+        self._lockFile = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take the lock on the state. Returns False if another worker holds it."""
+        with _heldLock:
+            if self.lockPath in _held:
+                return False
+            f = open(self.lockPath, "a")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # The holder may have removed the file, and released it, after we opened it
+                locked = os.path.exists(self.lockPath) and os.path.samestat(os.fstat(f.fileno()), os.stat(self.lockPath))
+            except OSError:
+                locked = False
+            if not locked:
+                f.close()
+                return False
+            _held.add(self.lockPath)
+
+        self._lockFile = f
+        self.owner = True
+        return True
+
+    def release(self):
+        if self._lockFile is None:
+            return
+        with _heldLock:
+            # Removed while it is still locked, see acquire
+            os.remove(self.lockPath)
+            self._lockFile.close()
+            _held.discard(self.lockPath)
+        self._lockFile = None
+        self.owner = False
+
+    @property
+    def size(self) -> int:
+        return self.key["size"]
+
+    def parts(self):
+        """(start, end) of every part, end inclusive as in a Range header."""
+        partSize = self.key["part_size"]
+        return [(start, min(start + partSize, self.size) - 1) for start in range(0, self.size, partSize)]
+
+    def missing(self):
+        return [part for part in self.parts() if part[0] not in self.done]
+
+    def _saved(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _savedPartial(self, saved: dict) -> str:
+        return os.path.join(os.path.dirname(self.path), saved["partial"]) if "partial" in saved else self._sharedPartial
+
+    def load(self) -> bool:
+        """Pick up the parts an earlier run finished, which needs the lock. Returns False, and starts again, if they can't be trusted."""
+        saved = self._saved()
+        if not self.owner or saved.get("key") != self.key:
+            return False
+        partial = self._savedPartial(saved)
+        if not os.path.exists(partial) or os.path.getsize(partial) != self.size:
+            return False
+        self.partial = partial
+        self.done = set(saved["done"])
+        return True
+
+    def complete(self, start: int):
+        with self._lock:
+            self.done.add(start)
+            if self.owner:
+                with open(self.path + PARTIAL_SUFFIX, "w") as f:
+                    json.dump({"key": self.key, "partial": os.path.basename(self.partial), "done": sorted(self.done)}, f)
+                os.replace(self.path + PARTIAL_SUFFIX, self.path)
+
+    def discard(self):
+        """Remove this worker's partial file and, if it holds the lock, the state and the partial file that goes with it."""
+        paths = [self.partial]
+        if self.owner:
+            paths += [self.path, self._savedPartial(self._saved())]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class PrefixHasher:
+    """Hashes a partial file from its start as far as its parts are complete.
+
+    Called as each part finishes, so the start of the file is hashed, from the page cache as it was just
+    written, while later parts are still downloading rather than the whole file being read back at the end.
+    """
+
+    def __init__(self, fd: int, state: RangeState, md5: bool = False):
+        self.fd = fd
+        self.state = state
+        self.checksums = Checksums(md5)
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def advance(self):
+        with self._lock:
+            for start, end in self.state.parts():
+                if start < self.offset:
+                    continue
+                elif start not in self.state.done:
+                    break
+                while self.offset <= end:
+                    chunk = os.pread(self.fd, min(COPY_BUFFER, end + 1 - self.offset), self.offset)
+                    if not chunk:
+                        raise RangeError(f"{self.state.partial} is shorter than {self.state.size} bytes")
+                    self.checksums.update(chunk)
+                    self.offset += len(chunk)
+
+
+def fetchRange(fd: int, url: str, session, start: int, end: int, validator: Optional[str]):
+    """Download bytes start to end of url into the same place in fd."""
+    headers = {"Range": f"bytes={start}-{end}"}
+    if validator:
+        # If the file has changed the server sends all of it, rather than part of the new file
+        headers["If-Range"] = validator
+    with span("range", "request", url=url, start=start), session.rate.slot(url) as slot, session.metrics.request(url) as request:
+        with session.get(url, stream=True, headers=headers) as response:
+            slot.observe(response)
+            request.observe(response)
+            response.raise_for_status()
+            if response.status_code != 206 or not response.headers.get("Content-Range", "").startswith(f"bytes {start}-{end}/"):
+                raise RangeError(f"Asked {url} for bytes {start}-{end} but got {response.status_code} {response.headers.get('Content-Range', '')}")
+
+            offset = start
+            for chunk in iterBody(response):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+    if offset != end + 1:
+        raise requests.exceptions.ChunkedEncodingError(f"Only got {offset - start} of {end + 1 - start} bytes from {url}")
+
+
+def fetchPart(fd: int, url: str, session, start: int, end: int, validator: Optional[str], retries: int):
+    """fetchRange, trying again when the server is overloaded or the connection drops."""
+    for attempt in range(1, retries + 1):
+        try:
+            return fetchRange(fd, url, session, start, end, validator)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code not in BACKOFF_STATUS or attempt == retries:
+                raise
+            session.metrics.retry(url, e.response.status_code)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout) as e:
+            if attempt == retries:
+                raise
+            logger.info(f"Bytes {start}-{end} of {url} failed ({e}), trying again.")
+
+
+def fetchParts(fd: int, url: str, session, state: RangeState, validator: Optional[str], retries: int, connections: int, hasher: PrefixHasher):
+    """Fetch the parts state is missing into fd, connections at a time, recording and hashing each as it finishes."""
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+        futures = {pool.submit(fetchPart, fd, url, session, start, end, validator, retries): start for start, end in state.missing()}
+
+        def record(future):
+            if not future.cancelled() and future.exception() is None:
+                state.complete(futures[future])
+                hasher.advance()
+
+        for future in futures:
+            future.add_done_callback(record)
+        # Parts already running when one fails are left to finish so they needn't be fetched again
+        finished, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in finished:
+            future.result()
+
+
+def downloadRanges(filename: str, url: str, session, size: int, etag: Optional[str] = None, lastModified: Optional[str] = None,
+                   retries: int = 3, partSize: Optional[int] = None, connections: Optional[int] = None) -> Tuple[int, str, Optional[str], Optional[str], Optional[str]]:
+    """Download url, size bytes long, to filename in parts over several connections at once.
+
+    The parts are written straight to their place in a preallocated partial file. Those that finish are
+    recorded beside it, so if the download fails the next attempt only asks for the parts still missing.
+    If another worker holds the lock on that record this one downloads into its own partial file without one.
+    Each part takes its own rate controller slot, so per_host still limits how many are fetched at once.
+    Returns (size, sha256, etag, last modified, md5) like requestAsset. As the parts arrive out of order the
+    checksums are taken by reading the file back from its start as far as it is complete, each time a part finishes.
+
+    Raises:
+        RangeError: If the server answers a part with the whole file, which it does if the file has changed.
+    """
+    config = get_config()
+    state = RangeState(filename, url, size, partSize or int(config.range_part_size * 1024 * 1024), etag, lastModified)
+    if not state.acquire():
+        logger.info(f"Another worker is downloading {url} in parts, so this download won't be resumable.")
+    try:
+        return fetchFile(state, session, retries, connections or config.range_connections, config.checksum_md5)
+    finally:
+        state.release()
+
+
+def fetchFile(state: RangeState, session, retries: int, connections: int, md5: bool):
+    """The body of downloadRanges, once it knows whether it holds the lock on state."""
+    url = state.key["url"]
+    if state.load():
+        logger.info(f"Resuming {url} with {len(state.done)} of {len(state.parts())} parts already downloaded.")
+    else:
+        state.discard()
+
+    size = state.size
+    etag, lastModified = state.key["etag"], state.key["last_modified"]
+    fd = os.open(state.partial, os.O_RDWR | os.O_CREAT)
+    hasher = PrefixHasher(fd, state, md5)
+    try:
+        if not state.done:
+            preallocate(fd, size)
+        fetchParts(fd, url, session, state, etag or lastModified, retries, connections, hasher)
+        # Covers the parts a resumed download already had if it had nothing left to fetch
+        hasher.advance()
+    except RangeError:
+        state.discard()
+        raise
+    except BaseException:
+        if state.owner:
+            logger.warning(f"Downloading {url} failed with {len(state.missing())} parts left, the next attempt will resume it.")
+        else:
+            state.discard()
+        raise
+    finally:
+        os.close(fd)
+
+    os.replace(state.partial, state.filename)
+    if state.owner and os.path.exists(state.path):
+        os.remove(state.path)
+    session.metrics.received(url, size)
+    return size, hasher.checksums.sha256, etag, lastModified, hasher.checksums.md5
@@ -0,0 +1,179 @@
+import email.utils
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+from iiif_archive.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean the server wants us to slow down
+BACKOFF_STATUS = {429, 502, 503, 504}
+# Latency this many times the best seen (and at least MIN_LATENCY_RISE seconds more) is treated as the server struggling
+LATENCY_FACTOR = 3
+MIN_LATENCY_RISE = 0.25
+# Longest gap we will leave between requests when backing off without a Retry-After
+MAX_INTERVAL = 30.0
+
+
+def parseRetryAfter(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Slot:
+    """A permit to make one request, used to report how the request went."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.status = None
+        self.latency = None
+        self.retryAfter = None
+
+    def observe(self, response):
+        self.latency = time.monotonic() - self.started
+        self.status = response.status_code
+        self.retryAfter = parseRetryAfter(getattr(response, "headers", {}).get("Retry-After"))
+
+
+class HostController:
+    """Adapts the request rate to one host (AIMD, like TCP congestion control).
+
+    window is how many requests may be in flight and interval the minimum gap between starting them.
+    Each healthy response widens the window by about one request per round trip up to maxConcurrency
+    and shortens the interval towards floor. A 429/502/503/504, a connection error or a latency well
+    above the best seen halves the window, doubles the interval and, with a Retry-After, pauses the host.
+    """
+
+    def __init__(self, floor: float = 0, maxConcurrency: int = 1, retryDelay: float = 1):
+        self.floor = floor
+        self.maxConcurrency = max(1, maxConcurrency)
+        self.retryDelay = retryDelay
+        self.window = 1.0
+        self.interval = floor
+        self.inFlight = 0
+        self.latency = None
+        self.bestLatency = None
+        self._nextStart = 0.0
+        self._blockedUntil = 0.0
+        self._holdUntil = 0.0
+        self._cond = threading.Condition()
+
+    def _waitTime(self, now):
+        if self.inFlight >= int(self.window):
+            return None
+        return max(self._nextStart, self._blockedUntil) - now
+
+    def acquire(self) -> Slot:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._waitTime(now)
+                if wait is not None and wait <= 0:
+                    self.inFlight += 1
+                    self._nextStart = now + self.interval
+                    return Slot()
+                self._cond.wait(timeout=wait)
+
+    def release(self, slot: Slot, failed: bool = False):
+        with self._cond:
+            self.inFlight -= 1
+            if failed or slot.status in BACKOFF_STATUS:
+                self._backoff(slot.retryAfter)
+            elif slot.latency is not None:
+                self._observeLatency(slot.latency)
+            self._cond.notify_all()
+
+    def _observeLatency(self, latency):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.bestLatency = self.latency if self.bestLatency is None else min(self.bestLatency, self.latency)
+        now = time.monotonic()
+        struggling = self.latency > LATENCY_FACTOR * self.bestLatency and self.latency - self.bestLatency > MIN_LATENCY_RISE
+        if struggling and now > self._holdUntil:
+            logger.debug(f"Latency {self.latency:.2f}s is climbing, slowing down")
+            self.window = max(1.0, self.window * 0.75)
+            self._holdUntil = now + self.latency
+        else:
+            self.window = min(self.maxConcurrency, self.window + 1 / self.window)
+            self.interval = max(self.floor, self.interval * 0.9)
+
+    def _backoff(self, retryAfter):
+        self.window = max(1.0, self.window / 2)
+        self.interval = min(MAX_INTERVAL, max(self.floor, self.interval * 2, 0.1))
+        pause = retryAfter if retryAfter is not None else self.retryDelay
+        self._blockedUntil = max(self._blockedUntil, time.monotonic() + pause)
+        self._holdUntil = self._blockedUntil
+
+    @contextmanager
+    def slot(self):
+        slot = self.acquire()
+        failed = False
+        try:
+            yield slot
+        except Exception:
+            # An HTTP error the server told us about is judged by its status, anything else is a failed connection
+            failed = slot.status is None
+            raise
+        finally:
+            self.release(slot, failed)
+
+
+class RateController:
+    """One HostController per host, shared by everything using the same session.
+
+    URLs under a prefix given to addStatic, e.g. a level 0 image, share a second controller for their host
+    so static files don't change the profile, or undo the backoff, of the other services on it.
+    """
+
+    def __init__(self, floor: float = 0, maxConcurrency: int = 1, retryDelay: float = 1):
+        self.floor = floor
+        self.maxConcurrency = maxConcurrency
+        self.retryDelay = retryDelay
+        self._hosts = {}
+        self._static = set()
+        self._lock = threading.Lock()
+
+    def addStatic(self, prefix: str, floor: float, maxConcurrency: int):
+        """Send requests under prefix to the host's static controller, made with floor and maxConcurrency the first time."""
+        key = (urlparse(prefix).netloc, True)
+        with self._lock:
+            self._static.add(prefix.rstrip("/"))
+            if key not in self._hosts:
+                self._hosts[key] = HostController(floor, maxConcurrency, self.retryDelay)
+
+    def _isStatic(self, url: str) -> bool:
+        # Called holding the lock. Checks url and each of its parents rather than every prefix
+        url = url.rstrip("/")
+        while url not in self._static:
+            if "/" not in url:
+                return False
+            url = url.rsplit("/", 1)[0]
+        return True
+
+    def host(self, url: str) -> HostController:
+        host = urlparse(url).netloc
+        with self._lock:
+            key = (host, True) if self._static and self._isStatic(url) else host
+            if key not in self._hosts:
+                self._hosts[key] = HostController(self.floor, self.maxConcurrency, self.retryDelay)
+
+            return self._hosts[key]
+
+    def slot(self, url: str):
+        return self.host(url).slot()
+
+
+def create_rate_controller(config: Config) -> RateController:
+    return RateController(float(config.delay), config.per_host, float(config.retry_delay))
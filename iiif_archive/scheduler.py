@@ -0,0 +1,101 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from iiif_archive.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """A bounded pool of download workers shared by every canvas and tile in a job.
+
+    Work is submitted through a TaskGroup so the caller can wait for everything it started,
+    including tasks that were submitted by other tasks (e.g. tiles found after fetching an info.json).
+    How hard each host is hit is left to the session's rate controller. Requests for static files
+    (level 0 image services) can be given their own, larger, pool of staticWorkers.
+    """
+
+    def __init__(self, workers: int = 1, staticWorkers: int = 0):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="iiif-archive")
+        if staticWorkers > 0:
+            self._static = ThreadPoolExecutor(max_workers=staticWorkers, thread_name_prefix="iiif-archive-static")
+        else:
+            self._static = self._executor
+        # Tasks submitted but not yet started, and those running, across every group
+        self.queued = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def group(self) -> "TaskGroup":
+        return TaskGroup(self)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self._static.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class TaskGroup:
+    """Tracks a set of tasks running on a Scheduler.
+
+    Tasks may submit further tasks to the same group. wait() returns once every task has finished
+    and re-raises the first error. After an error no new tasks are started so a failing job stops
+    as quickly as the serial version did.
+    """
+
+    def __init__(self, scheduler: Scheduler):
+        self.scheduler = scheduler
+        self._pending = 0
+        self._errors = []
+        self._cond = threading.Condition()
+
+    def submit(self, fn, *args, **kwargs):
+        self._submit(self.scheduler._executor, fn, args, kwargs)
+
+    def submitStatic(self, fn, *args, **kwargs):
+        """Submit a request for a static file, which runs on the static pool if there is one."""
+        self._submit(self.scheduler._static, fn, args, kwargs)
+
+    def _submit(self, executor, fn, args, kwargs):
+        with self._cond:
+            self._pending += 1
+        with self.scheduler._lock:
+            self.scheduler.queued += 1
+
+        executor.submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        with self.scheduler._lock:
+            self.scheduler.queued -= 1
+            self.scheduler.running += 1
+        try:
+            if not self._errors:
+                fn(*args, **kwargs)
+        except Exception as e:
+            logger.debug(f"Task {fn.__name__} failed: {e}")
+            with self._cond:
+                self._errors.append(e)
+        finally:
+            with self.scheduler._lock:
+                self.scheduler.running -= 1
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def wait(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending == 0)
+
+        if self._errors:
+            raise self._errors[0]
+
+
+def create_scheduler(config: Config) -> Scheduler:
+    return Scheduler(config.workers, config.level0_workers if config.no_delay_level0 else 0)
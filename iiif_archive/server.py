@@ -0,0 +1,211 @@
+import functools
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import re
+import threading
+import zipfile
+import zlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+from .archive import dataOffset
+from .decompressor import isRebased, rebaseEntry
+
+logger = logging.getLogger(__name__)
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class MappedArchive:
+    """A zip that is memory mapped so its entries can be served without extracting them.
+
+    Where each entry's data starts is worked out once when the zip is opened. Stored entries (tiles and
+    media) are sent straight from the file, deflated ones (the JSON) are decompressed from the map.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = {}
+        with zipfile.ZipFile(self._file) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    self.entries[info.filename] = (dataOffset(self._file, info), info)
+
+        # manifest.json and info.json rewritten for each base URL they have been asked for
+        self._rebased = functools.lru_cache(maxsize=256)(self._rebase)
+
+    def read(self, name: str) -> bytes:
+        offset, info = self.entries[name]
+        data = self._map[offset:offset + info.compress_size]
+        if info.compress_type == zipfile.ZIP_STORED:
+            return data
+        elif info.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        else:
+            raise NotImplementedError(f"Can't serve {name} as it uses compression type {info.compress_type}")
+
+    def _rebase(self, name: str, base_url: str) -> bytes:
+        return rebaseEntry(name, self.read(name), base_url)
+
+    def rebased(self, name: str, base_url: str) -> bytes:
+        return self._rebased(name, base_url)
+
+    def send(self, sock, name: str, start: int, count: int):
+        """Send count bytes of the stored entry name from start without copying them through Python."""
+        offset = self.entries[name][0] + start
+        if hasattr(os, "sendfile"):
+            while count > 0:
+                sent = os.sendfile(sock.fileno(), self._file.fileno(), offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+        else:  # pragma: no cover - platforms without sendfile
+            sock.sendall(memoryview(self._map)[offset:offset + count])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def parseRange(header: Optional[str], size: int):
+    """The (start, end) inclusive of a single byte range, None to send everything, or False if it can't be satisfied."""
+    match = RANGE.match(header or "")
+    if match is None or not any(match.groups()):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class ArchiveServer(ThreadingHTTPServer):
+    """Serves every zip in directory from /<zip name>/ without extracting them.
+
+    The manifest.json and info.json ids are rewritten as they are served so they point back at this
+    server, using base_url if given or otherwise the Host the client asked for. A zip that is replaced
+    on disk is reopened on its next request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, directory: str, base_url: Optional[str] = None):
+        super().__init__(address, ArchiveRequestHandler)
+        self.directory = directory
+        self.base_url = base_url
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    def archive(self, name: str) -> Optional[MappedArchive]:
+        path = os.path.join(self.directory, f"{name}.zip")
+        if "/" in name or not os.path.isfile(path):
+            return None
+
+        with self._lock:
+            archive = self._archives.get(name)
+            if archive is None or archive.mtime != os.stat(path).st_mtime:
+                # Requests still using a replaced archive keep it open until they finish
+                archive = self._archives[name] = MappedArchive(path)
+            return archive
+
+    def archiveNames(self):
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith(".zip"))
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            for archive in self._archives.values():
+                archive.close()
+            self._archives = {}
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    # Keep alive so a viewer's burst of tile requests reuses its connections
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.serve(True)
+
+    def do_HEAD(self):
+        self.serve(False)
+
+    def baseUrl(self) -> str:
+        if self.server.base_url:
+            return self.server.base_url.rstrip("/")
+        host = self.headers.get("Host") or "%s:%s" % self.server.server_address[:2]
+        return f"http://{host}"
+
+    def serve(self, body: bool):
+        name, _, entry = unquote(urlsplit(self.path).path).lstrip("/").partition("/")
+        if not name:
+            index = [f"{self.baseUrl()}/{archive}/manifest.json" for archive in self.server.archiveNames()]
+            self.sendBytes(json.dumps(index, indent=4).encode("utf-8"), "index.json", body)
+            return
+
+        archive = self.server.archive(name)
+        if archive is None or entry not in archive.entries:
+            self.send_error(HTTPStatus.NOT_FOUND)
+        elif isRebased(entry):
+            self.sendBytes(archive.rebased(entry, f"{self.baseUrl()}/{name}"), entry, body)
+        elif archive.entries[entry][1].compress_type != zipfile.ZIP_STORED:
+            self.sendBytes(archive.read(entry), entry, body)
+        else:
+            self.sendEntry(archive, entry, body)
+
+    def sendHeaders(self, status, entry: str, length: int):
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(entry)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        # IIIF viewers are usually on another origin
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+    def sendBytes(self, data: bytes, entry: str, body: bool):
+        self.sendHeaders(HTTPStatus.OK, entry, len(data))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def sendEntry(self, archive: MappedArchive, entry: str, body: bool):
+        size = archive.entries[entry][1].file_size
+        byteRange = parseRange(self.headers.get("Range"), size)
+        if byteRange is False:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = byteRange or (0, size - 1)
+        if byteRange is None:
+            self.sendHeaders(HTTPStatus.OK, entry, size)
+        else:
+            self.sendHeaders(HTTPStatus.PARTIAL_CONTENT, entry, end - start + 1)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        if body:
+            archive.send(self.connection, entry, start, end - start + 1)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s" % (self.address_string(), format % args))
+
+
+def serve(directory: str, host: str = "127.0.0.1", port: int = 8000, base_url: Optional[str] = None):
+    with ArchiveServer((host, port), directory, base_url) as server:
+        logger.info(f"Serving the archives in {directory} at http://{host}:{server.server_address[1]}/")
+        server.serve_forever()
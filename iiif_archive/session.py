@@ -0,0 +1,57 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from iiif_archive.config import Config
+from iiif_archive.metrics import Metrics, MetricsReporter
+from iiif_archive.ratecontrol import RateController, create_rate_controller
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveSession(requests.Session):
+    """A requests Session shared by every request in one archive job.
+
+    Connections are kept alive and pooled per host so tile requests against the same image server
+    reuse the TCP/TLS connection. Every request gets the configured (connect, read) timeout unless
+    the caller passes its own. rate paces the requests made to each host and metrics counts them.
+    If metricsFile is given the metrics are written to it every metricsInterval seconds and when the
+    session is closed, which also logs a summary.
+    """
+
+    def __init__(self, poolSize: int = 10, connectTimeout: float = 10, readTimeout: float = 60, rate: RateController = None,
+                 metrics: Metrics = None, metricsFile: str = None, metricsInterval: float = 10):
+        super().__init__()
+        self.rate = rate or RateController()
+        self.metrics = metrics or Metrics()
+        self._reporter = MetricsReporter(self.metrics, metricsFile, metricsInterval) if metricsFile else None
+        self._closed = False
+        adapter = HTTPAdapter(pool_maxsize=poolSize, pool_block=True)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.timeout = (connectTimeout, readTimeout)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        super().close()
+        if self._closed:
+            return
+        self._closed = True
+        if self._reporter is not None:
+            self._reporter.close()
+        if self.metrics.snapshot()["requests"]:
+            logger.info(f"Download summary: {self.metrics.summary()}")
+
+
+def poolSize(config: Config) -> int:
+    """Connections to keep per host, at least as many as the rate controller lets run at once so none wait on the pool."""
+    return max(config.pool_size, config.per_host, config.level0_per_host)
+
+
+def create_session(config: Config) -> ArchiveSession:
+    return ArchiveSession(poolSize(config), config.connect_timeout, config.read_timeout, create_rate_controller(config),
+                          metricsFile=config.metrics_file or None, metricsInterval=config.metrics_interval)
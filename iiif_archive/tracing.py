@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Returned by span() and stage() when tracing is off so they cost one global lookup
+_OFF = nullcontext()
+
+
+class Tracer:
+    """Records spans as Chrome trace events, which load in chrome://tracing and Perfetto.
+
+    Each span is a complete ("X") event on the thread that ran it, so spans on one thread nest.
+    If memory is set tracemalloc runs for the whole trace and each stage gets the peak memory
+    allocated while it ran. Stages are the top level steps of a job and run one after another;
+    the peak is for the whole process so it includes any worker threads busy during the stage.
+    """
+
+    def __init__(self, path: str, memory: bool = False):
+        self.path = path
+        self.memory = memory
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self.peaks = {}
+        self._lock = threading.Lock()
+        if memory:
+            tracemalloc.start()
+
+    def _now(self) -> float:
+        # Chrome traces are in microseconds
+        return (time.perf_counter() - self.started) * 1e6
+
+    def add(self, event):
+        thread = threading.current_thread()
+        event.update(pid=self.pid, tid=thread.ident)
+        with self._lock:
+            self.threads.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str, args):
+        start = self._now()
+        try:
+            yield args
+        finally:
+            self.add({"name": name, "cat": category, "ph": "X", "ts": start, "dur": self._now() - start, "args": args})
+
+    @contextmanager
+    def stage(self, name: str, args):
+        if self.memory:
+            tracemalloc.reset_peak()
+        with self.span(name, "stage", args):
+            yield args
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                args["peak_memory"] = peak
+                self.peaks[name] = max(peak, self.peaks.get(name, 0))
+                self.add({"name": "memory", "ph": "C", "ts": self._now(), "args": {"peak": peak, "current": current}})
+
+    def close(self):
+        if self.memory:
+            tracemalloc.stop()
+
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}} for tid, name in self.threads.items()]
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+
+        logger.info(f"Wrote {len(self.events)} trace events to {self.path}")
+        for name, peak in self.peaks.items():
+            logger.info(f"Peak memory during {name}: {peak / 1e6:.1f} MB")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, category: str = "", **args):
+    """A span around some work, with args shown when it is selected in the trace viewer. Does nothing unless tracing."""
+    if _tracer is None:
+        return _OFF
+    return _tracer.span(name, category, args)
+
+
+def stage(name: str, **args):
+    """A span for a top level step of a job, which also records its peak memory if asked to."""
+    if _tracer is None:
+        return _OFF
+    return _tracer.stage(name, args)
+
+
+@contextmanager
+def tracing(path: Optional[str], memory: bool = False):
+    """Trace everything run inside this to path. If path is None nothing is traced."""
+    global _tracer
+    if path is None:
+        yield None
+        return
+
+    _tracer = Tracer(path, memory)
+    try:
+        yield _tracer
+    finally:
+        tracer, _tracer = _tracer, None
+        tracer.close()
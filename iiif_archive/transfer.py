@@ -0,0 +1,74 @@
+import os
+import threading
+from typing import Optional
+
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError, SSLError
+
+# Reads start this big when the size isn't known and double each time one fills, up to MAX_CHUNK
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# Smaller files, like most tiles, aren't worth a system call to reserve their space
+PREALLOCATE_MIN = 1024 * 1024
+
+_local = threading.local()
+
+
+def buffer() -> memoryview:
+    """A MAX_CHUNK buffer for this thread, reused by every download it makes."""
+    if not hasattr(_local, "buffer"):
+        _local.buffer = memoryview(bytearray(MAX_CHUNK))
+    return _local.buffer
+
+
+def bodySize(response) -> Optional[int]:
+    """The number of bytes iterBody will yield, if the server said."""
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def preallocate(fd: int, size: int):
+    """Reserve size bytes for the file, so it isn't fragmented when many downloads are written at once."""
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not on every platform or file system, a sparse file is fine
+        os.ftruncate(fd, size)
+
+
+def readInto(raw, view: memoryview) -> int:
+    """raw.readinto(view) with urllib3's errors turned into the ones requests raises from iter_content."""
+    try:
+        return raw.readinto(view)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except SSLError as e:
+        raise requests.exceptions.SSLError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+
+
+def iterBody(response):
+    """Yield the body of a streamed response in chunks, without going through iter_content.
+
+    Each chunk is a view of this thread's buffer, which the next chunk overwrites, so write or hash it before
+    asking for another. When the size is known the body is read in chunks of up to MAX_CHUNK, otherwise
+    they start at MIN_CHUNK and grow. Bodies the server compressed are left to requests to decode.
+    """
+    size = bodySize(response)
+    raw = getattr(response, "raw", None)
+    if response.headers.get("Content-Encoding", "identity") != "identity" or not hasattr(raw, "readinto"):
+        yield from response.iter_content(chunk_size=MIN_CHUNK)
+        return
+
+    view = buffer()
+    # urllib3 allocates each read at the size asked for, so a small tile isn't read with a 4 MB chunk
+    chunk = min(MAX_CHUNK, size) if size else MIN_CHUNK
+    while read := readInto(raw, view[:chunk]):
+        yield view[:read]
+        if read == chunk:
+            chunk = min(MAX_CHUNK, chunk * 2)
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import zipfile
+from collections import defaultdict
+from typing import Dict, Optional
+
+from .fixity import hashStream
+
+logger = logging.getLogger(__name__)
+
+# Written into every archive, maps each URL downloaded to its entry and the validators the server sent
+SOURCES = "sources.json"
+
+
+class PreviousArchive:
+    """An earlier zip of the same manifest that a new archive can take unchanged entries from.
+
+    Entries are matched by the URL they were downloaded from using the archive's sources.json and
+    are copied into the new zip (a ZipStream) as they are, without decompressing them.
+    Zips made before sources.json was added have nothing that can be matched so everything is downloaded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._zipf = zipfile.ZipFile(self._file)
+        if SOURCES in self._zipf.NameToInfo:
+            self.sources = json.loads(self._zipf.read(SOURCES))
+        else:
+            logger.warning(f"{path} has no {SOURCES} so nothing can be reused from it")
+            self.sources = {}
+
+        # URLs of the files under each image directory so an unchanged image can be copied in one go
+        self._dirs = defaultdict(list)
+        for url, source in self.sources.items():
+            if "/" in source["name"]:
+                self._dirs[source["name"].split("/")[0]].append(url)
+
+    def get(self, url: str) -> Optional[Dict]:
+        source = self.sources.get(url)
+        if source is None or source["name"] not in self._zipf.NameToInfo:
+            return None
+        return source
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Headers for a conditional GET of url, empty if the server didn't send an ETag or Last-Modified."""
+        source = self.get(url) or {}
+        headers = {}
+        if source.get("etag"):
+            headers["If-None-Match"] = source["etag"]
+        if source.get("lastModified"):
+            headers["If-Modified-Since"] = source["lastModified"]
+        return headers
+
+    def reuse(self, url: str, filename: str, archive, journal=None) -> bool:
+        """Copy the entry downloaded from url into archive as filename. Returns False if there isn't one."""
+        source = self.get(url)
+        if source is None:
+            return False
+
+        md5 = source.get("md5")
+        if archive.md5 and md5 is None:
+            # Archived before MD5s were kept
+            with self._zipf.open(source["name"]) as f:
+                md5 = hashStream(f, True)[1]
+
+        if filename.endswith(".json"):
+            # Its sha256 in sources is of the data, written again so the archive takes the checksum of the file
+            archive.writestr(filename, self._zipf.read(source["name"]))
+        else:
+            # Read with pread, so other workers can read the same file through self._zipf at the same time
+            archive.copy(filename, self._file, self._zipf.NameToInfo[source["name"]])
+        if journal is not None:
+            journal.record(url, filename, source["size"], source["sha256"], source.get("etag"), source.get("lastModified"), md5)
+        return True
+
+    def reuseImage(self, url: str, imageDir: str, infoJsonDigest: str, archive, journal=None) -> bool:
+        """Copy every file of the IIIF image at url into archive if its info.json hasn't changed."""
+        source = self.get(f"{url}/info.json")
+        if source is None or source["sha256"] != infoJsonDigest:
+            return False
+
+        oldDir = source["name"].split("/")[0]
+        for fileUrl in self._dirs[oldDir]:
+            name = self.sources[fileUrl]["name"]
+            self.reuse(fileUrl, os.path.join(imageDir, *name.split("/")[1:]), archive, journal)
+
+        logger.info(f"{url} is unchanged so copied it from {self.path}")
+        return True
+
+    def close(self):
+        self._zipf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,128 @@
+import json
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from .decompressor import archiveName
+from .downloader import isStatic
+from .fixity import BAG_MANIFESTS, hashStream, parseBagManifest
+from .processors import infoJson_factory, manifest_factory
+from .tracing import stage
+
+# Entries hashed by each task, so the workers aren't sent a name at a time
+BATCH_SIZE = 256
+
+
+class Report:
+    """What verify found in an archive. It is ok if every entry matches its checksums and nothing is missing."""
+
+    def __init__(self, zipFile: str):
+        self.zipFile = zipFile
+        self.entries = 0
+        self.bytes = 0
+        self.algorithms: List[str] = []
+        self.errors: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error(self, message: str):
+        self.errors.append(message)
+
+    def summary(self) -> str:
+        checked = " and ".join(self.algorithms) if self.algorithms else "CRC-32 only, the archive has no BagIt manifest"
+        status = "OK" if self.ok else f"{len(self.errors)} problems"
+        return f"{self.zipFile}: {self.entries} entries, {self.bytes} bytes checked ({checked}): {status}"
+
+
+def hashEntries(zipFile: str, names: List[str], md5: bool) -> Tuple[Dict[str, Tuple[str, Optional[str]]], Dict[str, str]]:
+    """Read entries names of zipFile, which checks their CRC-32, and return their (SHA-256, MD5) and any errors reading them.
+
+    Run in a worker process, each batch opens the zip itself.
+    """
+    checksums = {}
+    errors = {}
+    with zipfile.ZipFile(zipFile) as zf:
+        for name in names:
+            try:
+                with zf.open(name) as f:
+                    checksums[name] = hashStream(f, md5)
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                errors[name] = str(e)
+    return checksums, errors
+
+
+def expectedEntries(zf: zipfile.ZipFile) -> Set[str]:
+    """The entries the archive's manifest.json says it should have: its containers, and the info.json and tiles of its IIIF images."""
+    expected = {"manifest.json"}
+    if "manifest.json" not in zf.NameToInfo:
+        return expected
+
+    manifest = manifest_factory(json.loads(zf.read("manifest.json")))
+    for container in manifest.containers():
+        # Absolute if the archive has been rebased
+        name = archiveName(container.url, manifest.id)
+        if container.isDownloadable():
+            expected.add(name)
+            continue
+
+        infoJsonName = f"{name}/info.json"
+        expected.add(infoJsonName)
+        if infoJsonName in zf.NameToInfo:
+            infoJson = infoJson_factory(json.loads(zf.read(infoJsonName)))
+            # Static images only have the sizes they declare, which is all that was downloaded
+            for url in infoJson.iterTileUrls(declaredOnly=isStatic(infoJson)):
+                expected.add(url.replace(infoJson.id, name))
+    return expected
+
+
+def checkBag(report: Report, bag: Dict[str, Dict[str, str]], checksums: Dict[str, Tuple[str, Optional[str]]], corrupt: Set[str]):
+    """Compare the checksums of the entries with the ones in the BagIt manifests. Entries in corrupt couldn't be read."""
+    for algorithm, listed in bag.items():
+        index = 0 if algorithm == "sha256" else 1
+        for name, checksum in sorted(listed.items()):
+            if name in corrupt:
+                continue
+            elif name not in checksums:
+                report.error(f"{name} is in {BAG_MANIFESTS[algorithm]} but not in the archive")
+            elif checksums[name][index] != checksum:
+                report.error(f"{name} doesn't match its {algorithm} in {BAG_MANIFESTS[algorithm]}")
+        for name in sorted((set(checksums) | corrupt) - set(listed)):
+            report.error(f"{name} isn't listed in {BAG_MANIFESTS[algorithm]}")
+
+
+def verify(zipFile: str, workers: Optional[int] = None) -> Report:
+    """Check every entry of zipFile against its CRC-32 and the archive's BagIt manifests, and that nothing is missing.
+
+    The entries are read in batches by a pool of worker processes, one per CPU unless workers says otherwise,
+    so hashing a large archive isn't limited to one core. MD5s are only checked if the archive has manifest-md5.txt.
+    The config the archive was made with needs to be loaded, as no_delay_level0 decides which tiles it has.
+    """
+    report = Report(zipFile)
+    with zipfile.ZipFile(zipFile) as zf:
+        infos = [info for info in zf.infolist() if not info.is_dir() and info.filename not in BAG_MANIFESTS.values()]
+        bag = {algorithm: parseBagManifest(zf.read(name)) for algorithm, name in BAG_MANIFESTS.items() if name in zf.NameToInfo}
+        with stage("check manifest", zip_file=zipFile):
+            for name in sorted(expectedEntries(zf) - set(zf.NameToInfo)):
+                report.error(f"{name} is in manifest.json but not in the archive")
+
+    report.algorithms = list(bag)
+    report.entries = len(infos)
+    report.bytes = sum(info.file_size for info in infos)
+    names = [info.filename for info in infos]
+    checksums = {}
+    corrupt = set()
+    with stage("hash entries", zip_file=zipFile, entries=len(names)), ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(hashEntries, zipFile, names[start:start + BATCH_SIZE], "md5" in bag) for start in range(0, len(names), BATCH_SIZE)]
+        for future in futures:
+            found, errors = future.result()
+            checksums.update(found)
+            corrupt.update(errors)
+            for name, error in errors.items():
+                report.error(f"{name} is corrupt: {error}")
+
+    checkBag(report, bag, checksums, corrupt)
+    return report
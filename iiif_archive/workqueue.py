@@ -0,0 +1,332 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+from iiif_archive.config import get_config
+
+from .archive import listFiles, zipDirectory
+from .blobstore import BlobStore
+from .downloader import (downloadAsset, downloadTiles, dumpJson, fetchJson,
+                         isStatic, jsonDigest, knownChecksums, loadInfoJson,
+                         localName, sources)
+from .fixity import writeBagManifests
+from .journal import Journal
+from .processors import infoJson_factory, manifest_factory
+from .scheduler import create_scheduler
+from .session import create_session
+from .update import SOURCES
+
+logger = logging.getLogger(__name__)
+
+# Layout of a queue directory: the SQLite file holding the units and journal, and the files downloaded
+QUEUE_DB = "queue.sqlite"
+FILES_DIR = "files"
+# Tiles of one image handed out as a single unit of work
+TILES_PER_UNIT = 500
+# Seconds a worker may go without renewing its lease on a unit before another worker may take it.
+# The lease is renewed every third of this while the unit is worked on, so a unit can take longer.
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+# Seconds an idle worker waits before checking for units whose lease has run out
+POLL_SECONDS = 5
+
+
+class Unit(NamedTuple):
+    id: int
+    kind: str
+    url: str
+    name: str
+    start: int
+    stop: int
+
+
+class WorkQueue:
+    """The units of work for archiving one manifest, kept in a SQLite file on a filesystem every worker can reach.
+
+    A unit is either one asset or a range of an image's tiles. A worker claims a unit with a lease,
+    which it renews while it works on the unit. Another worker may take the unit over if the lease
+    runs out before it is completed, so a worker that dies doesn't lose its work. Leases use the
+    wall clock so the workers' clocks need to agree.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS units (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, url TEXT NOT NULL, name TEXT NOT NULL, start INTEGER NOT NULL, stop INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._lock = threading.Lock()
+
+    def add(self, units):
+        """Add (kind, url, name, start, stop) units."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT INTO units (kind, url, name, start, stop) VALUES (?, ?, ?, ?, ?)", units)
+            self._conn.execute("COMMIT")
+
+    def setMeta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def getMeta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def claim(self, worker: str, lease: float = LEASE_SECONDS) -> Optional[Unit]:
+        """Lease the next unit that is pending or whose lease has run out, or None if there isn't one."""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock first so two workers can't claim the same unit
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT id, kind, url, name, start, stop FROM units WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE units SET status = 'leased', worker = ?, lease_until = ? WHERE id = ?", (worker, now + lease, row[0]))
+            finally:
+                self._conn.execute("COMMIT")
+
+        return Unit(*row) if row else None
+
+    def renew(self, unit: Unit, worker: str, lease: float = LEASE_SECONDS) -> bool:
+        """Extend worker's lease on unit to lease seconds from now. Returns False if another worker has taken it."""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE units SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'", (time.time() + lease, unit.id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, unit: Unit, worker: str):
+        with self._lock:
+            self._conn.execute("UPDATE units SET status = 'done', error = NULL WHERE id = ? AND worker = ?", (unit.id, worker))
+
+    def fail(self, unit: Unit, worker: str, error: str, maxAttempts: int = MAX_ATTEMPTS):
+        """Put the unit back for another try, or mark it failed once it has had maxAttempts."""
+        with self._lock:
+            self._conn.execute("UPDATE units SET attempts = attempts + 1, error = ?, worker = NULL, lease_until = NULL, status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE id = ? AND worker = ?", (error, maxAttempts, unit.id, worker))
+
+    def retryFailed(self) -> int:
+        """Put every failed unit back as pending with its attempts reset. Returns how many there were."""
+        with self._lock:
+            return self._conn.execute("UPDATE units SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    def skipFailed(self) -> int:
+        """Give up on every failed unit, so the queue can be merged without their files. Returns how many there were."""
+        with self._lock:
+            return self._conn.execute("UPDATE units SET status = 'skipped' WHERE status = 'failed'").rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+
+        return {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed", "skipped")}
+
+    def failed(self) -> List[Unit]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, kind, url, name, start, stop FROM units WHERE status = 'failed' ORDER BY id").fetchall()
+
+        return [Unit(*row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def openQueue(queueDir: str):
+    # Paths in the journal are relative to the queue directory, which each machine may mount somewhere else
+    return WorkQueue(os.path.join(queueDir, QUEUE_DB)), Journal(os.path.join(queueDir, QUEUE_DB), shared=True, root=queueDir)
+
+
+def defaultWorker() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def enqueue(url: str, queueDir: str, tilesPerUnit: int = TILES_PER_UNIT) -> int:
+    """Split the manifest at url into units of work in queueDir. Returns the number of units.
+
+    The manifest and every info.json are fetched here, the info.json files concurrently, so the tiles
+    can be counted and split into ranges. If url is already queued in queueDir nothing is added again.
+
+    Raises:
+        ValueError: If queueDir already has the units of a different manifest.
+    """
+    config = get_config()
+    filesDir = os.path.join(queueDir, FILES_DIR)
+    os.makedirs(filesDir, exist_ok=True)
+
+    queue, journal = openQueue(queueDir)
+    with queue, journal, create_session(config) as session:
+        queued = sum(queue.counts().values())
+        if queued and queue.getMeta("url") != url:
+            raise ValueError(f"{queueDir} already has the units of {queue.getMeta('url')}, use a new directory for {url}")
+        elif queued:
+            logger.info(f"{url} is already queued in {queueDir} with {queued} units")
+            return queued
+
+        manifest = manifest_factory(fetchJson(url, session))
+        units = []
+        images = []
+        names = {}
+        queued = set()
+        for container in manifest.containers():
+            name = localName(container, names)
+            if name not in queued:
+                if container.isDownloadable():
+                    units.append(("asset", container.url, name, 0, 0))
+                else:
+                    images.append((container.url, name))
+                queued.add(name)
+            container.url = name
+
+        def loadImage(image):
+            imageUrl, name = image
+            return imageUrl, name, loadInfoJson(imageUrl, os.path.join(filesDir, name), session)
+
+        with ThreadPoolExecutor(max_workers=config.workers) as pool:
+            for imageUrl, name, infoJson in pool.map(loadImage, images):
+                journal.record(f"{imageUrl}/info.json", os.path.join(filesDir, name, "info.json"), len(dumpJson(infoJson.data)), jsonDigest(infoJson.data))
+                count = infoJson.tileCount(declaredOnly=isStatic(infoJson))
+                for start in range(0, count, tilesPerUnit):
+                    units.append(("tiles", imageUrl, name, start, min(start + tilesPerUnit, count)))
+
+        # Before the units, so a queue with units always has them
+        queue.setMeta("url", url)
+        queue.setMeta("manifest", json.dumps(manifest.data))
+        queue.add(units)
+
+    logger.info(f"Queued {len(units)} units of work for {url} in {queueDir}")
+    return len(units)
+
+
+def runUnit(unit: Unit, filesDir: str, session, scheduler, journal, store=None):
+    filename = os.path.join(filesDir, unit.name)
+    if unit.kind == "asset":
+        downloadAsset(filename, unit.url, session, journal=journal, store=store)
+    else:
+        with open(os.path.join(filename, "info.json")) as f:
+            infoJson = infoJson_factory(json.load(f))
+
+        tasks = scheduler.group()
+        downloadTiles(filename, infoJson, session, tasks, journal=journal, store=store, start=unit.start, stop=unit.stop)
+        tasks.wait()
+
+
+@contextmanager
+def keepLease(queue: WorkQueue, unit: Unit, worker: str, lease: float):
+    """Renew worker's lease on unit every third of lease while the block runs, so it isn't taken over while it is still being worked on."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease / 3):
+            if not queue.renew(unit, worker, lease):
+                logger.warning(f"{worker} lost its lease on unit {unit.id} to another worker")
+                return
+
+    thread = threading.Thread(target=renew, name=f"lease-{unit.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def work(queueDir: str, worker: Optional[str] = None, lease: float = LEASE_SECONDS, wait: bool = True) -> int:
+    """Claim and complete units from the queue in queueDir until there are none left. Returns the number completed.
+
+    If wait is set an idle worker stays until every unit is done, taking over any whose lease runs out.
+    """
+    config = get_config()
+    worker = worker or defaultWorker()
+    filesDir = os.path.join(queueDir, FILES_DIR)
+    completed = 0
+
+    queue, journal = openQueue(queueDir)
+    with ExitStack() as stack:
+        stack.enter_context(queue)
+        stack.enter_context(journal)
+        session = stack.enter_context(create_session(config))
+        scheduler = stack.enter_context(create_scheduler(config))
+        store = stack.enter_context(BlobStore(config.blob_dir, config.blob_max_size * 1024 * 1024)) if config.blob_dir else None
+        session.metrics.gauge("queue_depth", lambda: scheduler.queued)
+        session.metrics.gauge("units_pending", lambda: queue.counts()["pending"])
+
+        while True:
+            unit = queue.claim(worker, lease)
+            if unit is None:
+                counts = queue.counts()
+                if not wait or counts["pending"] + counts["leased"] == 0:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+
+            try:
+                with keepLease(queue, unit, worker, lease):
+                    runUnit(unit, filesDir, session, scheduler, journal, store)
+            except Exception as e:
+                logger.error(f"Unit {unit.id} ({unit.kind} {unit.url}) failed: {e}")
+                queue.fail(unit, worker, f"{type(e).__name__}: {e}")
+            else:
+                queue.complete(unit, worker)
+                completed += 1
+
+    logger.info(f"{worker} completed {completed} units")
+    return completed
+
+
+def merge(queueDir: str, zipFileName: str) -> str:
+    """Zip the files downloaded by the workers once every unit is done, or has been skipped."""
+    config = get_config()
+    filesDir = os.path.join(queueDir, FILES_DIR)
+
+    queue, journal = openQueue(queueDir)
+    with queue, journal:
+        counts = queue.counts()
+        if counts["done"] + counts["skipped"] != sum(counts.values()):
+            raise RuntimeError(f"Can't merge {queueDir} until every unit is done or skipped: {counts}")
+        if counts["skipped"]:
+            logger.warning(f"Merging {queueDir} without the files of {counts['skipped']} skipped units")
+
+        with open(os.path.join(filesDir, "manifest.json"), "wb") as f:
+            f.write(dumpJson(json.loads(queue.getMeta("manifest"))))
+        sourcesData = sources(journal, filesDir)
+        with open(os.path.join(filesDir, SOURCES), "wb") as f:
+            f.write(dumpJson(sourcesData))
+        writeBagManifests(filesDir, listFiles(filesDir), knownChecksums(sourcesData), config.checksum_md5)
+
+    zipDirectory(filesDir, zipFileName, config.compress_level, config.compress_workers or None)
+    return zipFileName
+
+
+def status(queueDir: str) -> Dict[str, int]:
+    queue, journal = openQueue(queueDir)
+    with queue, journal:
+        return queue.counts()
+
+
+def failures(queueDir: str) -> List[Unit]:
+    queue, journal = openQueue(queueDir)
+    with queue, journal:
+        return queue.failed()
+
+
+def retry(queueDir: str) -> int:
+    queue, journal = openQueue(queueDir)
+    with queue, journal:
+        return queue.retryFailed()
+
+
+def skip(queueDir: str) -> int:
+    queue, journal = openQueue(queueDir)
+    with queue, journal:
+        return queue.skipFailed()
@@ -2,6 +2,7 @@ import argparse
 import logging
 
 from iiif_archive import decompressor
+from iiif_archive.tracing import tracing
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -10,8 +11,13 @@ if __name__ == "__main__":
     parser.add_argument("zip_file", help="zip_file to inflate")
     parser.add_argument("local_dir", help="directory to inflate zip file to")
     parser.add_argument("base_url", help="base URL that the manifest will be served at")
+    parser.add_argument("--workers", type=int, help="Threads used to extract the zip file. Default: one per CPU")
+
+    parser.add_argument("--trace", type=str, help="Write a trace of where the time goes to this file, for chrome://tracing or Perfetto.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record the peak memory of each stage of the trace (slower).")
 
     args = parser.parse_args()
-    dir = decompressor.inflate(args.zip_file, args.local_dir, args.base_url)
+    with tracing(args.trace, args.trace_memory):
+        dir = decompressor.inflate(args.zip_file, args.local_dir, args.base_url, args.workers)
 
     print(f"Inflated to: {dir}")
@@ -0,0 +1,17 @@
+import argparse
+import logging
+
+from iiif_archive import decompressor
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Copy a zipped Manifest with its ids pointing at a new base URL")
+    parser.add_argument("zip_file", help="zip_file to rebase")
+    parser.add_argument("out_file", help="zip file to write, may be the same as zip_file")
+    parser.add_argument("base_url", help="URL the contents of the zip file will be served from")
+
+    args = parser.parse_args()
+    filename = decompressor.rebase(args.zip_file, args.out_file, args.base_url)
+
+    print(f"Rebased to: {filename}")
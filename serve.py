@@ -0,0 +1,16 @@
+import argparse
+import logging
+
+from iiif_archive import server
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Serve a directory of zipped Manifests without extracting them")
+    parser.add_argument("directory", help="directory containing the zip files")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on. Default: 8000")
+    parser.add_argument("--base-url", type=str, help="URL the server is reached at, e.g. behind a proxy. Default: the Host of each request")
+
+    args = parser.parse_args()
+    server.serve(args.directory, args.host, args.port, args.base_url)
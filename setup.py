@@ -19,6 +19,14 @@ REQUIREMENTS = [
 DOCS_REQUIREMENTS = [
 ]
 
+PYRAMID_REQUIREMENTS = [
+    "pillow >=9.1.0"
+]
+
+ASYNCIO_REQUIREMENTS = [
+    "aiohttp >=3.8.0"
+]
+
 DEV_REQUIREMENTS = [
     "autopep8 >=1.6.0, <3.0.0",
     "isort >=5.10.1, <6.0.0",
@@ -59,5 +67,7 @@ setup(
     extras_require={
         "docs": DOCS_REQUIREMENTS,
         "dev": DEV_REQUIREMENTS,
+        "pyramid": PYRAMID_REQUIREMENTS,
+        "asyncio": ASYNCIO_REQUIREMENTS,
     },
 )
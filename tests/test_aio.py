@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from benchmarks.mockserver import Handler, MockIIIFServer
+from iiif_archive.aio import AsyncDownloader, aiohttp
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.session import create_session
+
+BUSY_TILE = "/iiif/image0/0,0,512,512/512,512/0/default.jpg"
+MISSING_TILE = "/iiif/image1/0,0,512,512/512,512/0/default.jpg"
+DROPPED_TILE = "/iiif/image1/512,0,512,512/512,512/0/default.jpg"
+
+
+class FlakyHandler(Handler):
+    """Says 503 to the first request for BUSY_TILE, 404 to every request for MISSING_TILE and hangs up on DROPPED_TILE."""
+
+    def do_GET(self):
+        if self.path == MISSING_TILE:
+            self.sendStatus(404)
+        elif self.path == DROPPED_TILE:
+            self.close_connection = True
+        elif self.path == BUSY_TILE and not self.server.busy:
+            self.server.busy = True
+            self.sendStatus(503)
+        else:
+            super().do_GET()
+
+
+@unittest.skipUnless(aiohttp, "The asyncio engine needs aiohttp")
+class TestAsyncio(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.server = MockIIIFServer(canvases=2, latency=0).start()
+        self.manifest = f"{self.server.url}/manifest.json"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return self.temp_dir.cleanup()
+
+    def archive(self, engine, name, **kwargs):
+        # Delays as strings, as older versions of deflate.py passed them
+        config = load_config("tests/test-config.ini", {"engine": engine, "async_requests": 8, "delay": "0", "retry_delay": "0"})
+        with create_session(config) as session:
+            zipFile = download(self.manifest, os.path.join(self.test_path, name), os.path.join(self.test_path, engine), session=session, **kwargs)
+        with zipfile.ZipFile(zipFile) as zf:
+            return {info.filename: info.file_size for info in zf.infolist()}, session.metrics.snapshot()
+
+    def test_same_as_threads(self):
+        threads, _ = self.archive("threads", "threads.zip")
+        entries, metrics = self.archive("asyncio", "asyncio.zip")
+
+        self.assertEqual(threads, entries, "Expected the same archive from both engines")
+        self.assertIn("sources.json", entries)
+        self.assertIn("image1/info.json", entries)
+        self.assertIn("manifest-sha256.txt", entries)
+        self.assertEqual(len(entries) - 2, metrics["requests"], "Expected one request for everything but sources.json and the bag manifest")
+        self.assertEqual(len(entries) - 5, metrics["files"], "Expected every tile counted")
+
+    def test_retry_and_skip(self):
+        self.server.busy = False
+        self.server.retryAfter = 0
+        self.server.RequestHandlerClass = FlakyHandler
+        entries, metrics = self.archive("asyncio", "flaky.zip")
+
+        self.assertIn(BUSY_TILE.replace("/iiif/", ""), entries, "Expected the tile to be retried after the 503")
+        self.assertNotIn(MISSING_TILE.replace("/iiif/", ""), entries, "Expected the missing tile to be skipped")
+        self.assertNotIn(DROPPED_TILE.replace("/iiif/", ""), entries, "Expected the tile the connection dropped on to be skipped")
+        host = next(iter(metrics["hosts"].values()))
+        self.assertEqual({"503": 1}, host["retries"])
+        self.assertEqual({"404": 1}, host["failures"])
+
+    def test_resume(self):
+        first, _ = self.archive("asyncio", "image.zip")
+        # The scratch directory and journal are still there so nothing needs downloading again
+        entries, metrics = self.archive("asyncio", "image.zip")
+        self.assertEqual(first.keys(), entries.keys())
+        self.assertEqual(0, metrics["requests"])
+
+    def test_level0_limiter(self):
+        config = load_config("tests/test-config.ini", {"per_host": 2, "level0_per_host": 6, "delay": 1})
+        downloader = AsyncDownloader(config)
+        host = downloader.host(self.manifest)
+        static = downloader.host(f"{self.server.url}/iiif/image0", static=True)
+
+        self.assertIsNot(host, static, "Expected level 0 images not to share the limiter of other services on the host")
+        self.assertEqual((2, 1.0), (host.concurrency, host.delay))
+        self.assertEqual((6, 0), (static.concurrency, static.delay))
+        self.assertIs(static, downloader.host(f"{self.server.url}/iiif/image1", static=True))
+
+    def test_unsupported(self):
+        load_config("tests/test-config.ini", {"engine": "asyncio"})
+        with self.assertRaises(ValueError):
+            download(self.manifest, os.path.join(self.test_path, "stream.zip"), self.test_path, stream=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
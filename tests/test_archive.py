@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.archive import ZipStream, copyEntry, zipDirectory
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from tests.utils import MockAssetResponse, mockResponse
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def entries(self, zipFile):
+        with zipfile.ZipFile(zipFile) as zf:
+            return {info.filename: info.CRC for info in zf.infolist()}
+
+    @patch("requests.Session.get")
+    def test_stream(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        manifest = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+
+        scratch = os.path.join(self.test_path, "scratch")
+        expected = self.entries(download(manifest, os.path.join(self.test_path, "dir.zip"), scratch))
+
+        streamScratch = os.path.join(self.test_path, "stream_scratch")
+        zipFile = download(manifest, os.path.join(self.test_path, "stream.zip"), streamScratch, stream=True)
+
+        self.assertFalse(os.path.exists(streamScratch), "Expected nothing to be written to the scratch directory")
+        self.assertEqual(expected, self.entries(zipFile), "Expected the same entries as the scratch directory zip")
+
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual("manifest.json", zf.infolist()[-1].filename, "Expected manifest to be the last entry")
+            manifest = json.loads(zf.read("manifest.json"))
+            self.assertEqual("918ecd18c2592080851777620de9bcb5-gottingen", manifest["items"][0]["items"][0]["items"][0]["body"]["service"][0]["id"], "Expected IIIF image id to be updated")
+
+    def test_compression_per_entry(self):
+        source = os.path.join(self.test_path, "source")
+        os.makedirs(os.path.join(source, "image", "full", "max", "0"))
+        shutil.copy("tests/fixtures/3.0/0005-image-service.json", os.path.join(source, "manifest.json"))
+        shutil.copy("tests/fixtures/3.0/gottingen-info.json", os.path.join(source, "image", "info.json"))
+        shutil.copy("tests/fixtures/assets/image.png", os.path.join(source, "image", "full", "max", "0", "default.png"))
+
+        zipFile = os.path.join(self.test_path, "compressed.zip")
+        zipDirectory(source, zipFile, compressLevel=9, workers=2)
+
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual(zipfile.ZIP_DEFLATED, zf.getinfo("manifest.json").compress_type, "Expected JSON to be deflated")
+            self.assertEqual(zipfile.ZIP_DEFLATED, zf.getinfo("image/info.json").compress_type, "Expected JSON to be deflated")
+            self.assertEqual(zipfile.ZIP_STORED, zf.getinfo("image/full/max/0/default.png").compress_type, "Expected media to be stored")
+
+            with open("tests/fixtures/3.0/gottingen-info.json", "rb") as f:
+                self.assertEqual(f.read(), zf.read("image/info.json"), "Expected JSON to survive compression")
+
+    @patch("iiif_archive.archive.DEFLATE_AHEAD", 100)
+    @patch("iiif_archive.archive.STREAM_DEFLATE_SIZE", 1000)
+    def test_large_files_streamed(self):
+        source = os.path.join(self.test_path, "source")
+        os.makedirs(source)
+        contents = {}
+        for i in range(20):
+            # Alternately over and under STREAM_DEFLATE_SIZE, with media in between
+            name = f"{i:02}.wav" if i % 3 else f"{i:02}.png"
+            contents[name] = os.urandom(10) * (500 if i % 2 else 50)
+            with open(os.path.join(source, name), "wb") as f:
+                f.write(contents[name])
+
+        zipFile = os.path.join(self.test_path, "large.zip")
+        zipDirectory(source, zipFile, workers=2)
+
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual(sorted(contents), zf.namelist(), "Expected the entries in sorted order")
+            self.assertEqual(contents, {name: zf.read(name) for name in zf.namelist()})
+            self.assertEqual(zipfile.ZIP_DEFLATED, zf.getinfo("01.wav").compress_type, "Expected large files to be deflated too")
+
+    @patch("iiif_archive.archive.STREAM_DEFLATE_SIZE", 1000)
+    def test_stream_large_files(self):
+        zipFile = os.path.join(self.test_path, "stream.zip")
+        contents = {"small.wav": os.urandom(10) * 50, "large.wav": os.urandom(10) * 500, "large.mkv": os.urandom(5000)}
+        with ZipStream(zipFile, self.test_path, md5=True) as archive:
+            for name, data in contents.items():
+                with archive.open(os.path.join(self.test_path, name)) as f:
+                    f.write(data)
+
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual(contents, {name: zf.read(name) for name in zf.namelist()})
+            self.assertEqual(zipfile.ZIP_DEFLATED, zf.getinfo("large.wav").compress_type, "Expected large files to be deflated in chunks")
+            self.assertLess(zf.getinfo("large.wav").compress_size, 5000, "Expected large files to be compressed")
+            self.assertEqual(zipfile.ZIP_STORED, zf.getinfo("large.mkv").compress_type, "Expected video to be stored")
+        large = contents["large.wav"]
+        self.assertEqual((hashlib.sha256(large).hexdigest(), hashlib.md5(large).hexdigest()), archive.checksums["large.wav"])
+
+    def test_copy_keeps_position(self):
+        source = os.path.join(self.test_path, "source")
+        os.makedirs(source)
+        shutil.copy("tests/fixtures/3.0/gottingen-info.json", os.path.join(source, "info.json"))
+        shutil.copy("tests/fixtures/assets/image.png", os.path.join(source, "default.png"))
+        zipFile = os.path.join(self.test_path, "source.zip")
+        zipDirectory(source, zipFile)
+
+        copy = os.path.join(self.test_path, "copy.zip")
+        with open(zipFile, "rb") as f, zipfile.ZipFile(f) as zf, zipfile.ZipFile(copy, "w") as dest:
+            # Where a ZipFile reading the same file in another thread could be
+            f.seek(7)
+            for info in zf.infolist():
+                copyEntry(f, info, dest, info.filename)
+            self.assertEqual(7, f.tell(), "Expected the copy not to move the file position")
+
+        with zipfile.ZipFile(zipFile) as original, zipfile.ZipFile(copy) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            for name in original.namelist():
+                self.assertEqual(original.read(name), zf.read(name))
+
+
+if __name__ == "__main__":
+    unittest.main()
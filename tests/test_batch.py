@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from iiif_archive.batch import defaultName, readJobs, runBatch, writeReport
+from iiif_archive.config import load_config
+from tests.utils import MockAssetResponse, mockResponse
+
+
+def mock_response(url, *args, **kwargs):
+    if "missing" in url:
+        return MockAssetResponse("tests/fixtures/assets/image.png", 404)
+    elif "0005-image-service/manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "0002-mvm-audio/manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0002-mvm-audio.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    elif url.endswith(".mp4"):
+        return MockAssetResponse("tests/fixtures/assets/audio.wav")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+        self.jobsFile = os.path.join(self.test_path, "manifests.txt")
+        with open(self.jobsFile, "w") as f:
+            f.write("# Cookbook recipes\n")
+            f.write("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json image\n")
+            f.write("\n")
+            f.write("https://iiif.io/api/cookbook/recipe/0002-mvm-audio/manifest.json\taudio\n")
+            f.write("https://example.org/missing/manifest.json\n")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_read_jobs(self):
+        jobs = readJobs(self.jobsFile)
+        self.assertEqual(["image", "audio", "example.org-missing-manifest"], [job.name for job in jobs])
+
+        with open(self.jobsFile, "a") as f:
+            f.write("https://example.org/other/manifest.json image\n")
+        with self.assertRaises(ValueError):
+            readJobs(self.jobsFile)
+
+    def test_default_name(self):
+        self.assertEqual("iiif.io-api-cookbook-recipe-0001-mvm-image-manifest", defaultName("https://iiif.io/api/cookbook/recipe/0001-mvm-image/manifest.json"))
+
+    @patch("requests.Session.get")
+    def test_batch(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        output = os.path.join(self.test_path, "zips")
+
+        results = runBatch(readJobs(self.jobsFile), output, os.path.join(self.test_path, "scratch"), concurrency=2)
+
+        self.assertEqual(["ok", "ok", "failed"], [result.status for result in results])
+        self.assertTrue(os.path.exists(os.path.join(output, "image.zip")))
+        self.assertTrue(os.path.exists(os.path.join(output, "audio.zip")))
+        self.assertIn("HTTPError", results[2].error)
+        self.assertEqual(os.path.getsize(os.path.join(output, "audio.zip")), results[1].bytes)
+
+        summary = writeReport(results, os.path.join(self.test_path, "report.json"))
+        self.assertEqual(2, summary["ok"])
+        self.assertEqual(1, summary["failed"])
+        with open(os.path.join(self.test_path, "report.json")) as f:
+            report = json.load(f)
+        self.assertEqual("image", report["manifests"][0]["name"])
+
+        mockRequest.reset_mock()
+        results = runBatch(readJobs(self.jobsFile), output, os.path.join(self.test_path, "scratch"))
+        self.assertEqual(["skipped", "skipped", "failed"], [result.status for result in results], "Expected finished manifests not to be archived again")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import MagicMock, patch
+
+from iiif_archive.blobstore import BlobStore
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download, downloadAsset, localName
+from tests.utils import MockAssetResponse, mockResponse
+
+MANIFEST = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.blobDir = os.path.join(self.test_path, "blobs")
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def writeFile(self, name, data):
+        filename = os.path.join(self.test_path, name)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+
+    def test_dedupe(self):
+        with BlobStore(self.blobDir) as store:
+            store.add("https://example.org/a.jpg", self.writeFile("a.jpg", b"same"), 4, "ab" * 32)
+            store.add("https://example.com/b.jpg", self.writeFile("b.jpg", b"same"), 4, "ab" * 32)
+
+            self.assertEqual(4, store.size, "Expected identical content to be stored once")
+            self.assertEqual(store.get("https://example.org/a.jpg"), store.get("https://example.com/b.jpg"))
+
+            filename = os.path.join(self.test_path, "c.jpg")
+            self.assertEqual((4, "ab" * 32), store.fetch("https://example.com/b.jpg", filename))
+            with open(filename, "rb") as f:
+                self.assertEqual(b"same", f.read())
+
+    def test_eviction(self):
+        with BlobStore(self.blobDir, maxSize=10) as store:
+            for i, sha256 in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+                store.add(f"https://example.org/{i}.jpg", self.writeFile(f"{i}.jpg", b"12345"), 5, sha256)
+                # Reading the first file keeps it in the store
+                store.get("https://example.org/0.jpg")
+
+            self.assertEqual(10, store.size)
+            self.assertIsNotNone(store.get("https://example.org/0.jpg"), "Expected recently used file to be kept")
+            self.assertIsNone(store.get("https://example.org/1.jpg"), "Expected least recently used file to be evicted")
+            self.assertFalse(os.path.exists(store.path("bb" * 32)))
+
+    def test_shared_by_processes(self):
+        # Two stores open on one directory, as jobs in two processes would have
+        with BlobStore(self.blobDir, maxSize=10) as first, BlobStore(self.blobDir, maxSize=10) as second:
+            first.add("https://example.org/0.jpg", self.writeFile("0.jpg", b"12345"), 5, "aa" * 32)
+            self.assertIsNotNone(second.get("https://example.org/0.jpg"))
+
+            second.add("https://example.org/1.jpg", self.writeFile("1.jpg", b"12345"), 5, "bb" * 32)
+            second.add("https://example.org/2.jpg", self.writeFile("2.jpg", b"12345"), 5, "cc" * 32)
+            self.assertEqual(10, first.size, "Expected the size to include what the other store added")
+
+            # Evicted by the other store after it was found
+            with patch.object(first, "get", return_value=("aa" * 32, 5)):
+                self.assertIsNone(first.fetch("https://example.org/0.jpg", os.path.join(self.test_path, "copy.jpg")))
+
+    def test_download_asset(self):
+        session = MagicMock()
+        session.get.return_value = MockAssetResponse("tests/fixtures/assets/image.png")
+
+        with BlobStore(self.blobDir) as store:
+            downloadAsset(os.path.join(self.test_path, "one.png"), "https://example.org/image.png", session, store=store)
+            downloadAsset(os.path.join(self.test_path, "two.png"), "https://example.org/image.png", session, store=store)
+
+        self.assertEqual(1, session.get.call_count, "Expected second copy to come from the blob store")
+        self.assertEqual(os.path.getsize("tests/fixtures/assets/image.png"), os.path.getsize(os.path.join(self.test_path, "two.png")))
+
+    @patch("requests.Session.get")
+    def test_shared_between_archives(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        load_config("tests/test-config.ini", {"blob_dir": self.blobDir})
+
+        download(MANIFEST, os.path.join(self.test_path, "first.zip"), self.test_path)
+        tiles = mockRequest.call_count - 2
+
+        mockRequest.reset_mock()
+        zipFile = download(MANIFEST, os.path.join(self.test_path, "second.zip"), self.test_path)
+        self.assertEqual(2, mockRequest.call_count, "Expected only the manifest and info.json to be requested again")
+
+        mockRequest.reset_mock()
+        streamed = download(MANIFEST, os.path.join(self.test_path, "third.zip"), self.test_path, stream=True)
+        self.assertEqual(2, mockRequest.call_count, "Expected streamed archive to reuse the blob store")
+
+        for name in (zipFile, streamed):
+            with zipfile.ZipFile(name) as zf:
+                self.assertEqual(tiles, len([entry for entry in zf.namelist() if entry.endswith(".jpg")]), f"Expected every tile in {name}")
+
+    def test_local_name(self):
+        names = {}
+        first = MagicMock(url="https://example.org/a/default.jpg", filename="default.jpg")
+        second = MagicMock(url="https://example.org/b/default.jpg", filename="default.jpg")
+        again = MagicMock(url="https://example.org/a/default.jpg", filename="default.jpg")
+
+        self.assertEqual("default.jpg", localName(first, names))
+        self.assertNotEqual("default.jpg", localName(second, names), "Expected different URLs not to share a file")
+        self.assertTrue(localName(second, names).endswith(".jpg"))
+        self.assertEqual("default.jpg", localName(again, names), "Expected the same URL to share a file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.processors import collection_factory, isCollection
+from tests.utils import MockAssetResponse, mockResponse
+
+TOP_COLLECTION = "https://example.org/iiif/collection/top.json"
+
+
+def mock_response(url, *args, **kwargs):
+    if url == TOP_COLLECTION:
+        return mockResponse("tests/fixtures/3.0/collection.json")
+    elif url == "https://example.org/iiif/collection/images.json":
+        return mockResponse("tests/fixtures/3.0/collection-images.json")
+    elif url == "https://example.org/iiif/collection/v2.json":
+        return mockResponse("tests/fixtures/2.0/collection.json")
+    elif url == "https://example.org/iiif/simple_image/manifest.json":
+        return mockResponse("tests/fixtures/2.0/simple_image.json")
+    elif "0002-mvm-audio" in url or "audio/manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0002-mvm-audio.json")
+    elif "manifest.json" in url:
+        # Two manifests of the same image
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    elif url.endswith(".mp4"):
+        return MockAssetResponse("tests/fixtures/assets/audio.wav")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestCollection(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_members(self):
+        with open("tests/fixtures/3.0/collection.json") as f:
+            data = json.load(f)
+        self.assertTrue(isCollection(data))
+        collection = collection_factory(data)
+        self.assertEqual(["https://example.org/iiif/collection/images.json"], collection.collections())
+        self.assertEqual(["https://iiif.io/api/cookbook/recipe/0002-mvm-audio/manifest.json"], collection.manifests())
+
+        with open("tests/fixtures/3.0/0005-image-service.json") as f:
+            self.assertFalse(isCollection(json.load(f)))
+
+        # Version 2 members lists collections and manifests together
+        collection = collection_factory({
+            "@context": "http://iiif.io/api/presentation/2/context.json",
+            "@id": "https://example.org/iiif/collection/members.json",
+            "@type": "sc:Collection",
+            "members": [
+                {"@id": "https://example.org/iiif/manifest.json", "@type": "sc:Manifest", "label": "Manifest"},
+                {"@id": "https://example.org/iiif/collection/sub.json", "@type": "sc:Collection", "label": "Sub collection"}
+            ]
+        })
+        self.assertEqual(["Manifest", "Collection"], [member["type"] for member in collection.members()])
+
+    @patch("requests.Session.get")
+    def test_collection(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        outputDir = download(TOP_COLLECTION, os.path.join(self.test_path, "recipes.zip"), os.path.join(self.test_path, "scratch"))
+
+        self.assertEqual(os.path.join(self.test_path, "recipes"), outputDir)
+        requests = Counter(call.args[0] for call in mockRequest.call_args_list)
+        self.assertEqual(1, requests[TOP_COLLECTION], "Expected a collection listed by its own member to be fetched once")
+        self.assertEqual(1, requests["https://iiif.io/api/cookbook/recipe/0002-mvm-audio/manifest.json"], "Expected a manifest in two collections to be archived once")
+        tiles = [url for url in requests if url.endswith("default.jpg")]
+        self.assertTrue(tiles)
+        self.assertTrue(all(requests[url] == 1 for url in tiles), "Expected tiles shared by two manifests to be downloaded once")
+
+        with open(os.path.join(outputDir, "index.json")) as f:
+            index = json.load(f)
+        self.assertEqual(TOP_COLLECTION, index["id"])
+        images = index["items"][1]
+        self.assertEqual(["Manifest", "Manifest", "Manifest", "Collection"], [item["type"] for item in images["items"]])
+        self.assertNotIn("items", images["items"][3], "Expected the loop back to the top collection not to be followed")
+        for item in images["items"][:3]:
+            self.assertEqual("ok", item["status"])
+            self.assertTrue(os.path.exists(os.path.join(outputDir, item["zip"])), f"Expected to find {item['zip']}")
+        self.assertEqual(3, len([name for name in os.listdir(outputDir) if name.endswith(".zip")]))
+
+    @patch("requests.Session.get")
+    def test_version2_collection(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        outputDir = download("https://example.org/iiif/collection/v2.json", os.path.join(self.test_path, "v2"), os.path.join(self.test_path, "scratch"), stream=True)
+
+        with open(os.path.join(outputDir, "index.json")) as f:
+            index = json.load(f)
+        self.assertEqual(["Simple image", "Audio"], [item["label"] for item in index["items"]])
+        self.assertEqual(["ok", "ok"], [item["status"] for item in index["items"]])
+        self.assertTrue(os.path.exists(os.path.join(outputDir, "example.org-iiif-simple_image-manifest.zip")))
+
+
+if __name__ == "__main__":
+    unittest.main()
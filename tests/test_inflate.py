@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.decompressor import inflate, rebase
+from iiif_archive.downloader import download
+from tests.utils import MockAssetResponse, mockResponse
+
+IMAGE = "918ecd18c2592080851777620de9bcb5-gottingen"
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestInflate(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    @patch("requests.Session.get")
+    def test_inflate(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "gottingen.zip"), os.path.join(self.test_path, "scratch"))
+
+        baseDir = inflate(zipFile, os.path.join(self.test_path, "site"), "https://example.org/iiif", workers=4)
+        self.assertEqual(os.path.join(self.test_path, "site", "gottingen"), baseDir)
+
+        with zipfile.ZipFile(zipFile) as zf:
+            for info in zf.infolist():
+                path = os.path.join(baseDir, info.filename)
+                self.assertTrue(os.path.exists(path), f"Expected {info.filename} to be extracted")
+                if not info.filename.endswith(".json"):
+                    with open(path, "rb") as f:
+                        self.assertEqual(zf.read(info), f.read(), f"Expected {info.filename} to be copied unchanged")
+
+        with open(os.path.join(baseDir, "manifest.json")) as f:
+            manifest = json.load(f)
+        self.assertEqual("https://example.org/iiif/gottingen/manifest.json", manifest["id"])
+        self.assertEqual(f"https://example.org/iiif/gottingen/{IMAGE}", manifest["items"][0]["items"][0]["items"][0]["body"]["service"][0]["id"])
+
+        with open(os.path.join(baseDir, IMAGE, "info.json")) as f:
+            self.assertEqual(f"https://example.org/iiif/gottingen/{IMAGE}", json.load(f)["id"])
+
+    def test_relative_path(self):
+        os.makedirs(os.path.join(self.test_path, "archives"))
+        with zipfile.ZipFile(os.path.join(self.test_path, "archives", "clans.zip"), "w") as zf:
+            zf.writestr("manifest.json", json.dumps({"@context": "http://iiif.io/api/presentation/3/context.json", "id": "manifest.json", "type": "Manifest", "items": []}))
+
+        cwd = os.getcwd()
+        os.chdir(self.test_path)
+        try:
+            baseDir = inflate(os.path.join("archives", "clans.zip"), "site", "https://example.org/iiif")
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(os.path.join("site", "archives", "clans"), baseDir, "Expected the directory of a relative path to be kept")
+        with open(os.path.join(self.test_path, baseDir, "manifest.json")) as f:
+            self.assertEqual("https://example.org/iiif/archives/clans/manifest.json", json.load(f)["id"])
+
+    @patch("requests.Session.get")
+    def test_rebase(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "gottingen.zip"), os.path.join(self.test_path, "scratch"))
+
+        rebased = rebase(zipFile, os.path.join(self.test_path, "rebased.zip"), "https://cdn.example.org/gottingen/")
+
+        with zipfile.ZipFile(zipFile) as original, zipfile.ZipFile(rebased) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual(original.namelist(), zf.namelist(), "Expected the same entries in the same order")
+            for info in original.infolist():
+                if not info.filename.endswith((".json", ".txt")):
+                    copy = zf.getinfo(info.filename)
+                    self.assertEqual((info.CRC, info.compress_type, info.compress_size), (copy.CRC, copy.compress_type, copy.compress_size), f"Expected {info.filename} to be copied as it was")
+
+            manifest = json.loads(zf.read("manifest.json"))
+            self.assertEqual("https://cdn.example.org/gottingen/manifest.json", manifest["id"])
+            self.assertEqual(f"https://cdn.example.org/gottingen/{IMAGE}", json.loads(zf.read(f"{IMAGE}/info.json"))["id"])
+
+        # Rebasing in place replaces the zip, and the ids point at the new base rather than adding to the old one
+        rebase(rebased, rebased, "https://example.org/other")
+        with zipfile.ZipFile(rebased) as zf:
+            manifest = json.loads(zf.read("manifest.json"))
+            self.assertEqual("https://example.org/other/manifest.json", manifest["id"])
+            self.assertEqual(f"https://example.org/other/{IMAGE}", manifest["items"][0]["items"][0]["items"][0]["body"]["service"][0]["id"])
+            self.assertEqual(f"https://example.org/other/{IMAGE}", json.loads(zf.read(f"{IMAGE}/info.json"))["id"])
+
+    @patch("requests.Session.get")
+    def test_corrupt_stored_entry(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "gottingen.zip"), os.path.join(self.test_path, "scratch"))
+        with zipfile.ZipFile(zipFile) as zf:
+            info = next(info for info in zf.infolist() if info.compress_type == zipfile.ZIP_STORED)
+        with open(zipFile, "r+b") as f:
+            # The last byte of the entry's data
+            f.seek(info.header_offset + 30 + len(info.filename.encode("utf-8")) + len(info.extra) + info.compress_size - 1)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaises(zipfile.BadZipFile):
+            inflate(zipFile, os.path.join(self.test_path, "site"), "https://example.org/iiif")
+
+    def test_deflated_and_unsafe_entries(self):
+        zipFile = os.path.join(self.test_path, "unsafe.zip")
+        data = b"not media so deflated " * 100000
+        with zipfile.ZipFile(zipFile, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("audio.wav", data)
+            zf.writestr("../escape.txt", b"outside")
+
+        baseDir = inflate(zipFile, os.path.join(self.test_path, "site"), "https://example.org/iiif")
+
+        with open(os.path.join(baseDir, "audio.wav"), "rb") as f:
+            self.assertEqual(data, f.read())
+        self.assertTrue(os.path.exists(os.path.join(baseDir, "escape.txt")), "Expected .. to be dropped from entry names")
+        self.assertFalse(os.path.exists(os.path.join(self.test_path, "site", "escape.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
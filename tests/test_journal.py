@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from urllib3.exceptions import ProtocolError
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download, downloadAsset
+from iiif_archive.journal import Journal
+from tests.utils import MockAssetResponse, MockRaw, mockResponse
+
+
+class BrokenRaw(MockRaw):
+    """Connection drops after the first chunk."""
+
+    def readinto(self, b):
+        if self._file is not None:
+            raise ProtocolError("Connection reset")
+        return super().readinto(memoryview(b)[:100])
+
+
+class BrokenAssetResponse(MockAssetResponse):
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.raw = BrokenRaw(file_path)
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+def mock_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0001-mvm-image.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_record(self):
+        session = MagicMock()
+        session.get.return_value = MockAssetResponse("tests/fixtures/assets/image.png")
+        filename = os.path.join(self.test_path, "image.png")
+
+        with Journal(os.path.join(self.test_path, "journal")) as journal:
+            downloadAsset(filename, "https://example.org/image.png", session, journal=journal)
+
+            name, size, sha256 = journal.get("https://example.org/image.png")
+            self.assertEqual(filename, name)
+            self.assertEqual(os.path.getsize("tests/fixtures/assets/image.png"), size, "Expected size to be recorded")
+            self.assertEqual(64, len(sha256), "Expected a SHA-256 to be recorded")
+
+    def test_partial_not_reused(self):
+        session = MagicMock()
+        session.get.return_value = BrokenAssetResponse("tests/fixtures/assets/image.png")
+        filename = os.path.join(self.test_path, "image.png")
+
+        with Journal(os.path.join(self.test_path, "journal")) as journal:
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                downloadAsset(filename, "https://example.org/image.png", session, journal=journal)
+
+            self.assertFalse(os.path.exists(filename), "Expected no file after a failed download")
+            self.assertEqual([], [name for name in os.listdir(self.test_path) if name.endswith(".part")], "Expected partial file to be removed")
+            self.assertFalse(journal.isComplete("https://example.org/image.png"), "Expected failed download not to be journaled")
+
+            # A file left over from a crash isn't trusted unless it is in the journal
+            with open(filename, "wb") as f:
+                f.write(b"trunc")
+            session.get.return_value = MockAssetResponse("tests/fixtures/assets/image.png")
+            downloadAsset(filename, "https://example.org/image.png", session, journal=journal)
+
+            self.assertEqual(os.path.getsize("tests/fixtures/assets/image.png"), os.path.getsize(filename), "Expected file to be downloaded again")
+
+    @patch("requests.Session.get")
+    def test_resume(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+        download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "resume.zip"), self.test_path)
+
+        with Journal(os.path.join(self.test_path, "resume.journal")) as journal:
+            self.assertEqual(64 + 1, len(journal), "Expected every tile and the info.json to be journaled")
+
+        mockRequest.reset_mock()
+        download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "resume.zip"), self.test_path)
+        self.assertEqual(0, mockRequest.call_count, "Expected a resumed download not to make any requests")
+
+    @patch("requests.Session.get")
+    def test_resume_containers(self, mockRequest):
+        mockRequest.side_effect = mock_image
+        url = "https://iiif.io/api/cookbook/recipe/0001-mvm-image/manifest.json"
+        download(url, os.path.join(self.test_path, "image.zip"), self.test_path)
+
+        mockRequest.reset_mock()
+        download(url, os.path.join(self.test_path, "image.zip"), self.test_path)
+        self.assertEqual(0, mockRequest.call_count, "Expected a resumed download not to fetch the image again")
+
+        with Journal(os.path.join(self.test_path, "image.journal")) as journal:
+            self.assertEqual(1, len(journal), "Expected only the image to be journaled")
+            self.assertTrue(journal.isComplete("http://iiif.io/api/presentation/2.1/example/fixtures/resources/page1-full.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
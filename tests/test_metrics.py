@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.metrics import Histogram, Metrics, MetricsReporter
+from tests.utils import MockAssetResponse, mockResponse
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_histogram(self):
+        histogram = Histogram((1, 5))
+        for value in (0.5, 0.7, 3, 100):
+            histogram.observe(value)
+
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(1, histogram.quantile(0.5))
+        self.assertEqual(float("inf"), histogram.quantile(0.95))
+        self.assertEqual([("1", 2), ("5", 3), ("+Inf", 4)], list(histogram.cumulative()))
+
+    def test_counts(self):
+        metrics = Metrics()
+        with metrics.request("https://example.org/a.jpg") as request:
+            request.observe(MockAssetResponse("tests/fixtures/assets/image.png"))
+        metrics.received("https://example.org/a.jpg", 1000)
+        with self.assertRaises(ConnectionError):
+            with metrics.request("https://example.org/b.jpg"):
+                raise ConnectionError("refused")
+        metrics.retry("https://other.org/c.jpg", 503)
+        metrics.failure("https://other.org/c.jpg", 404)
+        metrics.gauge("queue_depth", lambda: 7)
+
+        snapshot = metrics.snapshot()
+        host = snapshot["hosts"]["example.org"]
+        self.assertEqual(2, host["requests"])
+        self.assertEqual(1, host["errors"])
+        self.assertEqual({"200": 1}, host["responses"])
+        self.assertEqual(1, host["latency"]["count"], "Expected only answered requests in the latency histogram")
+        self.assertEqual(1000, snapshot["bytes"])
+        self.assertEqual({"503": 1}, snapshot["hosts"]["other.org"]["retries"])
+        self.assertEqual({"queue_depth": 7}, snapshot["gauges"])
+
+        text = metrics.prometheus()
+        self.assertIn('iiif_archive_requests_total{host="example.org"} 2', text)
+        self.assertIn('iiif_archive_failures_total{host="other.org",status="404"} 1', text)
+        self.assertIn('iiif_archive_request_duration_seconds_bucket{host="example.org",le="+Inf"} 1', text)
+        self.assertIn("iiif_archive_queue_depth 7", text)
+        self.assertIn("example.org", metrics.summary())
+
+    def test_reporter(self):
+        metrics = Metrics()
+        path = os.path.join(self.test_path, "metrics.prom")
+        with MetricsReporter(metrics, path, interval=0.01):
+            metrics.received("https://example.org/a.jpg", 10)
+
+        with open(path) as f:
+            self.assertIn('iiif_archive_bytes_total{host="example.org"} 10', f.read(), "Expected the final metrics to be written on close")
+
+    @patch("requests.Session.get")
+    def test_download(self, mockRequest):
+        path = os.path.join(self.test_path, "metrics.json")
+        load_config("tests/test-config.ini", {"metrics_file": path})
+        attempts = []
+
+        def mock_response(url, *args, **kwargs):
+            if "manifest.json" in url:
+                return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+            elif "info.json" in url:
+                return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+            elif "0,0,1024,1024" in url and not attempts:
+                attempts.append(url)
+                return MockAssetResponse("tests/fixtures/assets/image.png", 503)
+            elif "2048,2048,1024,976" in url:
+                return MockAssetResponse("tests/fixtures/assets/image.png", 404)
+            else:
+                return MockAssetResponse("tests/fixtures/assets/image.png")
+
+        mockRequest.side_effect = mock_response
+        download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "image.zip"), self.test_path)
+
+        with open(path) as f:
+            metrics = json.load(f)
+        host = metrics["hosts"]["iiif.io"]
+        self.assertEqual(mockRequest.call_count, host["requests"])
+        self.assertEqual({"503": 1}, host["retries"])
+        self.assertEqual({"404": 1}, host["failures"])
+        self.assertEqual(mockRequest.call_count - 4, host["files"], "Expected every tile but the failed one to be counted")
+        self.assertIn("queue_depth", metrics["gauges"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.planner import Plan, estimateHosts, plan, sample
+from iiif_archive.processors import infoJson_factory
+from iiif_archive.session import create_session
+from tests.utils import MockAssetResponse, mockResponse
+
+IMAGE_MANIFEST = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+AUDIO_MANIFEST = "https://iiif.io/api/cookbook/recipe/0002-mvm-audio/manifest.json"
+
+
+def mock_response(url, *args, **kwargs):
+    if "0005-image-service/manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "0002-mvm-audio/manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0002-mvm-audio.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    elif url.endswith(".mp4"):
+        # A server that doesn't answer HEAD requests but does Range requests
+        return MockAssetResponse("tests/fixtures/assets/audio.wav", 206, {"Content-Range": "bytes 0-0/5000000"})
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+def mock_head(url, *args, **kwargs):
+    if url.endswith(".mp4"):
+        return MockAssetResponse("tests/fixtures/assets/audio.wav", 405)
+    return MockAssetResponse("tests/fixtures/assets/image.png", headers={"Content-Length": "2000"})
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.config = load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_sample(self):
+        self.assertEqual([0, 3, 6], sample(iter(range(10)), 10, 3))
+        self.assertEqual([0, 1], sample(iter(range(2)), 2, 3))
+
+    def test_estimate(self):
+        self.config = load_config("tests/test-config.ini", {"delay": "1", "per_host": 2})
+        hosts = estimateHosts({
+            "slow.org": {"requests": 100, "latency": 0.2, "samples": 2, "static": False},
+            "cdn.org": {"requests": 100, "latency": 0.2, "samples": 2, "static": True}
+        })
+        self.assertEqual(100, hosts["slow.org"]["seconds"], "Expected the delay to limit a normal host")
+        self.assertAlmostEqual(100 * 0.1 / self.config.level0_per_host, hosts["cdn.org"]["seconds"])
+
+    @patch("requests.Session.head")
+    @patch("requests.Session.get")
+    def test_plan_image(self, mockRequest, mockHead):
+        mockRequest.side_effect = mock_response
+        mockHead.side_effect = mock_head
+        planFile = os.path.join(self.test_path, "plan.json")
+
+        with create_session(self.config) as session:
+            result = plan(IMAGE_MANIFEST, planFile, session)
+
+        self.assertEqual(2, mockRequest.call_count, "Expected no tiles to be downloaded")
+        self.assertEqual(3, mockHead.call_count, "Expected a sample of the tiles")
+        with open("tests/fixtures/3.0/gottingen-info.json") as f:
+            tiles = infoJson_factory(json.load(f)).tileCount()
+        self.assertEqual(tiles + 2, result.estimate["requests"])
+        self.assertEqual(tiles * 2000, result.estimate["bytes"])
+        self.assertGreater(result.estimate["seconds"], 0)
+        self.assertIn("iiif.io", result.summary())
+
+        mockRequest.reset_mock()
+        saved = Plan.load(planFile)
+        zipFile = download(IMAGE_MANIFEST, os.path.join(self.test_path, "image.zip"), self.test_path, plan=saved)
+        self.assertEqual(tiles, mockRequest.call_count, "Expected the manifest and info.json to come from the plan")
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIn("918ecd18c2592080851777620de9bcb5-gottingen/info.json", zf.namelist())
+
+        with self.assertRaises(ValueError):
+            download(AUDIO_MANIFEST, os.path.join(self.test_path, "audio.zip"), self.test_path, plan=saved)
+
+    @patch("requests.Session.head")
+    @patch("requests.Session.get")
+    def test_plan_asset(self, mockRequest, mockHead):
+        mockRequest.side_effect = mock_response
+        mockHead.side_effect = mock_head
+
+        with create_session(self.config) as session:
+            result = plan(AUDIO_MANIFEST, os.path.join(self.test_path, "plan.json"), session)
+
+        self.assertEqual(2, result.estimate["requests"])
+        self.assertEqual(5000000, result.estimate["bytes"], "Expected the size from a Range request when HEAD fails")
+        self.assertEqual({"Range": "bytes=0-0"}, mockRequest.call_args.kwargs["headers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download, downloadIIIF
+from iiif_archive.journal import Journal
+from iiif_archive.processors import infoJson_factory
+from iiif_archive.session import create_session
+from tests.utils import MockAssetResponse, mockResponse
+
+try:
+    from PIL import Image
+
+    from iiif_archive.pyramid import PyramidBuilder
+except ImportError:
+    Image = None
+
+SERVICE = "https://example.org/iiif/image"
+
+
+@unittest.skipUnless(Image, "Pillow is needed to generate tiles locally")
+class TestPyramid(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+        self.source = os.path.join(self.test_path, "full.jpg")
+        Image.new("RGB", (1000, 750), (200, 30, 30)).save(self.source)
+
+        self.info = {
+            "@context": "http://iiif.io/api/image/3/context.json",
+            "id": SERVICE,
+            "type": "ImageService3",
+            "profile": "level1",
+            "width": 1000,
+            "height": 750,
+            "tiles": [{"width": 256, "height": 256, "scaleFactors": [1, 2, 4]}]
+        }
+        self.infoFile = os.path.join(self.test_path, "source-info.json")
+        with open(self.infoFile, "w") as f:
+            json.dump(self.info, f)
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def mock_response(self, url, *args, **kwargs):
+        if "manifest.json" in url:
+            return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+        elif "info.json" in url:
+            return mockResponse(self.infoFile)
+        elif "/full/max/" in url:
+            return MockAssetResponse(self.source)
+        else:
+            raise AssertionError(f"Unexpected request for {url}")
+
+    @patch("requests.Session.get")
+    def test_build(self, mockRequest):
+        mockRequest.side_effect = self.mock_response
+        expected = infoJson_factory(dict(self.info)).tileUrls()
+
+        imageDir = os.path.join(self.test_path, "image")
+        with PyramidBuilder(2) as pyramid, Journal(os.path.join(self.test_path, "journal")) as journal:
+            downloadIIIF(imageDir, SERVICE, create_session(load_config("tests/test-config.ini")), journal=journal, pyramid=pyramid)
+
+            self.assertEqual(len(expected) + 1, len(journal), "Expected every generated tile and the info.json to be journaled")
+
+        self.assertEqual(2, mockRequest.call_count, "Expected only info.json and the full image to be requested")
+        for url in expected:
+            self.assertTrue(os.path.exists(url.replace(SERVICE, imageDir)), f"Expected {url} to be generated")
+
+        with Image.open(os.path.join(imageDir, "512,512,488,238", "244,119", "0", "default.jpg")) as tile:
+            self.assertEqual((244, 119), tile.size, "Expected tile to be scaled to its size")
+
+        self.assertFalse(os.path.exists(os.path.join(imageDir, "source.part")), "Expected full image to be removed")
+
+        with open(os.path.join(imageDir, "info.json")) as f:
+            infoJson = infoJson_factory(json.load(f))
+        self.assertTrue(infoJson.isLevel0(), "Expected info.json to describe a level 0 image")
+        self.assertEqual([{"width": 250, "height": 188}], infoJson.data["sizes"])
+
+    @patch("requests.Session.get")
+    def test_resume(self, mockRequest):
+        mockRequest.side_effect = self.mock_response
+        expected = infoJson_factory(dict(self.info)).tileUrls()
+
+        imageDir = os.path.join(self.test_path, "image")
+        session = create_session(load_config("tests/test-config.ini"))
+        with PyramidBuilder(2) as pyramid, Journal(os.path.join(self.test_path, "journal")) as journal:
+            # As if an earlier run was stopped after cutting all but the first tile
+            for url in expected[1:]:
+                journal.record(url, url.replace(SERVICE, imageDir), 1, "0" * 64)
+            downloadIIIF(imageDir, SERVICE, session, journal=journal, pyramid=pyramid)
+
+            self.assertEqual(2, mockRequest.call_count, "Expected info.json and the full image to be requested")
+            self.assertTrue(os.path.exists(expected[0].replace(SERVICE, imageDir)), "Expected the missing tile to be cut")
+            self.assertFalse(os.path.exists(expected[1].replace(SERVICE, imageDir)), "Expected journaled tiles not to be cut again")
+
+            # Stopped before the rewritten info.json was saved
+            os.remove(os.path.join(imageDir, "info.json"))
+            mockRequest.reset_mock()
+            downloadIIIF(imageDir, SERVICE, session, journal=journal, pyramid=pyramid)
+            self.assertEqual(1, mockRequest.call_count, "Expected only info.json to be requested once every tile is cut")
+
+        with open(os.path.join(imageDir, "info.json")) as f:
+            self.assertTrue(infoJson_factory(json.load(f)).isLevel0(), "Expected info.json to be rewritten without cutting any tiles")
+
+    @patch("requests.Session.get")
+    def test_stream(self, mockRequest):
+        mockRequest.side_effect = self.mock_response
+        load_config("tests/test-config.ini", {"local_pyramid": True, "pyramid_workers": 2})
+
+        zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "pyramid.zip"), self.test_path, stream=True)
+
+        with zipfile.ZipFile(zipFile) as zf:
+            names = zf.namelist()
+            self.assertEqual(len(names), len(set(names)), "Expected no duplicate entries")
+            self.assertTrue("918ecd18c2592080851777620de9bcb5-gottingen/0,0,256,256/256,256/0/default.jpg" in names)
+            info = json.loads(zf.read("918ecd18c2592080851777620de9bcb5-gottingen/info.json"))
+            self.assertEqual("level0", info["profile"], "Expected rewritten info.json in the zip")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import re
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import downloadAsset
+from iiif_archive.journal import Journal
+from iiif_archive.ranges import RANGES_SUFFIX, RangeState
+from iiif_archive.session import create_session
+from tests.utils import MockAssetResponse
+
+VIDEO = "tests/fixtures/assets/video.mp4"
+URL = "https://example.org/video.mp4"
+PART_SIZE = 50000
+
+
+class RangeServer:
+    """Answers GETs for VIDEO, honouring Range headers unless told not to."""
+
+    def __init__(self, acceptRanges=True):
+        self.acceptRanges = acceptRanges
+        self.size = os.path.getsize(VIDEO)
+        self.ranges = []
+        self.failing = set()
+        self.changed = False
+
+    def __call__(self, url, *args, headers=None, **kwargs):
+        match = re.match(r"bytes=(\d+)-(\d+)", (headers or {}).get("Range", ""))
+        if match is None or not self.acceptRanges or self.changed:
+            rangeHeaders = {"Accept-Ranges": "bytes"} if self.acceptRanges else {}
+            return MockAssetResponse(VIDEO, 200, {"Content-Length": str(self.size), "ETag": '"v1"', **rangeHeaders})
+
+        start, end = int(match.group(1)), int(match.group(2))
+        self.ranges.append(start)
+        if start in self.failing:
+            raise requests.exceptions.ConnectionError("Connection reset")
+        return MockAssetResponse(VIDEO, 206, {"Content-Range": f"bytes {start}-{end}/{self.size}"}, start, end + 1)
+
+
+class TestRanges(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.filename = os.path.join(self.test_path, "video.mp4")
+        # Sizes are in MB, so this sends the 240 KB video in 5 parts
+        self.config = load_config("tests/test-config.ini", {"range_threshold": 0.1, "range_part_size": PART_SIZE / 1024 / 1024, "range_connections": 3})
+        with open(VIDEO, "rb") as f:
+            self.sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def download(self, server):
+        with patch("requests.Session.get", side_effect=server) as mockRequest, create_session(self.config) as session:
+            with Journal(os.path.join(self.test_path, "journal.sqlite")) as journal:
+                downloadAsset(self.filename, URL, session, journal=journal)
+                return mockRequest.call_count, journal.get(URL)
+
+    def assertDownloaded(self, recorded):
+        with open(self.filename, "rb") as f:
+            self.assertEqual(self.sha256, hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual((self.filename, os.path.getsize(VIDEO), self.sha256), recorded)
+        self.assertEqual([self.filename], [os.path.join(self.test_path, name) for name in os.listdir(self.test_path) if name.endswith(".mp4")])
+        self.assertFalse(os.path.exists(self.filename + RANGES_SUFFIX))
+
+    def test_parts(self):
+        server = RangeServer()
+        requests, recorded = self.download(server)
+
+        self.assertEqual(6, requests, "Expected the first request and then a request for each part")
+        self.assertEqual([0, 50000, 100000, 150000, 200000], sorted(server.ranges))
+        self.assertDownloaded(recorded)
+
+    def test_resume(self):
+        server = RangeServer()
+        server.failing = {100000}
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.download(server)
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertTrue(os.path.exists(self.filename + RANGES_SUFFIX), "Expected the finished parts to be recorded")
+
+        server.failing = set()
+        server.ranges = []
+        _, recorded = self.download(server)
+        self.assertEqual([100000], server.ranges, "Expected only the missing part to be fetched")
+        self.assertDownloaded(recorded)
+
+    def test_another_worker(self):
+        other = RangeState(self.filename, URL, os.path.getsize(VIDEO), PART_SIZE, '"v1"')
+        self.assertTrue(other.acquire())
+        try:
+            self.assertFalse(RangeState(self.filename, URL, os.path.getsize(VIDEO), PART_SIZE, '"v1"').acquire(), "Expected the lock to be held")
+
+            server = RangeServer()
+            server.failing = {100000}
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.download(server)
+            self.assertFalse(os.path.exists(self.filename + RANGES_SUFFIX), "Expected only the worker holding the lock to record its parts")
+            self.assertEqual([os.path.basename(other.lockPath)], [name for name in os.listdir(self.test_path) if name.startswith("video.mp4.")],
+                             "Expected the partial file to be removed as it can't be resumed")
+
+            server.failing = set()
+            _, recorded = self.download(server)
+            self.assertDownloaded(recorded)
+        finally:
+            other.release()
+        self.assertFalse(os.path.exists(other.lockPath))
+
+    def test_changed(self):
+        self.config = load_config("tests/test-config.ini", {"range_threshold": 0.1, "range_part_size": PART_SIZE / 1024 / 1024, "range_connections": 1})
+        server = RangeServer()
+        server.changed = True
+        requests, recorded = self.download(server)
+
+        self.assertEqual(3, requests, "Expected the file to be fetched in one go once a part came back whole")
+        self.assertDownloaded(recorded)
+
+    def test_no_ranges(self):
+        requests, recorded = self.download(RangeServer(acceptRanges=False))
+        self.assertEqual(1, requests)
+        self.assertDownloaded(recorded)
+
+
+if __name__ == "__main__":
+    unittest.main()
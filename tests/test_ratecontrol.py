@@ -0,0 +1,138 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from unittest.mock import MagicMock
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import downloadAsset
+from iiif_archive.ratecontrol import (HostController, RateController,
+                                      parseRetryAfter)
+from tests.utils import MockAssetResponse
+
+
+class MockStatus:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestRateControl(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def request(self, controller, status=200, headers=None):
+        with controller.slot() as slot:
+            slot.observe(MockStatus(status, headers))
+
+    def test_retry_after(self):
+        self.assertEqual(120, parseRetryAfter("120"))
+        self.assertAlmostEqual(60, parseRetryAfter(formatdate(time.time() + 60, usegmt=True)), delta=2)
+        self.assertIsNone(parseRetryAfter(None))
+        self.assertIsNone(parseRetryAfter("soon"))
+
+    def test_grows_when_healthy(self):
+        controller = HostController(maxConcurrency=4)
+        for i in range(20):
+            self.request(controller)
+
+        self.assertEqual(4, controller.window, "Expected window to grow to the maximum")
+
+    def test_backs_off(self):
+        controller = HostController(maxConcurrency=8, retryDelay=0)
+        for i in range(50):
+            self.request(controller)
+        self.request(controller, 503)
+
+        self.assertEqual(4, controller.window, "Expected window to halve on a 503")
+        self.assertGreater(controller.interval, 0, "Expected requests to be spaced out after a 503")
+
+    def test_honours_retry_after(self):
+        controller = HostController(maxConcurrency=2)
+        self.request(controller, 429, {"Retry-After": "0.2"})
+
+        start = time.monotonic()
+        self.request(controller)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19, "Expected to wait for Retry-After")
+
+    def test_delay_is_floor(self):
+        controller = HostController(floor=0.05, maxConcurrency=4)
+        start = time.monotonic()
+        for i in range(5):
+            self.request(controller)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2, "Expected requests to be at least delay apart")
+        self.assertEqual(0.05, controller.interval, "Expected interval never to drop below delay")
+
+    def test_concurrency_limit(self):
+        controller = HostController(maxConcurrency=2)
+        for i in range(20):
+            self.request(controller)
+
+        running = {"now": 0, "max": 0}
+        lock = threading.Lock()
+
+        def work():
+            with controller.slot() as slot:
+                with lock:
+                    running["now"] += 1
+                    running["max"] = max(running["max"], running["now"])
+                time.sleep(0.01)
+                with lock:
+                    running["now"] -= 1
+                slot.observe(MockStatus(200))
+
+        threads = [threading.Thread(target=work) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(running["max"], 2, "Expected no more than 2 requests in flight to one host")
+
+    def test_hosts_independent(self):
+        rate = RateController(maxConcurrency=4)
+        self.assertIs(rate.host("https://example.org/a"), rate.host("https://example.org/b"))
+        self.assertIsNot(rate.host("https://example.org/a"), rate.host("https://example.com/a"))
+
+    def test_static(self):
+        rate = RateController(floor=1, maxConcurrency=2)
+        host = rate.host("https://example.org/iiif/dynamic")
+        host._backoff(0)
+
+        rate.addStatic("https://example.org/iiif/level0", 0, 8)
+        static = rate.host("https://example.org/iiif/level0/full/max/0/default.jpg")
+        self.assertIsNot(host, static, "Expected static files to have their own controller")
+        self.assertEqual((0, 8), (static.floor, static.maxConcurrency))
+        self.assertIs(host, rate.host("https://example.org/iiif/level0-not"), "Expected only URLs under the prefix to be static")
+        self.assertEqual((1, 2, 1.0), (host.floor, host.maxConcurrency, host.window), "Expected the host's profile and backoff to be kept")
+
+        static.window = 3.0
+        rate.addStatic("https://example.org/iiif/other", 0, 8)
+        self.assertIs(static, rate.host("https://example.org/iiif/other/info.json"), "Expected one static controller per host")
+        self.assertEqual(3.0, static.window, "Expected adding another static image not to reset the window")
+
+    def test_retry_503(self):
+        session = MagicMock()
+        session.rate = RateController(maxConcurrency=2, retryDelay=0)
+        session.get.side_effect = [
+            MockAssetResponse("tests/fixtures/assets/image.png", 503, {"Retry-After": "0"}),
+            MockAssetResponse("tests/fixtures/assets/image.png")
+        ]
+
+        filename = os.path.join(self.test_path, "image.png")
+        downloadAsset(filename, "https://example.org/image.png", session)
+
+        self.assertEqual(2, session.get.call_count, "Expected a 503 to be retried")
+        self.assertTrue(os.path.exists(filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.scheduler import Scheduler
+from tests.utils import MockAssetResponse, mockResponse
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_nested_tasks(self):
+        results = []
+
+        def child(value):
+            results.append(value)
+
+        def parent(tasks):
+            for i in range(10):
+                tasks.submit(child, i)
+
+        with Scheduler(4) as scheduler:
+            tasks = scheduler.group()
+            tasks.submit(parent, tasks)
+            tasks.wait()
+
+        self.assertEqual(list(range(10)), sorted(results), "Expected tasks submitted by tasks to be waited on")
+
+    def test_error_raised(self):
+        def fail():
+            raise ValueError("broken")
+
+        with Scheduler(2) as scheduler:
+            tasks = scheduler.group()
+            tasks.submit(fail)
+            with self.assertRaises(ValueError):
+                tasks.wait()
+
+    @patch("requests.Session.get")
+    def test_same_zip_as_serial(self, mockRequest):
+        mockRequest.side_effect = mock_iiif_image
+
+        manifest = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+        contents = []
+        for workers in (1, 8):
+            load_config("tests/test-config.ini", {"workers": workers, "per_host": workers})
+            zipFile = download(manifest, os.path.join(self.test_path, f"workers{workers}.zip"), os.path.join(self.test_path, str(workers)))
+
+            with zipfile.ZipFile(zipFile) as zf:
+                contents.append([(info.filename, info.CRC) for info in zf.infolist()])
+
+        self.assertEqual(contents[0], contents[1], "Expected concurrent download to produce the same zip as a serial one")
+
+
+if __name__ == "__main__":
+    unittest.main()
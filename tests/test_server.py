@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.server import ArchiveServer, parseRange
+from tests.utils import MockAssetResponse, mockResponse
+
+TILE = "918ecd18c2592080851777620de9bcb5-gottingen/0,0,512,512/512,512/0/default.jpg"
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestServer(unittest.TestCase):
+    @patch("requests.Session.get")
+    def setUp(self, mockRequest) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+        mockRequest.side_effect = mock_iiif_image
+        self.zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "gottingen.zip"), os.path.join(self.test_path, "scratch"))
+
+        self.server = ArchiveServer(("127.0.0.1", 0), self.test_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        return self.temp_dir.cleanup()
+
+    def get(self, path, headers=None):
+        with urllib.request.urlopen(urllib.request.Request(f"{self.base}/{path}", headers=headers or {})) as response:
+            return response.status, response.headers, response.read()
+
+    def test_rewrites_ids(self):
+        status, headers, body = self.get("gottingen/manifest.json")
+        manifest = json.loads(body)
+        self.assertEqual(f"{self.base}/gottingen/manifest.json", manifest["id"])
+        self.assertEqual(f"{self.base}/gottingen/918ecd18c2592080851777620de9bcb5-gottingen", manifest["items"][0]["items"][0]["items"][0]["body"]["service"][0]["id"])
+        self.assertEqual("*", headers["Access-Control-Allow-Origin"])
+
+        status, headers, body = self.get("gottingen/918ecd18c2592080851777620de9bcb5-gottingen/info.json")
+        self.assertEqual(f"{self.base}/gottingen/918ecd18c2592080851777620de9bcb5-gottingen", json.loads(body)["id"])
+
+    def test_serves_stored_entries(self):
+        with zipfile.ZipFile(self.zipFile) as zf:
+            expected = zf.read(TILE)
+
+        status, headers, body = self.get(f"gottingen/{TILE}")
+        self.assertEqual(expected, body)
+        self.assertEqual("image/jpeg", headers["Content-Type"])
+
+        status, headers, body = self.get(f"gottingen/{TILE}", {"Range": "bytes=10-19"})
+        self.assertEqual(206, status)
+        self.assertEqual(expected[10:20], body)
+        self.assertEqual(f"bytes 10-19/{len(expected)}", headers["Content-Range"])
+
+    def test_not_found(self):
+        for path in ("gottingen/missing.jpg", "missing/manifest.json", "../gottingen.zip"):
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                self.get(path)
+            self.assertEqual(404, error.exception.code)
+
+    def test_index(self):
+        status, headers, body = self.get("")
+        self.assertEqual([f"{self.base}/gottingen/manifest.json"], json.loads(body))
+
+    def test_parse_range(self):
+        self.assertIsNone(parseRange(None, 100))
+        self.assertEqual((0, 99), parseRange("bytes=0-", 100))
+        self.assertEqual((90, 99), parseRange("bytes=-10", 100))
+        self.assertEqual((50, 99), parseRange("bytes=50-500", 100))
+        self.assertFalse(parseRange("bytes=100-", 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
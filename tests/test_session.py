@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import saveJson
+from iiif_archive.session import ArchiveSession, create_session
+from tests.utils import mockResponse
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_config(self):
+        config = load_config("tests/test-config.ini", {"pool_size": 3, "per_host": 1, "level0_per_host": 2, "connect_timeout": 2, "read_timeout": 5})
+        session = create_session(config)
+
+        self.assertEqual((2, 5), session.timeout, "Expected timeouts from config")
+        self.assertEqual(3, session.get_adapter("https://example.org")._pool_maxsize, "Expected pool size from config")
+
+        config = load_config("tests/test-config.ini", {"pool_size": 3, "per_host": 2, "level0_per_host": 16})
+        session = create_session(config)
+        self.assertEqual(16, session.get_adapter("https://example.org")._pool_maxsize, "Expected a connection for every level 0 request at once")
+
+    @patch("requests.Session.send")
+    def test_default_timeout(self, mockSend):
+        session = ArchiveSession(connectTimeout=1, readTimeout=2)
+        session.get("https://example.org/info.json")
+
+        self.assertEqual((1, 2), mockSend.call_args.kwargs["timeout"], "Expected session timeout to be used")
+
+        session.get("https://example.org/info.json", timeout=7)
+        self.assertEqual(7, mockSend.call_args.kwargs["timeout"], "Expected caller timeout to win")
+
+    def test_session_passed_through(self):
+        session = MagicMock()
+        session.get.return_value = mockResponse("tests/fixtures/3.0/gottingen-info.json")
+
+        filename = os.path.join(self.test_path, "info.json")
+        data = saveJson("https://example.org/iiif/image/info.json", filename, session)
+
+        session.get.assert_called_once_with("https://example.org/iiif/image/info.json")
+        self.assertEqual(4032, data["width"])
+        self.assertTrue(os.path.exists(filename), "Expected info.json to be saved")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from iiif_archive import tracing
+from iiif_archive.config import load_config
+from iiif_archive.decompressor import inflate
+from iiif_archive.downloader import download
+from tests.utils import MockAssetResponse, mockResponse
+
+
+def mock_response(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.trace = os.path.join(self.test_path, "trace.json")
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def events(self):
+        with open(self.trace) as f:
+            return json.load(f)["traceEvents"]
+
+    def work(self):
+        with tracing.span("worker"):
+            pass
+
+    def test_off(self):
+        self.assertIs(tracing.span("tile", "asset", url="https://example.org"), tracing.span("other"))
+        with tracing.tracing(None) as tracer:
+            self.assertIsNone(tracer)
+            with tracing.stage("zip"):
+                pass
+        self.assertFalse(os.path.exists(self.trace))
+
+    def test_nested_spans(self):
+        with tracing.tracing(self.trace, memory=True):
+            with tracing.stage("download", url="https://example.org"):
+                with tracing.span("asset", "asset"):
+                    data = bytearray(1024 * 1024)
+                thread = threading.Thread(target=self.work, name="worker-thread")
+                thread.start()
+                thread.join()
+            del data
+
+        events = self.events()
+        spans = {event["name"]: event for event in events if event["ph"] == "X"}
+        outer, inner = spans["download"], spans["asset"]
+        self.assertLessEqual(outer["ts"], inner["ts"])
+        self.assertLessEqual(inner["ts"] + inner["dur"], outer["ts"] + outer["dur"], "Expected the asset span inside the stage")
+        self.assertEqual("https://example.org", outer["args"]["url"])
+        self.assertGreaterEqual(outer["args"]["peak_memory"], 1024 * 1024, "Expected the stage's peak memory")
+        threads = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+        self.assertEqual("worker-thread", threads[spans["worker"]["tid"]], "Expected spans on their own thread")
+        self.assertEqual("MainThread", threads[outer["tid"]])
+        self.assertIsNone(tracing._tracer, "Expected tracing to stop")
+
+    @patch("requests.Session.get")
+    def test_download_and_inflate(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        with tracing.tracing(self.trace):
+            zipFile = download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, "image.zip"), os.path.join(self.test_path, "scratch"))
+
+        names = [event["name"] for event in self.events() if event["ph"] == "X"]
+        for stage in ("fetch manifest", "download containers", "info.json", "asset", "save", "save manifest", "zip"):
+            self.assertIn(stage, names)
+        self.assertEqual(mockRequest.call_count - 2, names.count("asset"), "Expected a span for each tile")
+
+        with tracing.tracing(self.trace):
+            inflate(zipFile, os.path.join(self.test_path, "out"), "http://localhost:8000")
+
+        names = [event["name"] for event in self.events() if event["ph"] == "X"]
+        for stage in ("read index", "make directories", "extract", "extract batch"):
+            self.assertIn(stage, names)
+
+
+if __name__ == "__main__":
+    unittest.main()
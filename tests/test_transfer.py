@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+import requests
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import saveResponse
+from iiif_archive.transfer import MAX_CHUNK, MIN_CHUNK, iterBody
+from tests.utils import MockAssetResponse
+
+VIDEO = "tests/fixtures/assets/video.mp4"
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+        self.size = os.path.getsize(VIDEO)
+        with open(VIDEO, "rb") as f:
+            self.body = f.read()
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def test_chunks(self):
+        with MockAssetResponse(VIDEO) as response:
+            sizes = [len(chunk) for chunk in iterBody(response)]
+        self.assertEqual(self.size, sum(sizes))
+        self.assertEqual([MIN_CHUNK, MIN_CHUNK * 2], sizes[:2], "Expected the reads to grow when the size isn't known")
+
+        with MockAssetResponse(VIDEO, headers={"Content-Length": str(self.size)}) as response:
+            sizes = [len(chunk) for chunk in iterBody(response)]
+        self.assertEqual([min(self.size, MAX_CHUNK)], sizes[:1], "Expected one read of the whole body")
+
+    def test_compressed(self):
+        response = MockAssetResponse(VIDEO, headers={"Content-Encoding": "gzip"})
+        response.raw = None
+        self.assertEqual(self.body, b"".join(bytes(chunk) for chunk in iterBody(response)), "Expected requests to decode it")
+
+    def test_short_body(self):
+        filename = os.path.join(self.test_path, "video.mp4")
+        # The server says the file is bigger than what it sends, so it must be downloaded again rather than saved cut short
+        with MockAssetResponse(VIDEO, headers={"Content-Length": str(2 * 1024 * 1024)}) as response:
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                saveResponse(response, filename)
+
+        self.assertEqual([], os.listdir(self.test_path), "Expected neither the file nor its partial file")
+
+
+if __name__ == "__main__":
+    unittest.main()
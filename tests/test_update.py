@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from tests.utils import MockAssetResponse, mockResponse
+
+IMAGE_MANIFEST = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+AUDIO_MANIFEST = "https://iiif.io/api/cookbook/recipe/0002-mvm-audio/manifest.json"
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+        self.infoJson = "tests/fixtures/3.0/gottingen-info.json"
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    def mock_image(self, url, *args, **kwargs):
+        if "manifest.json" in url:
+            return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+        elif "info.json" in url:
+            return mockResponse(self.infoJson)
+        else:
+            return MockAssetResponse("tests/fixtures/assets/image.png")
+
+    def entries(self, zipFile):
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            return {info.filename: (info.CRC, info.compress_type) for info in zf.infolist()}
+
+    @patch("requests.Session.get")
+    def test_unchanged_image(self, mockRequest):
+        mockRequest.side_effect = self.mock_image
+        zipFile = download(IMAGE_MANIFEST, os.path.join(self.test_path, "image.zip"), self.test_path)
+        expected = self.entries(zipFile)
+
+        mockRequest.reset_mock()
+        download(IMAGE_MANIFEST, zipFile, os.path.join(self.test_path, "update"), updateFrom=zipFile)
+
+        self.assertEqual(2, mockRequest.call_count, "Expected only the manifest and info.json to be requested")
+        self.assertEqual(expected, self.entries(zipFile), "Expected the updated zip to have the same entries")
+
+    @patch("requests.Session.get")
+    def test_changed_image(self, mockRequest):
+        mockRequest.side_effect = self.mock_image
+        zipFile = download(IMAGE_MANIFEST, os.path.join(self.test_path, "image.zip"), self.test_path)
+        tiles = mockRequest.call_count - 2
+
+        with open(self.infoJson) as f:
+            info = json.load(f)
+        info["rights"] = "http://creativecommons.org/licenses/by/4.0/"
+        self.infoJson = os.path.join(self.test_path, "changed-info.json")
+        with open(self.infoJson, "w") as f:
+            json.dump(info, f)
+
+        mockRequest.reset_mock()
+        updated = download(IMAGE_MANIFEST, os.path.join(self.test_path, "updated.zip"), self.test_path, updateFrom=zipFile)
+
+        self.assertEqual(tiles + 2, mockRequest.call_count, "Expected the tiles of a changed image to be downloaded again")
+        with zipfile.ZipFile(updated) as zf:
+            self.assertEqual(info["rights"], json.loads(zf.read("918ecd18c2592080851777620de9bcb5-gottingen/info.json"))["rights"])
+
+    @patch("requests.Session.get")
+    def test_conditional_get(self, mockRequest):
+        def mock_response(url, *args, headers=None, **kwargs):
+            if "manifest.json" in url:
+                return mockResponse("tests/fixtures/3.0/0002-mvm-audio.json")
+            elif headers and headers.get("If-None-Match") == '"v1"':
+                return MockAssetResponse("tests/fixtures/assets/audio.wav", 304)
+            else:
+                return MockAssetResponse("tests/fixtures/assets/audio.wav", headers={"ETag": '"v1"'})
+
+        mockRequest.side_effect = mock_response
+        zipFile = download(AUDIO_MANIFEST, os.path.join(self.test_path, "audio.zip"), self.test_path, stream=True)
+        with zipfile.ZipFile(zipFile) as zf:
+            sources = json.loads(zf.read("sources.json"))
+        self.assertEqual('"v1"', sources["https://fixtures.iiif.io/audio/indiana/mahler-symphony-3/CD1/medium/128Kbps.mp4"]["etag"])
+
+        mockRequest.reset_mock()
+        updated = download(AUDIO_MANIFEST, os.path.join(self.test_path, "updated.zip"), self.test_path, updateFrom=zipFile)
+
+        self.assertEqual({"If-None-Match": '"v1"'}, mockRequest.call_args.kwargs["headers"], "Expected a conditional GET")
+        self.assertEqual(self.entries(zipFile), self.entries(updated), "Expected the unmodified audio to be copied")
+
+
+if __name__ == "__main__":
+    unittest.main()
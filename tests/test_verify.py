@@ -0,0 +1,158 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.decompressor import rebase
+from iiif_archive.downloader import download
+from iiif_archive.fixity import formatBagManifest, parseBagManifest
+from iiif_archive.verify import expectedEntries, verify
+from tests.utils import MockAssetResponse, mockResponse
+
+
+def mock_iiif_image(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    @patch("requests.Session.get")
+    def archive(self, name, mockRequest, **kwargs):
+        mockRequest.side_effect = mock_iiif_image
+        return download("https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json", os.path.join(self.test_path, name),
+                        os.path.join(self.test_path, name + "_scratch"), **kwargs)
+
+    def rewrite(self, zipFile, name, data=None):
+        """Copy zipFile with entry name replaced by data, or left out if data is None."""
+        copy = zipFile.replace(".zip", "-changed.zip")
+        with zipfile.ZipFile(zipFile) as src, zipfile.ZipFile(copy, "w") as dst:
+            for info in src.infolist():
+                if info.filename != name:
+                    dst.writestr(info, src.read(info))
+                elif data is not None:
+                    dst.writestr(info, data)
+        return copy
+
+    def tile(self, zipFile):
+        with zipfile.ZipFile(zipFile) as zf:
+            return next(name for name in zf.namelist() if name.endswith(".jpg"))
+
+    def test_bag(self):
+        for stream in (False, True):
+            zipFile = self.archive(f"stream-{stream}.zip", stream=stream)
+            with zipfile.ZipFile(zipFile) as zf:
+                bag = parseBagManifest(zf.read("manifest-sha256.txt"))
+                actual = {name: hashlib.sha256(zf.read(name)).hexdigest() for name in zf.namelist() if name != "manifest-sha256.txt"}
+            self.assertEqual(actual, bag, "Expected the bag to list the SHA-256 of every entry")
+
+            report = verify(zipFile, workers=2)
+            self.assertTrue(report.ok, report.errors)
+            self.assertEqual(["sha256"], report.algorithms)
+
+    def test_rebased(self):
+        load_config("tests/test-config.ini", {"checksum_md5": True})
+        zipFile = self.archive("rebased.zip")
+
+        rebase(zipFile, zipFile, "https://cdn.example.org/gottingen")
+        report = verify(zipFile, workers=1)
+        self.assertTrue(report.ok, report.errors)
+
+        # Again in place, from the absolute ids of the first
+        rebase(zipFile, zipFile, "https://example.org/other")
+        report = verify(zipFile, workers=1)
+        self.assertTrue(report.ok, report.errors)
+        self.assertEqual(["sha256", "md5"], report.algorithms)
+
+    def test_md5(self):
+        load_config("tests/test-config.ini", {"checksum_md5": True})
+        zipFile = self.archive("md5.zip")
+        with zipfile.ZipFile(zipFile) as zf:
+            bag = parseBagManifest(zf.read("manifest-md5.txt"))
+            self.assertEqual(hashlib.md5(zf.read("manifest.json")).hexdigest(), bag["manifest.json"])
+
+        report = verify(zipFile, workers=1)
+        self.assertTrue(report.ok, report.errors)
+        self.assertEqual(["sha256", "md5"], report.algorithms)
+
+    def test_changed(self):
+        zipFile = self.archive("changed.zip")
+        tile = self.tile(zipFile)
+
+        report = verify(self.rewrite(zipFile, tile, b"not the tile"), workers=1)
+        self.assertFalse(report.ok)
+        self.assertEqual([f"{tile} doesn't match its sha256 in manifest-sha256.txt"], report.errors)
+
+    def test_missing(self):
+        zipFile = self.archive("missing.zip")
+        tile = self.tile(zipFile)
+
+        report = verify(self.rewrite(zipFile, tile), workers=1)
+        self.assertEqual([f"{tile} is in manifest.json but not in the archive", f"{tile} is in manifest-sha256.txt but not in the archive"], report.errors)
+
+    def test_without_sources(self):
+        # As archived before sources.json was added
+        zipFile = self.archive("old.zip")
+        with zipfile.ZipFile(zipFile) as zf:
+            bag = parseBagManifest(zf.read("manifest-sha256.txt"))
+        del bag["sources.json"]
+        zipFile = self.rewrite(self.rewrite(zipFile, "sources.json"), "manifest-sha256.txt", formatBagManifest(bag))
+
+        report = verify(zipFile, workers=1)
+        self.assertTrue(report.ok, report.errors)
+
+    def test_expected_level0_tiles(self):
+        with open("tests/fixtures/3.0/0005-image-service.json") as f:
+            manifest = json.load(f)
+        manifest["items"][0]["items"][0]["items"][0]["body"]["service"][0]["id"] = "image"
+        with open("tests/fixtures/3.0/level0-info.json") as f:
+            info = json.load(f)
+        # Drop the smallest size so the server no longer says it has it
+        info["sizes"] = info["sizes"][1:]
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w") as zf:
+            zf.writestr("manifest.json", json.dumps(manifest))
+            zf.writestr("image/info.json", json.dumps(info))
+
+        with zipfile.ZipFile(data) as zf:
+            static = expectedEntries(zf)
+            load_config("tests/test-config.ini", {"no_delay_level0": False})
+            dynamic = expectedEntries(zf)
+        self.assertLess(static, dynamic, "Expected the undeclared size only when level 0 images were downloaded like any other")
+
+    def test_corrupt(self):
+        zipFile = self.archive("corrupt.zip")
+        tile = self.tile(zipFile)
+        with zipfile.ZipFile(zipFile) as zf:
+            info = zf.getinfo(tile)
+        with open(zipFile, "r+b") as f:
+            # Flip a byte of the entry's data, after its 30 byte local header and name
+            f.seek(info.header_offset + 30 + len(info.filename.encode("utf-8")) + 8)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        report = verify(zipFile, workers=1)
+        self.assertFalse(report.ok)
+        self.assertEqual(1, len(report.errors), report.errors)
+        self.assertTrue(report.errors[0].startswith(f"{tile} is corrupt"), report.errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
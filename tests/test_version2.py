@@ -1,12 +1,14 @@
 import json
 import os
 import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
 from iiif_archive.config import load_config
-from iiif_archive.downloader import download
+from iiif_archive.downloader import download, downloadIIIF
 from iiif_archive.processors import infoJson_factory
+from iiif_archive.session import create_session
 from tests.utils import MockAssetResponse, mockResponse
 
 
@@ -20,7 +22,7 @@ class TestVersion2(unittest.TestCase):
     def tearDown(self):
         return self.temp_dir.cleanup()
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_simple_image(self, mockRequest):
         # Define mock response for the specific URLs
         def mock_response(url, *args, **kwargs):
@@ -101,6 +103,69 @@ class TestVersion2(unittest.TestCase):
             self.assertTrue("https://iiif-test.github.io/March2025/images/asna_1/3072,4096,722,1024/722,/0/default.jpg" in urls)
             self.assertTrue("https://iiif-test.github.io/March2025/images/asna_1/3072,5120,722,87/722,/0/default.jpg" in urls)
 
+    def test_tile_planner(self):
+        with open("tests/fixtures/2.0/level0-info.json", "r") as f:
+            infoJson = infoJson_factory(json.load(f))
+
+        urls = infoJson.tileUrls()
+        self.assertEqual(len(urls), len(set(urls)), "Expected no duplicate URLs")
+        self.assertEqual(len(urls), infoJson.tileCount(), "Expected count to match the URLs")
+        # 4 full sizes + 6 + 24 tiles from the scale factors and 2 extra sizes
+        self.assertEqual(36, len(urls))
+        self.assertTrue("https://iiif-test.github.io/March2025/images/asna_1/full/3794,/0/default.jpg" in urls, "Expected sizes to be included")
+
+    def test_tile_planner_duplicates(self):
+        # v2 sizes only include the width so a tile cut at the same place by a second tiles entry is the same URL
+        infoJson = infoJson_factory({
+            "@context": "http://iiif.io/api/image/2/context.json",
+            "@id": "https://example.org/iiif/image",
+            "profile": "http://iiif.io/api/image/2/level2.json",
+            "width": 1100,
+            "height": 300,
+            "tiles": [
+                {"width": 512, "scaleFactors": [1]},
+                {"width": 1024, "scaleFactors": [1]}
+            ]
+        })
+
+        urls = list(infoJson.iterTileUrls())
+        self.assertEqual(len(urls), len(set(urls)), "Expected no duplicate URLs")
+        self.assertTrue("https://example.org/iiif/image/1024,0,76,300/76,/0/default.jpg" in urls)
+        self.assertTrue("https://example.org/iiif/image/0,0,1024,300/1024,/0/default.jpg" in urls, "Expected second tiles entry to be used")
+        self.assertEqual(len(urls), infoJson.tileCount())
+
+    @patch("requests.Session.get")
+    def test_level0_download(self, mockRequest):
+        def mock_response(url, *args, **kwargs):
+            if "info.json" in url:
+                return mockResponse("tests/fixtures/2.0/level0-info.json")
+            else:
+                return MockAssetResponse("tests/fixtures/assets/image.png")
+
+        mockRequest.side_effect = mock_response
+        config = load_config("tests/test-config.ini", {"delay": 1})
+        session = create_session(config)
+
+        imageDir = os.path.join(self.test_path, "level0")
+        start = time.monotonic()
+        downloadIIIF(imageDir, "https://iiif-test.github.io/March2025/images/asna_1", session)
+
+        self.assertLess(time.monotonic() - start, 5, "Expected level 0 tiles to be downloaded without the delay")
+        host = session.rate.host("https://iiif-test.github.io/March2025/images/asna_1")
+        self.assertEqual(0, host.floor, "Expected no delay for a level 0 host")
+        self.assertEqual(config.level0_per_host, host.maxConcurrency, "Expected level 0 concurrency")
+        self.assertEqual(36 + 1, mockRequest.call_count, "Expected info.json and every tile to be requested")
+
+    def test_level0_declared_sizes(self):
+        with open("tests/fixtures/2.0/level0-info.json", "r") as f:
+            data = json.load(f)
+            # Drop the smallest size so the server no longer says it has it
+            data["sizes"] = data["sizes"][1:]
+            infoJson = infoJson_factory(data)
+
+        self.assertTrue("https://iiif-test.github.io/March2025/images/asna_1/full/119,/0/default.jpg" in infoJson.tileUrls())
+        self.assertFalse("https://iiif-test.github.io/March2025/images/asna_1/full/119,/0/default.jpg" in list(infoJson.iterTileUrls(declaredOnly=True)), "Expected only declared sizes for level 0")
+
     def test_level0(self):
         with open("tests/fixtures/2.0/level0-info.json", "r") as f:
             data = json.load(f)
@@ -1,12 +1,14 @@
 import json
 import os
 import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
 from iiif_archive.config import load_config
-from iiif_archive.downloader import download
+from iiif_archive.downloader import download, downloadIIIF
 from iiif_archive.processors import infoJson_factory
+from iiif_archive.session import create_session
 from tests.utils import MockAssetResponse, mockResponse
 
 
@@ -20,7 +22,7 @@ class TestVersion3(unittest.TestCase):
     def tearDown(self):
         return self.temp_dir.cleanup()
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_simple_image(self, mockRequest):
         # Define mock response for the specific URLs
         def mock_response(url, *args, **kwargs):
@@ -41,7 +43,7 @@ class TestVersion3(unittest.TestCase):
             manifest = json.load(f)
             self.assertEqual("page1-full.png", manifest["items"][0]["items"][0]["items"][0]["body"]["id"], "Expected image resource id to be updated")
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_simple_audio(self, mockRequest):
         # Define mock response for the specific URLs
         def mock_response(url, *args, **kwargs):
@@ -63,7 +65,7 @@ class TestVersion3(unittest.TestCase):
             manifest = json.load(f)
             self.assertEqual("128Kbps.mp4", manifest["items"][0]["items"][0]["items"][0]["body"]["id"], "Expected audio resource id to be updated")
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_simple_video(self, mockRequest):
         # Define mock response for the specific URLs
         def mock_response(url, *args, **kwargs):
@@ -85,7 +87,7 @@ class TestVersion3(unittest.TestCase):
             manifest = json.load(f)
             self.assertEqual("lunchroom_manners_1024kb.mp4", manifest["items"][0]["items"][0]["items"][0]["body"]["id"], "Expected video resource id to be updated")
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_iiif_image(self, mockRequest):
         # Define mock response for the specific URLs
         def mock_response(url, *args, **kwargs):
@@ -163,6 +165,49 @@ class TestVersion3(unittest.TestCase):
             self.assertTrue("https://iiif-test.github.io/actions_test/images/IMG_5954/3072,1024,960,1024/960,1024/0/default.jpg" in urls)
             self.assertTrue("https://iiif-test.github.io/actions_test/images/IMG_5954/3072,2048,960,976/960,976/0/default.jpg" in urls)
 
+    def test_tile_planner(self):
+        with open("tests/fixtures/3.0/level0-info.json", "r") as f:
+            infoJson = infoJson_factory(json.load(f))
+
+        urls = infoJson.tileUrls()
+        self.assertEqual(len(urls), len(set(urls)), "Expected no duplicate URLs")
+        self.assertEqual(len(urls), infoJson.tileCount(), "Expected count to match the URLs")
+        # 4 full sizes + 4 + 12 tiles from the scale factors and 2 extra sizes
+        self.assertEqual(22, len(urls))
+        self.assertTrue("https://iiif-test.github.io/actions_test/images/IMG_5954/full/2016,1512/0/default.jpg" in urls, "Expected sizes to be included")
+
+    @patch("requests.Session.get")
+    def test_level0_download(self, mockRequest):
+        def mock_response(url, *args, **kwargs):
+            if "info.json" in url:
+                return mockResponse("tests/fixtures/3.0/level0-info.json")
+            else:
+                return MockAssetResponse("tests/fixtures/assets/image.png")
+
+        mockRequest.side_effect = mock_response
+        config = load_config("tests/test-config.ini", {"delay": 1})
+        session = create_session(config)
+
+        imageDir = os.path.join(self.test_path, "level0")
+        start = time.monotonic()
+        downloadIIIF(imageDir, "https://iiif-test.github.io/actions_test/images/IMG_5954", session)
+
+        self.assertLess(time.monotonic() - start, 5, "Expected level 0 tiles to be downloaded without the delay")
+        host = session.rate.host("https://iiif-test.github.io/actions_test/images/IMG_5954")
+        self.assertEqual(0, host.floor, "Expected no delay for a level 0 host")
+        self.assertEqual(config.level0_per_host, host.maxConcurrency, "Expected level 0 concurrency")
+        self.assertEqual(22 + 1, mockRequest.call_count, "Expected info.json and every tile to be requested")
+
+    def test_level0_declared_sizes(self):
+        with open("tests/fixtures/3.0/level0-info.json", "r") as f:
+            data = json.load(f)
+            # Drop the smallest size so the server no longer says it has it
+            data["sizes"] = data["sizes"][1:]
+            infoJson = infoJson_factory(data)
+
+        self.assertTrue("https://iiif-test.github.io/actions_test/images/IMG_5954/full/126,95/0/default.jpg" in infoJson.tileUrls())
+        self.assertFalse("https://iiif-test.github.io/actions_test/images/IMG_5954/full/126,95/0/default.jpg" in list(infoJson.iterTileUrls(declaredOnly=True)), "Expected only declared sizes for level 0")
+
     def test_level0(self):
         with open("tests/fixtures/3.0/level0-info.json", "r") as f:
             data = json.load(f)
@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from iiif_archive.config import load_config
+from iiif_archive.downloader import download
+from iiif_archive.workqueue import (enqueue, failures, keepLease, merge,
+                                    openQueue, retry, skip, status, work)
+from tests.utils import MockAssetResponse, mockResponse
+
+IMAGE_MANIFEST = "https://iiif.io/api/cookbook/recipe/0005-image-service/manifest.json"
+
+
+def mock_response(url, *args, **kwargs):
+    if "manifest.json" in url:
+        return mockResponse("tests/fixtures/3.0/0005-image-service.json")
+    elif "info.json" in url:
+        return mockResponse("tests/fixtures/3.0/gottingen-info.json")
+    else:
+        return MockAssetResponse("tests/fixtures/assets/image.png")
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.test_path = self.temp_dir.name
+        self.queueDir = os.path.join(self.test_path, "queue")
+        load_config("tests/test-config.ini")
+
+    def tearDown(self):
+        return self.temp_dir.cleanup()
+
+    @patch("requests.Session.get")
+    def test_enqueue(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        count = enqueue(IMAGE_MANIFEST, self.queueDir, tilesPerUnit=5)
+
+        self.assertEqual(2, mockRequest.call_count, "Expected only the manifest and info.json to be fetched")
+        self.assertEqual({"pending": count, "leased": 0, "done": 0, "failed": 0, "skipped": 0}, status(self.queueDir))
+
+        queue, journal = openQueue(self.queueDir)
+        with queue, journal:
+            units = []
+            while (unit := queue.claim("test")) is not None:
+                units.append(unit)
+        self.assertEqual(count, len(units))
+        self.assertEqual(0, units[0].start)
+        self.assertTrue(all(unit.stop - unit.start <= 5 for unit in units))
+        self.assertTrue(all(a.stop == b.start for a, b in zip(units, units[1:])), "Expected the tile ranges to follow on")
+
+    @patch("requests.Session.get")
+    def test_enqueue_again(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        count = enqueue(IMAGE_MANIFEST, self.queueDir, tilesPerUnit=5)
+
+        mockRequest.reset_mock()
+        self.assertEqual(count, enqueue(IMAGE_MANIFEST, self.queueDir, tilesPerUnit=5))
+        self.assertEqual(0, mockRequest.call_count, "Expected a queued manifest not to be fetched again")
+        self.assertEqual(count, status(self.queueDir)["pending"], "Expected no duplicate units")
+
+        with self.assertRaises(ValueError):
+            enqueue("https://example.org/other/manifest.json", self.queueDir)
+
+    @patch("requests.Session.get")
+    def test_moved_queue(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        enqueue(IMAGE_MANIFEST, self.queueDir, tilesPerUnit=50)
+        work(self.queueDir, "worker", wait=False)
+
+        # As if another machine mounted the queue somewhere else
+        moved = os.path.join(self.test_path, "mounted")
+        os.rename(self.queueDir, moved)
+        queue, journal = openQueue(moved)
+        with queue, journal:
+            filenames = [filename for _, filename, *_ in journal.rows()]
+        self.assertTrue(all(filename.startswith(moved) and os.path.exists(filename) for filename in filenames), "Expected the journal's paths to follow the queue")
+
+        zipFile = merge(moved, os.path.join(self.test_path, "moved.zip"))
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertEqual(len(filenames), len(json.loads(zf.read("sources.json"))))
+
+    @patch("requests.Session.get")
+    def test_workers_and_merge(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        expected = download(IMAGE_MANIFEST, os.path.join(self.test_path, "expected.zip"), os.path.join(self.test_path, "scratch"))
+        downloads = mockRequest.call_count - 2
+
+        mockRequest.reset_mock()
+        enqueue(IMAGE_MANIFEST, self.queueDir, tilesPerUnit=3)
+
+        with self.assertRaises(RuntimeError):
+            merge(self.queueDir, os.path.join(self.test_path, "early.zip"))
+
+        completed = []
+        workers = [threading.Thread(target=lambda name: completed.append(work(self.queueDir, name)), args=(f"worker-{i}",)) for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(downloads + 2, mockRequest.call_count, "Expected every tile to be downloaded once")
+        self.assertEqual(status(self.queueDir)["done"], sum(completed))
+
+        zipFile = merge(self.queueDir, os.path.join(self.test_path, "merged.zip"))
+        with zipfile.ZipFile(expected) as zf:
+            expectedNames = set(zf.namelist())
+            expectedSources = json.loads(zf.read("sources.json"))
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIsNone(zf.testzip(), "Expected a valid zip")
+            self.assertEqual(expectedNames, set(zf.namelist()))
+            self.assertEqual(expectedSources, json.loads(zf.read("sources.json")))
+
+    @patch("requests.Session.get")
+    def test_expired_lease(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        count = enqueue(IMAGE_MANIFEST, self.queueDir)
+
+        queue, journal = openQueue(self.queueDir)
+        with queue, journal:
+            abandoned = queue.claim("crashed", lease=-1)
+            self.assertEqual(abandoned, queue.claim("other"), "Expected a unit whose lease ran out to be claimed again")
+            queue.complete(abandoned, "crashed")
+            self.assertEqual(0, queue.counts()["done"], "Expected a worker that lost its lease not to complete the unit")
+
+        self.assertEqual(count - 1, work(self.queueDir, "late", wait=False))
+
+    @patch("requests.Session.get")
+    def test_renew_lease(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        enqueue(IMAGE_MANIFEST, self.queueDir)
+
+        queue, journal = openQueue(self.queueDir)
+        with queue, journal:
+            unit = queue.claim("slow", lease=0.6)
+            # Twice the lease, which is kept while the unit is being worked on
+            with keepLease(queue, unit, "slow", 0.6):
+                time.sleep(1.2)
+                self.assertNotEqual(unit, queue.claim("other", lease=0.6), "Expected a renewed lease not to be taken over")
+            time.sleep(0.8)
+            self.assertEqual(unit, queue.claim("other"), "Expected the lease to run out once it isn't renewed")
+            self.assertFalse(queue.renew(unit, "slow"), "Expected a worker that lost its lease not to renew it")
+
+    @patch("requests.Session.get")
+    def test_failed_unit(self, mockRequest):
+        mockRequest.side_effect = mock_response
+        enqueue(IMAGE_MANIFEST, self.queueDir)
+
+        # A unit that can't be run anywhere, as its image's info.json has gone
+        for root, dirs, files in os.walk(self.queueDir):
+            if "info.json" in files:
+                os.remove(os.path.join(root, "info.json"))
+        self.assertEqual(0, work(self.queueDir, "worker"))
+
+        counts = status(self.queueDir)
+        self.assertEqual(0, counts["pending"] + counts["leased"], "Expected each unit to be given up on after its attempts")
+        self.assertEqual(counts["failed"], len(failures(self.queueDir)))
+        self.assertEqual("tiles", failures(self.queueDir)[0].kind)
+        with self.assertRaises(RuntimeError):
+            merge(self.queueDir, os.path.join(self.test_path, "failed.zip"))
+
+        failed = counts["failed"]
+        self.assertEqual(failed, retry(self.queueDir))
+        self.assertEqual(failed, status(self.queueDir)["pending"], "Expected the failed units to be pending again")
+        self.assertEqual(0, work(self.queueDir, "worker"))
+
+        self.assertEqual(failed, skip(self.queueDir))
+        zipFile = merge(self.queueDir, os.path.join(self.test_path, "skipped.zip"))
+        with zipfile.ZipFile(zipFile) as zf:
+            self.assertIn("manifest.json", zf.namelist(), "Expected the queue to merge once the failed units are skipped")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,7 @@ import requests
 def mockResponse(fixture):
     class MockResponse:
         status_code = 200
+        headers = {}
 
         def json(self):
             with open(fixture, "r") as file:
@@ -19,22 +20,50 @@ def mockResponse(fixture):
 # Your mock response class
 
 
+class MockRaw:
+    """Stands in for the urllib3 response that a streamed requests response reads from."""
+
+    def __init__(self, file_path, start=0, stop=None):
+        self.file_path = file_path
+        self.start = start
+        self.stop = stop
+        self._file = None
+
+    def readinto(self, b):
+        if self._file is None:
+            self._file = open(self.file_path, "rb")
+            self._file.seek(self.start)
+        if self.stop is not None:
+            b = memoryview(b)[:max(0, self.stop - self._file.tell())]
+        return self._file.readinto(b)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
 class MockAssetResponse:
-    def __init__(self, file_path, status_code=200):
+    def __init__(self, file_path, status_code=200, headers=None, start=0, stop=None):
         self.file_path = file_path
         self.status_code = status_code
+        self.headers = headers or {}
+        # The bytes of the file sent, for Range requests
+        self.start = start
+        self.stop = stop
+        self.raw = MockRaw(file_path, start, stop)
 
     def raise_for_status(self):
         if self.status_code >= 400:
-            raise requests.HTTPError(f"{self.status_code} Error")
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
 
     def iter_content(self, chunk_size=8192):
         with open(self.file_path, "rb") as f:
-            while chunk := f.read(chunk_size):
+            f.seek(self.start)
+            while chunk := f.read(chunk_size if self.stop is None else min(chunk_size, self.stop - f.tell())):
                 yield chunk
 
     def close(self):
-        pass
+        self.raw.close()
 
     def __enter__(self):
         return self
@@ -0,0 +1,28 @@
+import argparse
+import logging
+import sys
+
+from iiif_archive import verify
+from iiif_archive.config import load_config
+from iiif_archive.tracing import tracing
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Check a zipped Manifest against its BagIt checksums and that every file its manifest.json needs is there")
+    parser.add_argument("zip_file", help="zip_file to verify")
+    parser.add_argument("--workers", type=int, help="Processes used to hash the entries. Default: one per CPU")
+    parser.add_argument("--conf", type=str, default="conf/config.ini", help="Config file the archive was made with. Default: conf/config.ini")
+
+    parser.add_argument("--trace", type=str, help="Write a trace of where the time goes to this file, for chrome://tracing or Perfetto.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record the peak memory of each stage of the trace (slower).")
+
+    args = parser.parse_args()
+    load_config(args.conf)
+    with tracing(args.trace, args.trace_memory):
+        report = verify.verify(args.zip_file, args.workers)
+
+    for error in report.errors:
+        print(error)
+    print(report.summary())
+    sys.exit(0 if report.ok else 1)